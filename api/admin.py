@@ -1,9 +1,18 @@
 # admin.py
-from django.contrib import admin
+import io
+
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.utils import timezone
 from django.utils.html import format_html
-from django.urls import reverse
+from django.urls import path, reverse
 from django.utils.safestring import mark_safe
-from .models import Perfil, Usuario, EtapaEscolar, Disciplina, StatusEnvio, EnvioMaterial
+from django.db.models import Count
+from . import analytics
+from .models import Perfil, Usuario, EtapaEscolar, Disciplina, StatusEnvio, EnvioMaterial, EmailOutbox
+from .user_import import detect_format, import_users
 
 
 @admin.register(Perfil)
@@ -16,15 +25,31 @@ class PerfilAdmin(admin.ModelAdmin):
     search_fields = ['nome_perfil']
     ordering = ['id']
     
+    def get_queryset(self, request):
+        # Conta os usuários na mesma consulta da listagem (evita N+1)
+        return super().get_queryset(request).annotate(_total_usuarios=Count('usuario'))
+    
     def total_usuarios(self, obj):
         """Display total users for this profile"""
-        count = obj.usuario_set.count()
+        count = obj._total_usuarios
         if count > 0:
-            url = reverse('admin:material_didatico_usuario_changelist') + f'?id__exact={obj.id}'
+            url = reverse('admin:api_usuario_changelist') + f'?id_perfil__id__exact={obj.id}'
             return format_html('<a href="{}">{} usuários</a>', url, count)
         return '0 usuários'
     
     total_usuarios.short_description = 'Total de Usuários'
+    total_usuarios.admin_order_field = '_total_usuarios'
+
+
+class ImportarUsuariosForm(forms.Form):
+    arquivo = forms.FileField(help_text="CSV ou JSONL com matricula, cpf, nome_usuario, perfil, telefone e senha.")
+    dry_run = forms.BooleanField(required=False, label="Só validar (não grava)")
+
+    def clean_arquivo(self):
+        arquivo = self.cleaned_data["arquivo"]
+        if detect_format(arquivo.name) is None:
+            raise forms.ValidationError("Envie um arquivo .csv ou .jsonl.")
+        return arquivo
 
 
 @admin.register(Usuario)
@@ -40,7 +65,8 @@ class UsuarioAdmin(admin.ModelAdmin):
     list_filter = ['id_perfil', 'id_perfil__nome_perfil']
     search_fields = ['nome_usuario', 'matricula', 'cpf', 'id_perfil__nome_perfil']
     ordering = ['nome_usuario']
-    readonly_fields = ['id']
+    readonly_fields = ['id', 'password']
+    list_select_related = ['id_perfil']
     
     fieldsets = (
         ('Informações Básicas', {
@@ -50,7 +76,7 @@ class UsuarioAdmin(admin.ModelAdmin):
             'fields': ('cpf', 'telefone')
         }),
         ('Acesso', {
-            'fields': ('senha',),
+            'fields': ('password',),
             'classes': ('collapse',)
         }),
     )
@@ -61,15 +87,54 @@ class UsuarioAdmin(admin.ModelAdmin):
     get_perfil_nome.short_description = 'Perfil'
     get_perfil_nome.admin_order_field = 'id_perfil__nome_perfil'
     
+    def get_queryset(self, request):
+        # Conta os envios na mesma consulta da listagem (evita N+1)
+        return super().get_queryset(request).annotate(_total_envios=Count('enviomaterial'))
+    
     def total_envios(self, obj):
         """Display total submissions for this user"""
-        count = obj.enviomaterial_set.count()
+        count = obj._total_envios
         if count > 0:
-            url = reverse('admin:material_didatico_enviomaterial_changelist') + f'?id__exact={obj.id}'
+            url = reverse('admin:api_enviomaterial_changelist') + f'?id_usuario__id__exact={obj.id}'
             return format_html('<a href="{}">{} envios</a>', url, count)
         return '0 envios'
     
     total_envios.short_description = 'Total de Envios'
+    total_envios.admin_order_field = '_total_envios'
+
+    def get_urls(self):
+        return [
+            path('importar/', self.admin_site.admin_view(self.importar_view), name='api_usuario_importar'),
+        ] + super().get_urls()
+
+    def importar_view(self, request):
+        """Importação em massa de usuários (ver api/user_import.py)"""
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = ImportarUsuariosForm(request.POST or None, request.FILES or None)
+        result = None
+        if request.method == 'POST' and form.is_valid():
+            arquivo = form.cleaned_data['arquivo']
+            stream = io.TextIOWrapper(arquivo.file, encoding='utf-8-sig', newline='')
+            try:
+                result = import_users(stream, detect_format(arquivo.name), dry_run=form.cleaned_data['dry_run'])
+            except UnicodeDecodeError:
+                form.add_error('arquivo', 'O arquivo precisa estar em UTF-8.')
+            finally:
+                stream.detach()
+            if result is not None:
+                level = messages.WARNING if result.erros else messages.SUCCESS
+                self.message_user(request, str(result), level)
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Importar usuários',
+            'form': form,
+            'result': result,
+            'erros': sorted(result.erros.items()) if result else [],
+        }
+        return TemplateResponse(request, 'admin/api/usuario/importar.html', context)
 
 
 @admin.register(EtapaEscolar)
@@ -82,15 +147,20 @@ class EtapaEscolarAdmin(admin.ModelAdmin):
     search_fields = ['nome_etapa']
     ordering = ['id']
     
+    def get_queryset(self, request):
+        # Conta os envios na mesma consulta da listagem (evita N+1)
+        return super().get_queryset(request).annotate(_total_envios=Count('enviomaterial'))
+    
     def total_envios(self, obj):
         """Display total submissions for this school stage"""
-        count = obj.enviomaterial_set.count()
+        count = obj._total_envios
         if count > 0:
-            url = reverse('admin:material_didatico_enviomaterial_changelist') + f'?id__exact={obj.id}'
+            url = reverse('admin:api_enviomaterial_changelist') + f'?id_etapa__id__exact={obj.id}'
             return format_html('<a href="{}">{} envios</a>', url, count)
         return '0 envios'
     
     total_envios.short_description = 'Total de Envios'
+    total_envios.admin_order_field = '_total_envios'
 
 
 @admin.register(Disciplina)
@@ -103,15 +173,20 @@ class DisciplinaAdmin(admin.ModelAdmin):
     search_fields = ['nome_disciplina']
     ordering = ['nome_disciplina']
     
+    def get_queryset(self, request):
+        # Conta os envios na mesma consulta da listagem (evita N+1)
+        return super().get_queryset(request).annotate(_total_envios=Count('enviomaterial'))
+    
     def total_envios(self, obj):
         """Display total submissions for this subject"""
-        count = obj.enviomaterial_set.count()
+        count = obj._total_envios
         if count > 0:
-            url = reverse('admin:material_didatico_enviomaterial_changelist') + f'?id__exact={obj.id}'
+            url = reverse('admin:api_enviomaterial_changelist') + f'?id_disciplina__id__exact={obj.id}'
             return format_html('<a href="{}">{} envios</a>', url, count)
         return '0 envios'
     
     total_envios.short_description = 'Total de Envios'
+    total_envios.admin_order_field = '_total_envios'
 
 
 @admin.register(StatusEnvio)
@@ -124,15 +199,20 @@ class StatusEnvioAdmin(admin.ModelAdmin):
     search_fields = ['descricao_status']
     ordering = ['id']
     
+    def get_queryset(self, request):
+        # Conta os envios na mesma consulta da listagem (evita N+1)
+        return super().get_queryset(request).annotate(_total_envios=Count('enviomaterial'))
+    
     def total_envios(self, obj):
         """Display total submissions with this status"""
-        count = obj.enviomaterial_set.count()
+        count = obj._total_envios
         if count > 0:
-            url = reverse('admin:material_didatico_enviomaterial_changelist') + f'?id__exact={obj.id}'
+            url = reverse('admin:api_enviomaterial_changelist') + f'?id_status__id__exact={obj.id}'
             return format_html('<a href="{}">{} envios</a>', url, count)
         return '0 envios'
     
     total_envios.short_description = 'Total de Envios'
+    total_envios.admin_order_field = '_total_envios'
     
     def status_color(self, obj):
         """Display status with color coding"""
@@ -174,6 +254,7 @@ class EnvioMaterialAdmin(admin.ModelAdmin):
     ]
     ordering = ['-ano_referencia', '-mes_referencia', '-id']
     readonly_fields = ['id', 'mes_referencia_display']
+    list_select_related = ['id_usuario', 'id_disciplina', 'id_etapa', 'id_status']
     
     fieldsets = (
         ('Informações Básicas', {
@@ -205,19 +286,19 @@ class EnvioMaterialAdmin(admin.ModelAdmin):
     
     def get_disciplina_nome(self, obj):
         """Display subject name"""
-        return obj.id.nome_disciplina if obj.id else '-'
+        return obj.id_disciplina.nome_disciplina if obj.id_disciplina else '-'
     get_disciplina_nome.short_description = 'Disciplina'
-    get_disciplina_nome.admin_order_field = 'id__nome_disciplina'
+    get_disciplina_nome.admin_order_field = 'id_disciplina__nome_disciplina'
     
     def get_etapa_nome(self, obj):
         """Display school stage name"""
-        return obj.id.nome_etapa if obj.id else '-'
+        return obj.id_etapa.nome_etapa if obj.id_etapa else '-'
     get_etapa_nome.short_description = 'Etapa'
-    get_etapa_nome.admin_order_field = 'id__nome_etapa'
+    get_etapa_nome.admin_order_field = 'id_etapa__nome_etapa'
     
     def get_status_display(self, obj):
         """Display status with color coding"""
-        if not obj.id:
+        if not obj.id_status:
             return '-'
         
         color_map = {
@@ -226,15 +307,15 @@ class EnvioMaterialAdmin(admin.ModelAdmin):
             3: '#dc3545',  # Rejected
             4: '#17a2b8',  # In Review
         }
-        color = color_map.get(obj.id.id, '#6c757d')
+        color = color_map.get(obj.id_status_id, '#6c757d')
         
         return format_html(
             '<span style="background-color: {}; color: white; padding: 2px 6px; border-radius: 3px; font-size: 11px;">{}</span>',
-            color, obj.id.descricao_status
+            color, obj.id_status.descricao_status
         )
     
     get_status_display.short_description = 'Status'
-    get_status_display.admin_order_field = 'id__descricao_status'
+    get_status_display.admin_order_field = 'id_status__descricao_status'
     
     def is_overdue(self, obj):
         """Check if submission is overdue"""
@@ -244,7 +325,7 @@ class EnvioMaterialAdmin(admin.ModelAdmin):
             return '-'
         
         today = timezone.now().date()
-        if obj.data_limite_envio < today and obj.id_status.id_status in [1, 4]:  # Pending or In Review
+        if obj.data_limite_envio < today and obj.id_status_id in [1, 4]:  # Pending or In Review
             return format_html(
                 '<span style="color: #dc3545; font-weight: bold;">⚠️ Atrasado</span>'
             )
@@ -266,13 +347,21 @@ class EnvioMaterialAdmin(admin.ModelAdmin):
     
     # Custom actions
     actions = ['mark_as_approved', 'mark_as_rejected', 'mark_as_pending']
+
+    def _update_status(self, queryset, status):
+        # QuerySet.update não dispara sinais: o cache analítico dos períodos
+        # afetados é descartado aqui
+        periodos = list(queryset.order_by().values_list('ano_referencia', 'mes_referencia').distinct())
+        updated = queryset.update(id_status=status)
+        analytics.invalidate(periodos)
+        return updated
     
     def mark_as_approved(self, request, queryset):
         """Mark selected submissions as approved"""
         # Assuming status ID 2 is "Approved"
         approved_status = StatusEnvio.objects.filter(id=2).first()
         if approved_status:
-            updated = queryset.update(id=approved_status)
+            updated = self._update_status(queryset, approved_status)
             self.message_user(request, f'{updated} envios marcados como aprovados.')
         else:
             self.message_user(request, 'Status "Aprovado" não encontrado.', level='ERROR')
@@ -284,7 +373,7 @@ class EnvioMaterialAdmin(admin.ModelAdmin):
         # Assuming status ID 3 is "Rejected"
         rejected_status = StatusEnvio.objects.filter(id=3).first()
         if rejected_status:
-            updated = queryset.update(id=rejected_status)
+            updated = self._update_status(queryset, rejected_status)
             self.message_user(request, f'{updated} envios marcados como rejeitados.')
         else:
             self.message_user(request, 'Status "Rejeitado" não encontrado.', level='ERROR')
@@ -296,7 +385,7 @@ class EnvioMaterialAdmin(admin.ModelAdmin):
         # Assuming status ID 1 is "Pending"
         pending_status = StatusEnvio.objects.filter(id=1).first()
         if pending_status:
-            updated = queryset.update(id=pending_status)
+            updated = self._update_status(queryset, pending_status)
             self.message_user(request, f'{updated} envios marcados como pendentes.')
         else:
             self.message_user(request, 'Status "Pendente" não encontrado.', level='ERROR')
@@ -304,7 +393,30 @@ class EnvioMaterialAdmin(admin.ModelAdmin):
     mark_as_pending.short_description = 'Marcar como pendente'
 
 
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    """
+    Acompanhamento da fila de e-mails (enviada pelo comando send_outbox)
+    """
+    list_display = ['id', 'destinatario', 'assunto', 'status', 'tentativas', 'proxima_tentativa_em', 'enviado_em']
+    list_filter = ['status']
+    search_fields = ['destinatario', 'assunto']
+    ordering = ['-id']
+    readonly_fields = ['anexo', 'anexo_nome', 'anexo_tipo', 'tentativas', 'ultimo_erro', 'criado_em', 'enviado_em']
+    actions = ['reenfileirar']
+
+    def reenfileirar(self, request, queryset):
+        """Volta mensagens com falha para a fila, com as tentativas zeradas"""
+        total = queryset.exclude(status=EmailOutbox.ENVIADO).update(
+            status=EmailOutbox.PENDENTE, tentativas=0, proxima_tentativa_em=timezone.now(),
+        )
+        self.message_user(request, f'{total} mensagens reenfileiradas.')
+
+    reenfileirar.short_description = 'Reenfileirar mensagens selecionadas'
+
+
 # Customize admin site headers
 admin.site.site_header = "Sistema de Material Didático"
 admin.site.site_title = "Material Didático Admin"
-admin.site.index_title = "Painel de Administração"
\ No newline at end of file
+admin.site.index_title = "Painel de Administração"
+
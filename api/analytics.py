@@ -0,0 +1,306 @@
+# analytics.py
+"""
+Contagens de envios por combinação de dimensões, em uma única consulta.
+
+`contagens` agrupa os envios filtrados por `GROUPING SETS` (ou `CUBE`, todos
+os subtotais das dimensões pedidas): o PostgreSQL calcula todos os subtotais
+em uma passada, em vez de um GROUP BY por combinação. `GROUPING()` indica, em
+cada linha, quais dimensões foram agregadas, o que distingue um subtotal de um
+valor nulo.
+
+`serie_temporal` conta os envios por dia, semana ou mês de uma das datas do
+ciclo de vida: `date_trunc` agrupa e `generate_series` cria os períodos sem
+envio, que saem com zero. Os índices parciais `envio_serie_*` (data, status)
+atendem o intervalo pelo índice, sem percorrer a tabela.
+
+`tempos_de_ciclo` calcula os percentis dos dias entre as datas do ciclo (envio
+da escola, validação, envio à SEE e ao formador) com `percentile_cont`, no
+banco, nos mesmos GROUPING SETS das contagens.
+
+Os resultados ficam no cache ANALYTICS_CACHE por ANALYTICS_CACHE_SECONDS, com
+a chave derivada dos parâmetros da requisição (a "assinatura" do filtro) e de
+uma versão que muda a cada envio salvo ou removido (api/signals.py). As versões
+ficam na tabela Analytics_versao, incrementadas com `versao = versao + 1` (o
+add/incr do cache em arquivo não é atômico entre workers), e só depois do
+commit: antes dele, outra requisição recalcularia com os dados antigos. Consultas
+de um período de referência usam a versão de cada mês do período: um envio de
+outro mês não as descarta, e os meses encerrados ficam em cache por
+ANALYTICS_CLOSED_CACHE_SECONDS.
+Alterações em massa (QuerySet.update, bulk_create) não disparam sinais e
+aparecem quando a entrada expira.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import F
+
+from .models import AnalyticsVersao, StatusEnvio
+
+
+# Dimensão: (coluna agrupada, nome exibido ou None)
+DIMENSOES = {
+    "ano": ("ano_referencia", None),
+    "mes": ("mes_referencia", None),
+    "etapa": ("id_etapa_id", "id_etapa__nome_etapa"),
+    "disciplina": ("id_disciplina_id", "id_disciplina__nome_disciplina"),
+    "status": ("id_status_id", "id_status__descricao_status"),
+    "usuario": ("id_usuario_id", "id_usuario__nome_usuario"),
+}
+
+# Datas aceitas pela série temporal e unidades do date_trunc
+CAMPOS_SERIE = ("data_envio_escola", "data_validacao_gerencia", "data_envio_see")
+PERIODOS = {"dia": "day", "semana": "week", "mes": "month"}
+MAX_PONTOS = 3660
+
+# Trechos do ciclo de vida do envio: (data inicial, data final)
+TRECHOS = {
+    "validacao": ("data_envio_escola", "data_validacao_gerencia"),
+    "see": ("data_validacao_gerencia", "data_envio_see"),
+    "formador": ("data_validacao_gerencia", "data_envio_formador"),
+}
+PERCENTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99}
+
+VERSION_KEY = "analytics:versao"
+
+BUMP_VERSIONS_SQL = """
+INSERT INTO "Analytics_versao" AS atual (chave, versao)
+SELECT chave, 1 FROM unnest(%s::text[]) AS chave
+ON CONFLICT (chave) DO UPDATE SET versao = atual.versao + 1
+"""
+
+
+def parse_dimensoes(valor):
+    """
+    "ano,etapa" -> ["ano", "etapa"]. ValueError para dimensão desconhecida ou repetida.
+    """
+    dimensoes = [item.strip() for item in valor.split(",") if item.strip()]
+    desconhecidas = [item for item in dimensoes if item not in DIMENSOES]
+    if desconhecidas:
+        raise ValueError(
+            f"Dimensões inválidas: {', '.join(desconhecidas)}. Use: {', '.join(DIMENSOES)}."
+        )
+    if len(set(dimensoes)) != len(dimensoes):
+        raise ValueError("Dimensão repetida.")
+    return dimensoes
+
+
+def _agrupar(queryset, dimensoes, conjuntos, extras, agregados):
+    """
+    Agrupa `queryset` pelas `dimensoes` com GROUPING SETS (ou CUBE, sem
+    `conjuntos`). `extras` são colunas adicionais da subconsulta, usadas nas
+    expressões SQL de `agregados`. Retorna [(agrupadas, valores, agregados)].
+    """
+    connection = connections[queryset.db]
+    qn = connection.ops.quote_name
+
+    colunas = {}
+    for dimensao in dimensoes:
+        chave, nome = DIMENSOES[dimensao]
+        colunas[dimensao] = F(chave)
+        if nome:
+            colunas[f"{dimensao}_nome"] = F(nome)
+    sql, params = queryset.order_by().values(**colunas, **extras).query.sql_with_params()
+
+    def unidade(dimensao):
+        # id e nome juntos: agrupa pelo id, o nome acompanha
+        if DIMENSOES[dimensao][1]:
+            return f"({qn(dimensao)}, {qn(dimensao + '_nome')})"
+        return qn(dimensao)
+
+    if conjuntos is None:
+        agrupamento = f"CUBE ({', '.join(unidade(d) for d in dimensoes)})"
+    else:
+        agrupamento = "GROUPING SETS ({})".format(", ".join(
+            "({})".format(", ".join(unidade(d) for d in conjunto)) for conjunto in conjuntos
+        ))
+    selecionadas = ", ".join(qn(coluna) for coluna in colunas)
+    grouping = ", ".join(qn(d) for d in dimensoes)
+    sql = (
+        f"SELECT {selecionadas}, GROUPING({grouping}) AS grupo, {', '.join(agregados)} "
+        f"FROM ({sql}) AS envios GROUP BY {agrupamento} "
+        f"ORDER BY grupo DESC, {selecionadas}"
+    )
+
+    resultados = []
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for linha in cursor.fetchall():
+            valores = dict(zip(colunas, linha))
+            grupo = linha[len(colunas)]
+            # Bit 1 em GROUPING(): dimensão agregada nesta linha (a primeira é o bit mais alto)
+            agrupadas = [
+                d for i, d in enumerate(dimensoes) if not grupo >> (len(dimensoes) - 1 - i) & 1
+            ]
+            resultado = {}
+            for dimensao in agrupadas:
+                if DIMENSOES[dimensao][1]:
+                    resultado[dimensao] = valores[f"{dimensao}_nome"]
+                    resultado[f"{dimensao}_id"] = valores[dimensao]
+                else:
+                    resultado[dimensao] = valores[dimensao]
+            resultados.append((agrupadas, resultado, linha[len(colunas) + 1:]))
+    return resultados
+
+
+def contagens(queryset, dimensoes, conjuntos=None):
+    """
+    Total de envios de `queryset` em cada subtotal das `dimensoes`: todas as
+    combinações (CUBE) ou só os `conjuntos` informados (listas de dimensões;
+    uma lista vazia é o total geral). Retorna
+    [{"agrupamento": [...], "valores": {...}, "total": n}].
+    """
+    return [
+        {"agrupamento": agrupadas, "valores": valores, "total": total}
+        for agrupadas, valores, (total,) in _agrupar(queryset, dimensoes, conjuntos, {}, ["COUNT(*)"])
+    ]
+
+
+def tempos_de_ciclo(queryset, dimensoes):
+    """
+    Percentis (PERCENTILES) dos dias de cada trecho de TRECHOS, calculados no
+    banco com percentile_cont, no total e em cada uma das `dimensoes` ("mes"
+    agrupa por ano e mês). Retorna [{"agrupamento": [...], "valores": {...},
+    "trechos": {trecho: {"envios": n, "p50": dias, ...}}}]; sem envios no
+    trecho, os percentis são None.
+    """
+    qn = connections[queryset.db].ops.quote_name
+    extras = {}
+    agregados = []
+    fracoes = ", ".join(str(fracao) for fracao in PERCENTILES.values())
+    for trecho, (inicio, fim) in TRECHOS.items():
+        extras[f"{trecho}_inicio"], extras[f"{trecho}_fim"] = F(inicio), F(fim)
+        # date - date: dias, inteiro; NULL se faltar uma das datas (ignorado pelos agregados)
+        dias = f"({qn(trecho + '_fim')} - {qn(trecho + '_inicio')})"
+        agregados += [
+            f"COUNT({dias})",
+            f"percentile_cont(ARRAY[{fracoes}]) WITHIN GROUP (ORDER BY {dias})",
+        ]
+
+    conjuntos = [[]] + [["ano", "mes"] if d == "mes" else [d] for d in dimensoes]
+    todas = list(dict.fromkeys(d for conjunto in conjuntos for d in conjunto))
+    resultados = []
+    for agrupadas, valores, linha in _agrupar(queryset, todas, conjuntos, extras, agregados):
+        trechos = {}
+        for i, trecho in enumerate(TRECHOS):
+            envios, percentis = linha[2 * i], linha[2 * i + 1] or [None] * len(PERCENTILES)
+            trechos[trecho] = {"envios": envios}
+            for nome, valor in zip(PERCENTILES, percentis):
+                trechos[trecho][nome] = None if valor is None else round(valor, 2)
+        resultados.append({"agrupamento": agrupadas, "valores": valores, "trechos": trechos})
+    return resultados
+
+
+def serie_temporal(queryset, campo, periodo, inicio, fim, por_status=False):
+    """
+    Envios de `queryset` por `periodo` ("dia", "semana" ou "mes") de `campo`,
+    de `inicio` a `fim` (datas, inclusive), com zero nos períodos sem envio.
+    Retorna [{"periodo": date, "total": n}]; com `por_status`, cada ponto traz
+    também `por_status` ({descrição: n}, todos os status). ValueError para
+    campo ou período inválido e intervalo vazio ou com mais de MAX_PONTOS pontos.
+    """
+    if campo not in CAMPOS_SERIE:
+        raise ValueError(f"Campo inválido: {campo}. Use: {', '.join(CAMPOS_SERIE)}.")
+    if periodo not in PERIODOS:
+        raise ValueError(f"Período inválido: {periodo}. Use: {', '.join(PERIODOS)}.")
+    if inicio > fim:
+        raise ValueError("`inicio` deve ser anterior ou igual a `fim`.")
+    dias = (fim - inicio).days + 1
+    pontos = {"dia": dias, "semana": dias // 7 + 1, "mes": (fim.year - inicio.year) * 12 + fim.month - inicio.month + 1}
+    if pontos[periodo] > MAX_PONTOS:
+        raise ValueError(f"Intervalo longo demais: no máximo {MAX_PONTOS} pontos.")
+
+    connection = connections[queryset.db]
+    qn = connection.ops.quote_name
+    unidade = PERIODOS[periodo]
+
+    envios = queryset.order_by().filter(**{f"{campo}__gte": inicio, f"{campo}__lte": fim})
+    sql, params = envios.values(data=F(campo), status=F("id_status_id")).query.sql_with_params()
+    periodos = (
+        "generate_series(date_trunc(%s, %s::timestamp), date_trunc(%s, %s::timestamp), "
+        "('1 ' || %s)::interval) AS periodos(periodo)"
+    )
+    periodos_params = [unidade, inicio, unidade, fim, unidade]
+
+    if por_status:
+        status_sql, status_params = StatusEnvio.objects.order_by().values(
+            "id", "descricao_status",
+        ).query.sql_with_params()
+        sql = (
+            f"SELECT periodos.periodo::date, st.{qn('descricao_status')}, COALESCE(c.total, 0) "
+            f"FROM {periodos} CROSS JOIN ({status_sql}) AS st "
+            f"LEFT JOIN (SELECT date_trunc(%s, e.data::timestamp) AS periodo, e.status, COUNT(*) AS total "
+            f"FROM ({sql}) AS e GROUP BY 1, 2) AS c "
+            f"ON c.periodo = periodos.periodo AND c.status = st.{qn('id')} "
+            f"ORDER BY 1, st.{qn('id')}"
+        )
+        params = [*periodos_params, *status_params, unidade, *params]
+    else:
+        sql = (
+            f"SELECT periodos.periodo::date, COALESCE(c.total, 0) FROM {periodos} "
+            f"LEFT JOIN (SELECT date_trunc(%s, e.data::timestamp) AS periodo, COUNT(*) AS total "
+            f"FROM ({sql}) AS e GROUP BY 1) AS c ON c.periodo = periodos.periodo "
+            f"ORDER BY 1"
+        )
+        params = [*periodos_params, unidade, *params]
+
+    pontos = {}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for linha in cursor.fetchall():
+            ponto = pontos.setdefault(linha[0], {"periodo": linha[0], "total": 0})
+            ponto["total"] += linha[-1]
+            if por_status:
+                ponto.setdefault("por_status", {})[linha[1]] = linha[2]
+    return list(pontos.values())
+
+
+def _cache():
+    return caches[settings.ANALYTICS_CACHE]
+
+
+def _versao_periodo(ano, mes):
+    return f"{VERSION_KEY}:{ano}-{mes:02d}"
+
+
+def cache_key(nome, assinatura, periodos=None):
+    """
+    Chave de `nome` para os parâmetros `assinatura` na versão atual dos dados:
+    a versão geral ou, com `periodos` ([(ano, mes)]), a de cada período.
+    """
+    chaves = [VERSION_KEY] if periodos is None else [_versao_periodo(ano, mes) for ano, mes in periodos]
+    versoes = dict(AnalyticsVersao.objects.filter(chave__in=chaves).values_list("chave", "versao"))
+    versao = ".".join(str(versoes.get(chave, 0)) for chave in chaves)
+    digest = hashlib.sha256(json.dumps(assinatura, sort_keys=True, default=str).encode()).hexdigest()
+    return f"analytics:{nome}:{versao}:{digest}"
+
+
+def cached(nome, assinatura, calcular, timeout=None, periodos=None):
+    """
+    Resultado de `calcular()` no cache, por `nome` e `assinatura`. Com
+    `periodos`, a entrada só é descartada quando muda um envio desses períodos.
+    """
+    chave = cache_key(nome, assinatura, periodos)
+    resultado = _cache().get(chave)
+    if resultado is None:
+        resultado = calcular()
+        _cache().set(chave, resultado, settings.ANALYTICS_CACHE_SECONDS if timeout is None else timeout)
+    return resultado
+
+
+def _bump(chaves):
+    # Chaves em ordem: dois workers travam as linhas na mesma sequência
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute(BUMP_VERSIONS_SQL, [chaves])
+
+
+def invalidate(periodos=()):
+    """
+    Muda a versão dos dados depois do commit da transação atual: as entradas
+    anteriores deixam de ser usadas e expiram. `periodos` ([(ano, mes)]) muda
+    também a versão desses períodos.
+    """
+    chaves = sorted({VERSION_KEY, *(_versao_periodo(ano, mes) for ano, mes in periodos)})
+    transaction.on_commit(lambda: _bump(chaves), using=DEFAULT_DB_ALIAS)
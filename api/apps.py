@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import schema, signals  # noqa: F401
+        from .instrumentation import install_query_observer
+
+        connection_created.connect(install_query_observer, dispatch_uid="api.install_query_observer")
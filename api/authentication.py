@@ -0,0 +1,68 @@
+# authentication.py
+"""
+Autenticação JWT com o usuário (e o perfil) em cache.
+
+O usuário autenticado fica no cache AUTH_USER_CACHE por AUTH_USER_CACHE_SECONDS,
+sem o hash da senha. Salvar ou remover um Usuario ou Perfil invalida as entradas
+afetadas (api/signals.py); alterações que não disparam sinais (QuerySet.update)
+passam a valer quando a entrada expira, então um usuário desativado é recusado
+no máximo AUTH_USER_CACHE_SECONDS depois.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import Usuario
+
+
+def user_cache_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def _user_cache():
+    return caches[settings.AUTH_USER_CACHE]
+
+
+def get_cached_user(user_id):
+    """
+    Usuário com o perfil carregado, do cache ou do banco (e então guardado no cache).
+    Retorna None se o usuário não existir.
+    """
+    cache = _user_cache()
+    user = cache.get(user_cache_key(user_id))
+    if user is None:
+        user = Usuario.objects.select_related("id_perfil").defer("password").filter(pk=user_id).first()
+        if user is None:
+            return None
+        cache.set(user_cache_key(user_id), user, settings.AUTH_USER_CACHE_SECONDS)
+    return user
+
+
+def invalidate_users(user_ids):
+    _user_cache().delete_many([user_cache_key(user_id) for user_id in user_ids])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication que busca o usuário no cache antes do banco.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # A verificação compara o hash da senha, que não fica no cache
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken("Token sem identificação de usuário") from e
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed("Usuário não encontrado", code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed("Usuário inativo", code="user_inactive")
+        return user
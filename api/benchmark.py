@@ -0,0 +1,449 @@
+# benchmark.py
+"""
+Ferramentas de benchmark dos endpoints da API.
+
+Usado pelo comando `python manage.py benchmark`: popula um conjunto de dados
+sintético em escala configurável e mede latência, número de consultas SQL e
+tempo de SQL de cada endpoint crítico. A suíte `connections` mede o custo de
+obter uma conexão por requisição em cada modo de conexão, sob concorrência, e
+a suíte `renderers` compara os formatos de serialização em listas grandes.
+"""
+import io
+import random
+import threading
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .instrumentation import QueryObserver
+from .models import Perfil, Usuario, EtapaEscolar, Disciplina, StatusEnvio, EnvioMaterial, ThrottleBucket
+from .parsers import FastJSONParser, MessagePackParser
+from .renderers import FastJSONRenderer, MessagePackRenderer, msgpack, orjson
+from .serializers import EnvioMaterialSerializer
+
+
+STATUS_NOMES = ["Pendente", "Enviado", "Validado", "Rejeitado"]
+ETAPA_NOMES = ["Educação Infantil", "Ensino Fundamental I", "Ensino Fundamental II", "Ensino Médio"]
+DISCIPLINA_NOMES = ["Matemática", "Português", "História", "Geografia", "Biologia"]
+
+# Quantidade de linhas criadas por unidade de escala
+PROFESSORES_POR_ESCALA = 20
+ENVIOS_POR_ESCALA = 500
+
+
+def seed_dataset(scale=1, seed=42, ano=None):
+    """
+    Cria um conjunto de dados sintético proporcional a `scale`.
+
+    Retorna um dicionário com o usuário usado nas requisições autenticadas,
+    o ano de referência, os ids dos status (por descrição) e os ids dos envios criados.
+    """
+    rng = random.Random(seed)
+    ano = ano or date.today().year
+    senha = make_password("senha123")
+
+    perfis = {
+        nome: Perfil.objects.get_or_create(nome_perfil=nome)[0]
+        for nome in ["Administrador", "Professor", "Coordenador"]
+    }
+    status = [StatusEnvio.objects.get_or_create(descricao_status=nome)[0] for nome in STATUS_NOMES]
+    etapas = [EtapaEscolar.objects.get_or_create(nome_etapa=nome)[0] for nome in ETAPA_NOMES]
+    disciplinas = [Disciplina.objects.get_or_create(nome_disciplina=nome)[0] for nome in DISCIPLINA_NOMES]
+
+    coordenador = Usuario.objects.create(
+        id_perfil=perfis["Coordenador"],
+        nome_usuario="Coordenador Benchmark",
+        matricula="BENCH-COORD",
+        cpf="000.000.000-00",
+        password=senha,
+        is_staff=True,
+    )
+    professores = Usuario.objects.bulk_create([
+        Usuario(
+            id_perfil=perfis["Professor"],
+            nome_usuario=f"Professor {i:05d}",
+            matricula=f"BENCH-{i:05d}",
+            cpf=f"{i // 1000000 % 1000:03d}.{i // 1000 % 1000:03d}.{i % 1000:03d}-{i % 97:02d}",
+            password=senha,
+        )
+        for i in range(1, PROFESSORES_POR_ESCALA * scale + 1)
+    ])
+    usuarios = professores + [coordenador]
+
+    hoje = date.today()
+    envios = []
+    chaves = set()
+    while len(envios) < ENVIOS_POR_ESCALA * scale:
+        mes = rng.randint(1, 12)
+        etapa, disciplina, usuario = rng.choice(etapas), rng.choice(disciplinas), rng.choice(usuarios)
+        # Um envio por professor, disciplina, etapa e mês (envio_chave_natural)
+        chave = (mes, etapa.pk, disciplina.pk, usuario.pk)
+        if chave in chaves:
+            continue
+        chaves.add(chave)
+        limite = date(ano, mes, 15)
+        envio_escola = limite - timedelta(days=rng.randint(-5, 10))
+        envios.append(EnvioMaterial(
+            id_etapa=etapa,
+            id_disciplina=disciplina,
+            id_usuario=usuario,
+            id_status=rng.choice(status),
+            mes_referencia=mes,
+            ano_referencia=ano,
+            observacoes_gerencia=rng.choice(["", "Material revisado", "Envio automático de benchmark"]),
+            data_envio_escola=envio_escola if envio_escola <= hoje else None,
+            data_limite_envio=limite,
+        ))
+    envios = EnvioMaterial.objects.bulk_create(envios, batch_size=2000)
+
+    return {
+        "usuario": coordenador,
+        "ano": ano,
+        "status": {item.descricao_status: item.pk for item in status},
+        "envio_ids": [envio.id for envio in envios],
+        "usuarios": len(usuarios),
+        "envios": len(envios),
+    }
+
+
+def build_scenarios(dataset):
+    """
+    Lista de cenários medidos: (nome, método, url, corpo ou função que gera o corpo).
+    """
+    ano = dataset["ano"]
+    envio_ids = dataset["envio_ids"]
+    # Os ids dependem do banco (sequências): os status vêm dos dados criados
+    pendente, enviado = dataset["status"]["Pendente"], dataset["status"]["Enviado"]
+
+    def envio_url(acao):
+        ciclo = iter(envio_ids * 2)
+        return lambda: f"/api/envios-material/{next(ciclo)}/{acao}/"
+
+    return [
+        ("envios_list", "get", "/api/envios-material/", None),
+        ("envios_filter", "get", f"/api/envios-material/?ano_referencia={ano}&mes_referencia=3&id_status={pendente}", None),
+        ("envios_search", "get", "/api/envios-material/?search=Matem", None),
+        ("envios_stats", "get", f"/api/envios-material/stats/?mes=3&ano={ano}", None),
+        ("envios_overdue", "get", "/api/envios-material/overdue/", None),
+        ("envios_pending", "get", "/api/envios-material/pending/", None),
+        ("envios_conformidade", "get", f"/api/envios-material/conformidade/?ano={ano}", None),
+        ("dashboard_me", "get", "/api/dashboard-envios/me/", None),
+        ("dashboard_me_resumido", "get", "/api/dashboard-envios/me/?resumido=true", None),
+        ("dashboard_geral", "get", "/api/dashboard-envios/geral/", None),
+        ("dashboard_geral_resumido", "get", "/api/dashboard-envios/geral/?resumido=true", None),
+        ("envio_validar", "post", envio_url("validar"), {"validado": True, "observacoes_gerencia": "Benchmark"}),
+        ("envio_mudar_status", "post", envio_url("mudar_status"), {
+            "status_id": enviado, "observacoes_gerencia": "Benchmark",
+        }),
+    ]
+
+
+def percentile(values, p):
+    """
+    Percentil `p` (0-100) com interpolação linear entre os pontos vizinhos.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    f = int(k)
+    c = min(f + 1, len(ordered) - 1)
+    return ordered[f] + (ordered[c] - ordered[f]) * (k - f)
+
+
+def summarize(values):
+    if not values:
+        return {}
+    return {
+        "min": round(min(values), 3),
+        "media": round(sum(values) / len(values), 3),
+        "p50": round(percentile(values, 50), 3),
+        "p90": round(percentile(values, 90), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(max(values), 3),
+    }
+
+
+class ConsultasMedidas(QueryObserver):
+    """
+    Conta as consultas de uma requisição e soma o tempo de cada uma (perf_counter).
+    """
+
+    def __init__(self):
+        self.consultas = 0
+        self.segundos = 0.0
+        self._lock = threading.Lock()
+
+    def record_query(self, seconds):
+        # As partes do dashboard registram de várias threads ao mesmo tempo
+        with self._lock:
+            self.consultas += 1
+            self.segundos += seconds
+
+
+def measure(client, method, url, data=None, iterations=20, warmup=2):
+    """
+    Executa a requisição `warmup + iterations` vezes e retorna as estatísticas
+    das iterações medidas. `url` pode ser uma string ou uma função sem argumentos.
+    """
+    latencias, consultas, tempos_sql, status_codes = [], [], [], {}
+    request = getattr(client, method)
+
+    for i in range(warmup + iterations):
+        path = url() if callable(url) else url
+        # Observador das conexões (api/instrumentation.py): tempo com perf_counter, e as
+        # consultas feitas em outras threads (partes do dashboard) também entram
+        observador = ConsultasMedidas()
+        observador.start()
+        try:
+            inicio = time.perf_counter()
+            response = request(path, data, format="json") if data is not None else request(path)
+            duracao = (time.perf_counter() - inicio) * 1000
+        finally:
+            observador.stop()
+        if i < warmup:
+            continue
+        latencias.append(duracao)
+        consultas.append(observador.consultas)
+        tempos_sql.append(observador.segundos * 1000)
+        status_codes[str(response.status_code)] = status_codes.get(str(response.status_code), 0) + 1
+
+    return {
+        "iteracoes": iterations,
+        "status": status_codes,
+        "latencia_ms": summarize(latencias),
+        "consultas": summarize(consultas),
+        "tempo_sql_ms": summarize(tempos_sql),
+    }
+
+
+def authenticated_client(usuario):
+    client = APIClient()
+    token = RefreshToken.for_user(usuario).access_token
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+    return client
+
+
+def run_endpoint_suite(dataset, iterations=20, warmup=2, only=None):
+    """
+    Mede todos os cenários de `build_scenarios` e retorna a lista de resultados.
+    """
+    client = authenticated_client(dataset["usuario"])
+    resultados = []
+    for nome, method, url, data in build_scenarios(dataset):
+        if only and nome not in only:
+            continue
+        # Zera caches e baldes do throttle para que um cenário não afete o outro
+        # (o cache compartilhado em arquivo também guarda usuários de execuções anteriores)
+        for backend in caches.all():
+            backend.clear()
+        ThrottleBucket.objects.all().delete()
+        resultado = measure(client, method, url, data, iterations=iterations, warmup=warmup)
+        resultado.update({
+            "nome": nome,
+            "metodo": method.upper(),
+            "url": url if isinstance(url, str) else None,
+        })
+        resultados.append(resultado)
+    return resultados
+
+
+def compare(anterior, atual):
+    """
+    Compara dois relatórios (dicionários carregados do JSON) e retorna as
+    diferenças de p50/p99 de latência e de número médio de consultas por cenário.
+    """
+    anteriores = {r["nome"]: r for r in anterior.get("resultados", [])}
+    diferencas = []
+    for resultado in atual.get("resultados", []):
+        base = anteriores.get(resultado["nome"])
+        if not base:
+            continue
+        diferencas.append({
+            "nome": resultado["nome"],
+            "p50_ms": (base["latencia_ms"].get("p50"), resultado["latencia_ms"].get("p50")),
+            "p99_ms": (base["latencia_ms"].get("p99"), resultado["latencia_ms"].get("p99")),
+            "consultas": (base["consultas"].get("media"), resultado["consultas"].get("media")),
+        })
+    return diferencas
+
+
+def connection_modes(pool_size):
+    """
+    Modos de conexão comparados pela suíte `connections`. O modo `pool` só existe
+    com o driver psycopg 3 e o pacote psycopg_pool instalados.
+    """
+    modes = {
+        "sem_reuso": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False, "OPTIONS": {}},
+        "persistente": {"CONN_MAX_AGE": 60, "CONN_HEALTH_CHECKS": True, "OPTIONS": {}},
+    }
+    try:
+        import psycopg_pool  # noqa: F401
+        from django.db.backends.postgresql.psycopg_any import is_psycopg3
+    except ImportError:
+        return modes
+    if is_psycopg3:
+        modes["pool"] = {
+            "CONN_MAX_AGE": 0,
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {"pool": {"min_size": pool_size, "max_size": pool_size}},
+        }
+    return modes
+
+
+def _simulated_requests(iterations, warmup, latencias, start_barrier):
+    """
+    Ciclo de vida de uma requisição sem HTTP: request_started, uma consulta
+    e request_finished (que fecha ou devolve a conexão, conforme o modo).
+    """
+    start_barrier.wait()
+    for i in range(warmup + iterations):
+        inicio = time.perf_counter()
+        request_started.send(sender=None)
+        StatusEnvio.objects.exists()
+        request_finished.send(sender=None)
+        if i >= warmup:
+            latencias.append((time.perf_counter() - inicio) * 1000)
+    connections.close_all()
+
+
+def run_connection_suite(iterations=200, warmup=5, concurrency=8, only=None):
+    """
+    Mede, para cada modo de conexão, a latência de `concurrency` threads fazendo
+    `iterations` requisições simuladas cada, a vazão total e as conexões abertas.
+    """
+    settings_dict = connections.settings["default"]
+    original = {key: settings_dict.get(key) for key in ("CONN_MAX_AGE", "CONN_HEALTH_CHECKS", "OPTIONS")}
+    abertas = []
+
+    def contar_conexao(sender, connection, **kwargs):
+        abertas.append(connection.alias)
+
+    connections.close_all()
+    connection_created.connect(contar_conexao)
+    resultados = []
+    try:
+        for nome, modo in connection_modes(concurrency).items():
+            if only and nome not in only:
+                continue
+            # Threads novas criam a conexão a partir deste dicionário
+            settings_dict.update(modo)
+            abertas.clear()
+            latencias = []
+            barrier = threading.Barrier(concurrency + 1)
+            threads = [
+                threading.Thread(target=_simulated_requests, args=(iterations, warmup, latencias, barrier))
+                for _ in range(concurrency)
+            ]
+            for thread in threads:
+                thread.start()
+            barrier.wait()
+            inicio = time.perf_counter()
+            for thread in threads:
+                thread.join()
+            duracao = time.perf_counter() - inicio
+
+            conexoes = len(abertas)
+            if modo["OPTIONS"].get("pool"):
+                # No pool, connection_created dispara a cada empréstimo; conta as físicas
+                conexoes = connections["default"].pool.get_stats().get("connections_num", 0)
+                connections["default"].close_pool()
+
+            total = concurrency * iterations
+            resultados.append({
+                "nome": f"conexoes_{nome}",
+                "metodo": None,
+                "url": None,
+                "iteracoes": total,
+                "concorrencia": concurrency,
+                "status": {},
+                "latencia_ms": summarize(latencias),
+                "consultas": summarize([1] * total),
+                "tempo_sql_ms": {},
+                "vazao_rps": round(total / duracao, 1),
+                "conexoes_abertas": conexoes,
+            })
+    finally:
+        connection_created.disconnect(contar_conexao)
+        settings_dict.update(original)
+        connections.close_all()
+    return resultados
+
+
+def render_payloads(rows, native_dates=False):
+    """
+    Cargas com `rows` envios, repetindo os do banco de teste: a saída do
+    EnvioMaterialSerializer (como na listagem; com `native_dates`, como nas
+    respostas MessagePack) e as linhas de `values()`, com date/datetime ainda
+    como objetos.
+    """
+    queryset = EnvioMaterial.objects.select_related("id_etapa", "id_disciplina", "id_usuario", "id_status")
+    context = {"native_dates": native_dates}
+    serializados = list(EnvioMaterialSerializer(queryset, many=True, context=context).data)
+    valores = list(EnvioMaterial.objects.values())
+
+    def repetir(linhas):
+        return [{**linhas[i % len(linhas)], "id": i + 1} for i in range(rows)]
+
+    return {"serializados": repetir(serializados), "valores": repetir(valores)}
+
+
+def serialization_formats():
+    """
+    Formatos comparados pela suíte `renderers`: (nome, renderer, parser, media
+    type, datas como objetos no serializer).
+    """
+    formatos = [("json", JSONRenderer(), JSONParser(), "application/json", False)]
+    if orjson is not None:
+        formatos.append(("orjson", FastJSONRenderer(), FastJSONParser(), "application/json", False))
+    if msgpack is not None:
+        formatos.append(("msgpack", MessagePackRenderer(), MessagePackParser(), "application/msgpack", True))
+    return formatos
+
+
+def run_render_suite(rows=10000, iterations=20, warmup=2, only=None):
+    """
+    Mede, para cada carga e formato, o tempo para codificar e decodificar
+    `rows` envios e o tamanho do corpo gerado.
+    """
+    resultados = []
+    cargas = {native: render_payloads(rows, native) for native in (False, True)}
+    for carga in cargas[False]:
+        for nome, renderer, parser, media_type, native_dates in serialization_formats():
+            if only and nome not in only:
+                continue
+            data = cargas[native_dates][carga]
+            codificar, decodificar = [], []
+            for i in range(warmup + iterations):
+                inicio = time.perf_counter()
+                corpo = renderer.render(data, media_type, {})
+                meio = time.perf_counter()
+                parser.parse(io.BytesIO(corpo), media_type, {})
+                fim = time.perf_counter()
+                if i >= warmup:
+                    codificar.append((meio - inicio) * 1000)
+                    decodificar.append((fim - meio) * 1000)
+            resultados.append({
+                "nome": f"{carga}_{nome}",
+                "metodo": None,
+                "url": None,
+                "iteracoes": iterations,
+                "linhas": rows,
+                "status": {},
+                "latencia_ms": summarize(codificar),
+                "decodificacao_ms": summarize(decodificar),
+                "consultas": {},
+                "tempo_sql_ms": {},
+                "bytes": len(corpo),
+            })
+    return resultados
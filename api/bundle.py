@@ -0,0 +1,133 @@
+# bundle.py
+"""
+Pacote ZIP com os materiais de um período, gerado enquanto é enviado.
+
+O ZipFile escreve em um buffer que não permite seek: cada entrada sai com
+"data descriptor" (CRC e tamanhos depois dos dados) e o buffer é esvaziado a
+cada bloco, então nem o arquivo ZIP nem um arquivo temporário existem inteiros
+em lugar nenhum. Formatos já comprimidos entram sem compressão (ZIP_STORED).
+"""
+import json
+import zipfile
+from pathlib import PurePosixPath
+
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .storage import CHUNK_SIZE, get_storage
+
+
+# Extensões que já são comprimidas: deflate só gastaria CPU
+STORED_EXTENSIONS = frozenset({
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic",
+    ".mp3", ".mp4", ".m4a", ".mov", ".avi", ".mkv", ".webm", ".ogg",
+    ".pdf", ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".odp", ".epub",
+})
+STORED_TYPES = ("image/", "video/", "audio/")
+
+
+class _StreamBuffer:
+    """
+    Destino do ZipFile: acumula o que foi escrito até o gerador recolher.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def compression_for(nome, tipo=""):
+    if PurePosixPath(nome).suffix.lower() in STORED_EXTENSIONS or tipo.startswith(STORED_TYPES):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def bundle_entries(envios):
+    """
+    Monta o manifesto e a lista de arquivos do pacote. `envios` deve vir com
+    os relacionamentos e `arquivos__id_arquivo` já carregados: todas as consultas
+    acontecem aqui, antes de a resposta começar a ser enviada.
+    Retorna (manifesto, [(caminho no zip, ArquivoEnvio)]).
+    """
+    manifesto, arquivos, usados = [], [], set()
+    for envio in envios:
+        pasta = f"{envio.pk}-{slugify(envio.id_disciplina.nome_disciplina) or 'envio'}"
+        itens = []
+        for arquivo in envio.arquivos.all():
+            caminho = f"{pasta}/{PurePosixPath(arquivo.nome).name}"
+            if caminho in usados:
+                caminho = f"{pasta}/{arquivo.pk}-{PurePosixPath(arquivo.nome).name}"
+            usados.add(caminho)
+            arquivos.append((caminho, arquivo))
+            itens.append({
+                "caminho": caminho,
+                "nome": arquivo.nome,
+                "sha256": arquivo.id_arquivo_id,
+                "tamanho": arquivo.id_arquivo.tamanho,
+            })
+        manifesto.append({
+            "id": envio.pk,
+            "etapa": envio.id_etapa.nome_etapa,
+            "disciplina": envio.id_disciplina.nome_disciplina,
+            "usuario": envio.id_usuario.nome_usuario,
+            "matricula": envio.id_usuario.matricula,
+            "status": envio.id_status.descricao_status,
+            "mes_referencia": envio.mes_referencia,
+            "ano_referencia": envio.ano_referencia,
+            "data_limite_envio": envio.data_limite_envio,
+            "data_envio_formador": envio.data_envio_formador,
+            "data_envio_escola": envio.data_envio_escola,
+            "data_envio_see": envio.data_envio_see,
+            "data_validacao_gerencia": envio.data_validacao_gerencia,
+            "observacoes_gerencia": envio.observacoes_gerencia,
+            "arquivos": itens,
+        })
+    return manifesto, arquivos
+
+
+def stream_zip(manifesto, arquivos):
+    """
+    Gera os bytes do ZIP: `manifest.json` seguido dos arquivos, lidos do
+    armazenamento em blocos de CHUNK_SIZE.
+    """
+    storage = get_storage()
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr(
+            "manifest.json",
+            json.dumps({"envios": manifesto}, ensure_ascii=False, indent=2, default=str),
+            compress_type=zipfile.ZIP_DEFLATED,
+        )
+        yield buffer.drain()
+
+        for caminho, arquivo in arquivos:
+            info = zipfile.ZipInfo(caminho, date_time=_zip_time(arquivo.criado_em))
+            info.compress_type = compression_for(arquivo.nome, arquivo.tipo)
+            # O tamanho conhecido de antemão decide se a entrada precisa de ZIP64
+            info.file_size = arquivo.id_arquivo.tamanho
+            with open(storage.path(arquivo.id_arquivo_id), "rb") as origem, zf.open(info, "w") as destino:
+                while chunk := origem.read(CHUNK_SIZE):
+                    destino.write(chunk)
+                    if data := buffer.drain():
+                        yield data
+            # Data descriptor da entrada
+            yield buffer.drain()
+    # Diretório central, escrito ao fechar o ZipFile
+    yield buffer.drain()
+
+
+def _zip_time(value):
+    # O formato ZIP não representa datas antes de 1980
+    return max(timezone.localtime(value).timetuple()[:6], (1980, 1, 1, 0, 0, 0))
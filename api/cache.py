@@ -0,0 +1,35 @@
+# cache.py
+from pathlib import Path
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from . import metrics
+
+
+_MISSING = object()
+
+
+class InstrumentedCacheMixin:
+    """
+    Registra hit/miss de cada `get()` em `cache_requests_total`. O label `cache`
+    é o LOCATION configurado (para caches em arquivo, o nome do diretório).
+    """
+
+    def __init__(self, location, params):
+        super().__init__(location, params)
+        self.metrics_name = Path(location).name if location else "default"
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version=version)
+        hit = value is not _MISSING
+        metrics.record_cache(self.metrics_name, hit)
+        return value if hit else default
+
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+    pass
+
+
+class InstrumentedFileBasedCache(InstrumentedCacheMixin, FileBasedCache):
+    pass
@@ -0,0 +1,112 @@
+# conformidade.py
+"""
+Matriz de conformidade: combinações professor × disciplina × etapa × mês ainda
+sem envio.
+
+Não há cadastro de atribuições: as de cada professor são as combinações
+(disciplina, etapa) em que ele tem algum envio no ano. A matriz esperada é o
+produto dessas atribuições pelos meses do período, e as faltantes saem de um
+anti-join (NOT EXISTS) contra Envio_material, tudo no banco, sem trazer envios
+nem usuários para o Python. A página segue a ordem da chave natural
+`envio_chave_natural` (ano, professor, disciplina, etapa, mês): o banco
+percorre só as combinações até o fim da página. O resumo por etapa não sonda
+combinação alguma: as faltantes são as esperadas menos os meses entregues.
+"""
+from django.db import connections
+
+from .models import Disciplina, EnvioMaterial, EtapaEscolar, Usuario
+
+
+FILTROS = {
+    "usuario": "id_usuario",
+    "disciplina": "id_disciplina",
+    "etapa": "id_etapa",
+}
+
+
+def _coluna(model, campo):
+    return model._meta.get_field(campo).column
+
+
+def _atribuicoes(qn, ano, filtros):
+    """
+    SQL (e parâmetros) das atribuições (usuario, disciplina, etapa) de
+    professores ativos no ano, já com os `filtros`, com `entregues`: os meses
+    em que há envio.
+    """
+    envio = qn(EnvioMaterial._meta.db_table)
+    usuario, disciplina, etapa = (
+        qn(_coluna(EnvioMaterial, campo)) for campo in ("id_usuario", "id_disciplina", "id_etapa")
+    )
+    condicoes = [f"e.{qn(_coluna(EnvioMaterial, 'ano_referencia'))} = %s"]
+    params = [ano]
+    for nome, valor in filtros.items():
+        condicoes.append(f"e.{qn(_coluna(EnvioMaterial, FILTROS[nome]))} = %s")
+        params.append(valor)
+    sql = (
+        f"SELECT e.{usuario} AS usuario, e.{disciplina} AS disciplina, e.{etapa} AS etapa, "
+        f"array_agg(DISTINCT e.{qn(_coluna(EnvioMaterial, 'mes_referencia'))}) AS entregues "
+        f"FROM {envio} e JOIN {qn(Usuario._meta.db_table)} u ON u.{qn('id')} = e.{usuario} "
+        f"WHERE u.{qn('is_active')} AND {' AND '.join(condicoes)} "
+        f"GROUP BY 1, 2, 3"
+    )
+    return sql, params
+
+
+def resumo_por_etapa(ano, meses, filtros=None, using="default"):
+    """
+    Por etapa: combinações esperadas (atribuições × meses) e faltantes no
+    período. [{"etapa_id", "etapa", "esperados", "faltantes"}], em ordem de etapa.
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    sql, params = _atribuicoes(qn, ano, filtros or {})
+    # Todo envio do ano é de uma atribuição: faltantes = esperadas - meses do período entregues
+    sql = (
+        f"SELECT x.etapa, t.{qn('nome_etapa')}, COUNT(*) * %s, "
+        f"SUM((SELECT COUNT(*) FROM unnest(x.entregues) AS en(mes) WHERE en.mes = ANY(%s::integer[]))) "
+        f"FROM ({sql}) AS x JOIN {qn(EtapaEscolar._meta.db_table)} t ON t.{qn('id')} = x.etapa "
+        f"GROUP BY x.etapa, t.{qn('nome_etapa')} ORDER BY t.{qn('nome_etapa')}, x.etapa"
+    )
+    params = [len(meses), list(meses), *params]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [
+            {"etapa_id": etapa_id, "etapa": nome, "esperados": esperados, "faltantes": esperados - entregues}
+            for etapa_id, nome, esperados, entregues in cursor.fetchall()
+        ]
+
+
+def faltantes(ano, meses, filtros=None, limite=None, deslocamento=0, using="default"):
+    """
+    Combinações sem envio, por professor, disciplina, etapa e mês (na ordem dos
+    ids), a partir de `deslocamento` e no máximo `limite`. Cada item traz ids e nomes.
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    envio = qn(EnvioMaterial._meta.db_table)
+    sql, params = _atribuicoes(qn, ano, filtros or {})
+    usuario, disciplina, etapa, ano_col, mes_col = (
+        qn(_coluna(EnvioMaterial, campo))
+        for campo in ("id_usuario", "id_disciplina", "id_etapa", "ano_referencia", "mes_referencia")
+    )
+    # Na ordem do índice de envio_chave_natural, a página sai sem montar a
+    # matriz inteira; os nomes são buscados só para as linhas da página
+    sql = (
+        f"SELECT p.usuario, u.{qn('nome_usuario')}, u.{qn('matricula')}, "
+        f"p.disciplina, d.{qn('nome_disciplina')}, p.etapa, t.{qn('nome_etapa')}, p.mes "
+        f"FROM (SELECT x.usuario, x.disciplina, x.etapa, m.mes "
+        f"FROM ({sql}) AS x CROSS JOIN unnest(%s::integer[]) AS m(mes) "
+        f"WHERE NOT EXISTS (SELECT 1 FROM {envio} e WHERE e.{ano_col} = %s AND e.{usuario} = x.usuario "
+        f"AND e.{disciplina} = x.disciplina AND e.{etapa} = x.etapa AND e.{mes_col} = m.mes) "
+        f"ORDER BY 1, 2, 3, 4 LIMIT %s OFFSET %s) AS p "
+        f"JOIN {qn(Usuario._meta.db_table)} u ON u.{qn('id')} = p.usuario "
+        f"JOIN {qn(Disciplina._meta.db_table)} d ON d.{qn('id')} = p.disciplina "
+        f"JOIN {qn(EtapaEscolar._meta.db_table)} t ON t.{qn('id')} = p.etapa "
+        f"ORDER BY 1, 4, 6, 8"
+    )
+    params = [*params, list(meses), ano, limite, deslocamento]
+    colunas = ("usuario_id", "usuario", "matricula", "disciplina_id", "disciplina", "etapa_id", "etapa", "mes")
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [dict(zip(colunas, linha)) for linha in cursor.fetchall()]
@@ -0,0 +1,183 @@
+# dashboard.py
+"""
+Dados do dashboard de envios, com as consultas independentes em paralelo.
+
+Os totais, os agrupamentos por mês e por disciplina e a lista de envios não
+dependem uns dos outros: `adashboard_data` dispara cada parte em uma thread de
+um executor próprio (DASHBOARD_QUERY_WORKERS), cada uma com a sua conexão, e
+junta os resultados. O tempo total fica perto da consulta mais lenta, e não da
+soma. O async ORM do Django não ajudaria aqui: ele roda todas as consultas na
+mesma thread (e conexão), uma depois da outra.
+
+As views do dashboard (DashboardEnvioViewSet) são síncronas, como todas as do
+DRF, inclusive sob ASGI: chamam `dashboard_data`, que executa `adashboard_data`
+com `async_to_sync`. É um fan-out síncrono em threads, não uma view
+assíncrona; as consultas das threads aparecem nos observadores de
+api/instrumentation.py (métricas, Server-Timing, benchmark), não no
+CaptureQueriesContext da thread da requisição.
+
+Cada thread do executor mantém as suas conexões entre requisições, como as
+threads dos workers: `close_old_connections` no início e no fim de cada parte
+respeita DB_CONN_MAX_AGE e, com DB_POOL=True, devolve a conexão ao pool.
+`shutdown_executor()` (na saída do processo e antes de o comando `benchmark`
+apagar o banco de teste) encerra as threads e fecha essas conexões. Dentro de uma transação (ou com
+DASHBOARD_QUERY_WORKERS=0) as partes rodam em sequência na conexão atual,
+porque outras conexões não enxergariam os dados dela.
+"""
+import asyncio
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.models import Count, Q
+
+from .models import EnvioMaterial
+from .serializers import EnvioMaterialSerializer
+
+
+_executor = None
+_executor_lock = threading.Lock()
+# Conexões abertas pelas threads do executor, fechadas no shutdown
+_worker_connections = set()
+
+
+def _get_executor():
+    global _executor
+    workers = settings.DASHBOARD_QUERY_WORKERS
+    if _executor is None or _executor._max_workers != workers:
+        with _executor_lock:
+            if _executor is None or _executor._max_workers != workers:
+                if _executor is not None:
+                    _shutdown(_executor)
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dashboard")
+    return _executor
+
+
+def shutdown_executor():
+    """
+    Encerra as threads do executor (as partes em andamento terminam antes) e
+    fecha as conexões que elas mantinham abertas.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _shutdown(_executor)
+            _executor = None
+
+
+def _shutdown(executor):
+    executor.shutdown(wait=True)
+    # As threads já terminaram: fechar daqui é seguro
+    for connection in list(_worker_connections):
+        connection.inc_thread_sharing()
+        try:
+            connection.close()
+        finally:
+            connection.dec_thread_sharing()
+    _worker_connections.clear()
+
+
+atexit.register(shutdown_executor)
+
+
+def totais(queryset, context=None):
+    # Totais por status (uma única consulta)
+    return queryset.aggregate(
+        total_envios=Count("id"),
+        pendentes=Count("id", filter=Q(id_status__descricao_status__iexact="Pendente")),
+        validados=Count("id", filter=Q(id_status__descricao_status__iexact="Validado")),
+        rejeitados=Count("id", filter=Q(id_status__descricao_status__iexact="Rejeitado")),
+    )
+
+
+def por_mes(queryset, context=None):
+    meses_dict = dict(EnvioMaterial.MONTH_CHOICES)
+    return [
+        {"mes": meses_dict.get(item["mes_referencia"], item["mes_referencia"]), "total": item["total"]}
+        for item in queryset.values("mes_referencia").annotate(total=Count("id")).order_by("mes_referencia")
+    ]
+
+
+def por_disciplina(queryset, context=None):
+    return [
+        {"disciplina": item["id_disciplina__nome_disciplina"], "total": item["total"]}
+        for item in (
+            queryset.values("id_disciplina__nome_disciplina")
+            .annotate(total=Count("id"))
+            .order_by("id_disciplina__nome_disciplina")
+        )
+    ]
+
+
+def envios(queryset, context=None):
+    return EnvioMaterialSerializer(queryset, many=True, context=context or {}).data
+
+
+# Cada parte recebe o queryset e o contexto do serializer da lista
+PARTES = (totais, por_mes, por_disciplina, envios)
+
+
+def montar(totais, por_mes, por_disciplina, envios):
+    # Listas: serializa uma vez e separa por status
+    listas = {"pendente": [], "validado": [], "rejeitado": []}
+    for envio in envios:
+        lista = listas.get((envio["status_descricao"] or "").lower())
+        if lista is not None:
+            lista.append(envio)
+    return {
+        **totais,
+        "por_mes": por_mes,
+        "por_disciplina": por_disciplina,
+        "envios": envios,
+        "pendentes_list": listas["pendente"],
+        "validados_list": listas["validado"],
+        "rejeitados_list": listas["rejeitado"],
+    }
+
+
+def _on_own_connection(parte, queryset, context):
+    close_old_connections()
+    try:
+        return parte(queryset, context)
+    finally:
+        close_old_connections()
+        _worker_connections.update(connections.all(initialized_only=True))
+
+
+async def adashboard_data(queryset, resumido=False, context=None):
+    """
+    Resumo estatístico dos envios de `queryset`; com `resumido`, só os totais.
+    `context` vai para o serializer da lista de envios.
+    """
+    # O banco (primário ou réplica) é decidido aqui, no contexto da requisição
+    queryset = queryset.using(queryset.db)
+    if resumido:
+        return await sync_to_async(totais)(queryset)
+    if not settings.DASHBOARD_QUERY_WORKERS or await sync_to_async(_in_transaction)(queryset.db):
+        return await sync_to_async(_sequencial)(queryset, context)
+
+    executor = _get_executor()
+    resultados = await asyncio.gather(*(
+        sync_to_async(_on_own_connection, thread_sensitive=False, executor=executor)(parte, queryset, context)
+        for parte in PARTES
+    ))
+    return montar(*resultados)
+
+
+def _in_transaction(alias):
+    # Na thread da requisição: as conexões são locais a cada thread
+    return connections[alias].in_atomic_block
+
+
+def _sequencial(queryset, context):
+    return montar(*(parte(queryset, context) for parte in PARTES))
+
+
+def dashboard_data(queryset, resumido=False, context=None):
+    """
+    Versão síncrona de `adashboard_data`, para as views do DRF.
+    """
+    return async_to_sync(adashboard_data)(queryset, resumido, context)
@@ -0,0 +1,62 @@
+# db_pool.py
+"""
+Estatísticas do pool de conexões do psycopg 3 (modo `DB_POOL=True`) publicadas
+nas métricas.
+
+Cada worker tem o próprio pool; os tamanhos viram gauges com o label `pid` e os
+contadores do pool (`pop_stats()` zera a cada leitura) são somados no store,
+então o /metrics mostra o total de todos os workers.
+"""
+import time
+
+from django.db import connections
+
+from . import metrics
+
+
+# Estatística do psycopg_pool -> (métrica, fator de conversão)
+POOL_COUNTERS = {
+    "requests_num": ("db_pool_requests_total", 1),
+    "requests_queued": ("db_pool_requests_queued_total", 1),
+    "requests_wait_ms": ("db_pool_acquire_wait_seconds_total", 0.001),
+    "requests_errors": ("db_pool_acquire_errors_total", 1),
+    "connections_num": ("db_pool_connections_opened_total", 1),
+    "connections_lost": ("db_pool_connections_lost_total", 1),
+    "returns_bad": ("db_pool_returns_bad_total", 1),
+}
+
+# Intervalo mínimo entre duas leituras das estatísticas no mesmo processo (segundos)
+RECORD_INTERVAL = 1.0
+
+_last_record = 0.0
+
+
+def pools():
+    """
+    Pares (alias, pool) dos bancos configurados com pool.
+    """
+    for alias in connections:
+        if connections.settings[alias].get("OPTIONS", {}).get("pool"):
+            pool = connections[alias].pool
+            if pool is not None:
+                yield alias, pool
+
+
+def record_pool_metrics(force=False):
+    global _last_record
+    now = time.monotonic()
+    if not force and now - _last_record < RECORD_INTERVAL:
+        return
+    _last_record = now
+
+    for alias, pool in pools():
+        stats = pool.pop_stats()
+        labels = {"alias": alias}
+        size, available = stats.get("pool_size", 0), stats.get("pool_available", 0)
+        metrics.set_gauge("db_pool_size", size, labels)
+        metrics.set_gauge("db_pool_max_size", stats.get("pool_max", 0), labels)
+        metrics.set_gauge("db_pool_in_use", size - available, labels)
+        metrics.set_gauge("db_pool_waiting", stats.get("requests_waiting", 0), labels)
+        for key, (name, factor) in POOL_COUNTERS.items():
+            if stats.get(key):
+                metrics.inc(name, labels, stats[key] * factor)
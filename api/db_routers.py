@@ -0,0 +1,130 @@
+# db_routers.py
+"""
+Roteamento de leituras para a réplica (`DATABASES['replica']`, opcional).
+
+Só vão para a réplica as leituras feitas dentro de ações somente leitura das
+viewsets com `ReplicaRoutingMixin`. Todo o resto usa o primário:
+
+- qualquer escrita na requisição fixa as leituras seguintes no primário
+  (read-after-write na mesma requisição);
+- depois de uma escrita, as leituras do mesmo usuário ficam no primário por
+  `REPLICA_STICKY_SECONDS`, para não enxergar o atraso da replicação.
+
+A marcação "sticky" é feita pelo `ReplicaStickyMiddleware` (api/middleware.py) em
+qualquer requisição que escreve: admin, login, upload e ações com SQL direto
+(upsert, gerar-pendentes) também contam, não só as viewsets com o mixin. Sem o
+middleware, o mixin faz a marcação das próprias requisições.
+"""
+import contextvars
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+
+REPLICA_DB_ALIAS = "replica"
+
+_state = contextvars.ContextVar("replica_routing", default=None)
+
+
+class _RoutingState:
+    def __init__(self):
+        self.use_replica = False
+        self.wrote = False
+        self.user_id = None
+
+
+def replica_enabled():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def _sticky_key(user_id):
+    return f"replica:sticky:{user_id}"
+
+
+def _sticky_cache():
+    return caches[settings.REPLICA_STICKY_CACHE]
+
+
+def is_sticky(user_id):
+    return user_id is not None and _sticky_cache().get(_sticky_key(user_id)) is not None
+
+
+def begin_request():
+    """
+    Cria o estado de roteamento da requisição. Retorna (estado, token do contextvar).
+    """
+    state = _RoutingState()
+    return state, _state.set(state)
+
+
+def end_request(state, token):
+    _state.reset(token)
+    if state.wrote and state.user_id is not None and replica_enabled():
+        _sticky_cache().set(_sticky_key(state.user_id), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def note_write(user_id=None):
+    """
+    Registra uma escrita que não passa pelo roteador (SQL direto) e, se informado,
+    o usuário da requisição (ex.: login, em que o usuário só é conhecido na view).
+    """
+    state = _state.get()
+    if state is None:
+        return
+    state.wrote = True
+    if user_id is not None:
+        state.user_id = user_id
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is not None and state.use_replica and not state.wrote:
+            return REPLICA_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        # Explícito: sem isso o Django salvaria na réplica um objeto lido dela
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primário e réplica têm os mesmos dados
+        return True
+
+
+class ReplicaRoutingMixin:
+    """
+    Envia para a réplica as leituras das ações em `replica_actions` (sempre com
+    método seguro) e registra a janela "sticky" quando a requisição escreve.
+    """
+
+    replica_actions = frozenset({"list", "retrieve"})
+
+    def dispatch(self, request, *args, **kwargs):
+        if _state.get() is not None:
+            # Estado criado pelo ReplicaStickyMiddleware, que também faz a marcação
+            return super().dispatch(request, *args, **kwargs)
+        state, token = begin_request()
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            end_request(state, token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        state = _state.get()
+        if state is None:
+            return
+        if request.user and request.user.is_authenticated:
+            state.user_id = request.user.pk
+        state.use_replica = (
+            replica_enabled()
+            and request.method in SAFE_METHODS
+            and self.action in self.replica_actions
+            and not is_sticky(state.user_id)
+        )
@@ -0,0 +1,156 @@
+# hashing.py
+"""
+Verificação de senha fora do event loop, em um pool de threads limitado.
+
+O PBKDF2 (hashlib) libera o GIL durante o cálculo, então LOGIN_HASH_WORKERS
+threads (por padrão, o número de núcleos) verificam senhas em paralelo enquanto
+o event loop continua atendendo as outras requisições. Verificações além dos
+workers esperam na fila do pool; acima de LOGIN_HASH_MAX_PENDING o pedido é
+recusado com `PoolOverloaded`, que o login traduz em 503 com Retry-After.
+
+A importação de usuários (api/user_import.py) usa o mesmo pool com `map`, que
+mantém no máximo um hash por worker na fila: um login que chega no meio de uma
+importação espera, no pior caso, uma rodada de hashes.
+"""
+import asyncio
+import collections
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+from . import metrics
+
+
+class PoolOverloaded(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Pool de verificação de senha cheio")
+        self.retry_after = retry_after
+
+
+class PasswordHashPool:
+    """
+    ThreadPoolExecutor com limite de pedidos pendentes (na fila + em execução).
+
+    Publica nas métricas o tempo de espera na fila, a duração do hash, os pedidos
+    que precisaram esperar e os gauges de pendentes/em execução do processo.
+    """
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self.pending = 0
+        self.running = 0
+        # Média móvel da duração de um hash, usada para estimar o Retry-After
+        self.avg_duration = 0.1
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                raise PoolOverloaded(self.retry_after())
+            self.pending += 1
+            queued = self.pending > self.workers
+        if queued:
+            metrics.inc("login_hash_queued_total")
+        self._record_gauges()
+
+    def _release(self):
+        with self._lock:
+            self.pending -= 1
+        self._record_gauges()
+
+    def retry_after(self):
+        """
+        Segundos estimados até a fila atual esvaziar (mínimo de 1).
+        """
+        return max(1, math.ceil(self.pending / self.workers * self.avg_duration))
+
+    def _record_gauges(self):
+        metrics.set_gauge("login_hash_pending", self.pending)
+        metrics.set_gauge("login_hash_running", self.running)
+
+    def _run(self, submitted_at, func, args):
+        started = time.perf_counter()
+        with self._lock:
+            self.running += 1
+        try:
+            return func(*args), started - submitted_at, time.perf_counter() - started
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    async def run(self, func, *args):
+        """
+        Executa `func(*args)` no pool sem bloquear o event loop.
+        """
+        self._acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            result, waited, duration = await loop.run_in_executor(
+                self.executor, self._run, time.perf_counter(), func, args
+            )
+        finally:
+            self._release()
+        self.avg_duration = 0.8 * self.avg_duration + 0.2 * duration
+        metrics.observe("login_hash_wait_seconds", waited)
+        metrics.observe("login_hash_duration_seconds", duration)
+        return result
+
+    def map(self, func, items):
+        """
+        Lista com `func(item)` de cada item, calculados no pool. Trabalho em lote:
+        fica fora do limite de pendentes do login e não entra nas métricas dele.
+        """
+        results, in_flight = [], collections.deque()
+        for item in items:
+            if len(in_flight) >= self.workers:
+                results.append(in_flight.popleft().result()[0])
+            in_flight.append(self.executor.submit(self._run, time.perf_counter(), func, (item,)))
+        results.extend(future.result()[0] for future in in_flight)
+        return results
+
+
+def verify_password(user, password):
+    """
+    Confere a senha de `user` (ou de ninguém, se None). Retorna (válida, atualizada):
+    `atualizada` indica que o hash foi refeito com o hasher atual e precisa ser salvo.
+    """
+    if user is None:
+        # Mesmo custo de um usuário existente, para não revelar matrículas pelo tempo
+        make_password(password)
+        return False, False
+
+    upgraded = []
+
+    def setter(raw_password):
+        user.set_password(raw_password)
+        upgraded.append(True)
+
+    return check_password(password, user.password, setter), bool(upgraded)
+
+
+def encode_password(hasher, password):
+    """
+    Equivalente a make_password com um hasher já escolhido. Usada na importação
+    de usuários, que escolhe o hasher uma vez por arquivo.
+    """
+    return hasher.encode(password, hasher.salt())
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hash_pool():
+    global _pool
+    config = (settings.LOGIN_HASH_WORKERS, settings.LOGIN_HASH_MAX_PENDING)
+    if _pool is None or (_pool.workers, _pool.max_pending) != config:
+        with _pool_lock:
+            if _pool is None or (_pool.workers, _pool.max_pending) != config:
+                _pool = PasswordHashPool(*config)
+    return _pool
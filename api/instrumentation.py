@@ -0,0 +1,135 @@
+# instrumentation.py
+"""
+Instrumentação por requisição: contagem e tempo das consultas SQL e medição
+de etapas nomeadas (ex.: serialização).
+
+A medição só existe enquanto uma `RequestTiming` estiver ativa; fora disso
+`span()` não faz nada, então o custo para requisições não amostradas é mínimo.
+
+As consultas são observadas por um único execute_wrapper instalado em cada
+conexão ao abri-la (`install_query_observer`), que repassa o tempo aos
+observadores ativos no contexto atual. Como o contexto acompanha o
+`sync_to_async`, as consultas feitas em threads por views e middlewares
+assíncronos (ASGI) também são contadas na requisição certa.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+
+_current_timing = contextvars.ContextVar("request_timing", default=None)
+_query_observers = contextvars.ContextVar("query_observers", default=())
+
+
+def _observe_queries(execute, sql, params, many, context):
+    observers = _query_observers.get()
+    if not observers:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        for observer in observers:
+            observer.record_query(elapsed)
+
+
+def install_query_observer(sender, connection, **kwargs):
+    """
+    Receptor de `connection_created` (ver ApiConfig.ready).
+    """
+    if _observe_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_observe_queries)
+
+
+class QueryObserver:
+    """
+    Base dos observadores de consultas: ativo entre start() e stop().
+    """
+
+    def record_query(self, seconds):
+        raise NotImplementedError
+
+    def start(self):
+        _query_observers.set(_query_observers.get() + (self,))
+
+    def stop(self):
+        # Sem reset(token): sob ASGI start() e stop() podem rodar em contextos
+        # diferentes (o do sync_to_async é copiado de volta para o chamador)
+        _query_observers.set(tuple(observer for observer in _query_observers.get() if observer is not self))
+
+
+class RequestTiming(QueryObserver):
+    """
+    Acumula os tempos de uma requisição: consultas SQL, tempo de SQL e etapas.
+    """
+
+    def __init__(self, route=None):
+        self.route = route
+        self.queries = 0
+        self.sql_time = 0.0
+        self.spans = {}
+        self.started_at = None
+
+    def record_query(self, seconds):
+        self.queries += 1
+        self.sql_time += seconds
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        _current_timing.set(self)
+        super().start()
+
+    def stop(self):
+        super().stop()
+        if _current_timing.get() is self:
+            _current_timing.set(None)
+
+
+class QueryCounter(QueryObserver):
+    """
+    Observador mínimo que só conta as consultas SQL (usado pelas métricas,
+    ativo em todas as requisições).
+    """
+
+    def __init__(self):
+        self.queries = 0
+
+    def record_query(self, seconds):
+        self.queries += 1
+
+
+def current_timing():
+    return _current_timing.get()
+
+
+@contextmanager
+def span(name):
+    """
+    Soma o tempo do bloco na etapa `name` da requisição ativa, se houver.
+    """
+    timing = _current_timing.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - start)
+
+
+class TimedSerializerMixin:
+    """
+    Mede o tempo de `serializer.data` na etapa "serialize".
+
+    Inclui a avaliação preguiçosa do queryset, que também aparece no tempo de SQL.
+    """
+
+    @property
+    def data(self):
+        with span("serialize"):
+            return super().data
@@ -0,0 +1,138 @@
+import json
+import platform
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+
+from api import benchmark, dashboard
+
+
+class Command(BaseCommand):
+    help = (
+        "Executa o benchmark dos endpoints principais em um banco de teste descartável "
+        "e grava latência, consultas SQL e tempo de SQL em JSON. Com --suite connections, "
+        "compara os modos de conexão (sem reuso, persistente, pool) sob concorrência. Com "
+        "--suite renderers, mede codificação/decodificação de --rows envios em cada formato."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", type=int, default=1,
+                            help=f"Escala do conjunto de dados ({benchmark.ENVIOS_POR_ESCALA} envios por unidade).")
+        parser.add_argument("--iterations", type=int, default=20, help="Requisições medidas por endpoint.")
+        parser.add_argument("--warmup", type=int, default=2, help="Requisições descartadas antes da medição.")
+        parser.add_argument("--seed", type=int, default=42, help="Semente do gerador de dados.")
+        parser.add_argument("--only", nargs="*", help="Mede apenas os cenários informados.")
+        parser.add_argument("--output", help="Arquivo JSON de saída (padrão: benchmarks/<data>.json).")
+        parser.add_argument("--compare", help="Relatório JSON anterior para comparação.")
+        parser.add_argument("--keepdb", action="store_true", help="Mantém o banco de teste entre execuções.")
+        parser.add_argument("--suite", choices=["endpoints", "connections", "renderers"], default="endpoints",
+                            help="Conjunto de cenários medido.")
+        parser.add_argument("--concurrency", type=int, default=8,
+                            help="Threads simultâneas na suíte connections.")
+        parser.add_argument("--rows", type=int, default=10000, help="Envios por carga na suíte renderers.")
+
+    def handle(self, *args, **options):
+        anterior = None
+        if options["compare"]:
+            try:
+                anterior = json.loads(Path(options["compare"]).read_text())
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Não foi possível ler {options['compare']}: {exc}")
+
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options["keepdb"], aliases={"default"})
+        try:
+            self.stdout.write(f"Populando dados (escala {options['scale']})...")
+            dataset = benchmark.seed_dataset(scale=options["scale"], seed=options["seed"])
+            self.stdout.write(self.style.SUCCESS(
+                f"{dataset['usuarios']} usuários e {dataset['envios']} envios criados ✅"
+            ))
+            if options["suite"] == "connections":
+                resultados = benchmark.run_connection_suite(
+                    iterations=options["iterations"],
+                    warmup=options["warmup"],
+                    concurrency=options["concurrency"],
+                    only=options["only"],
+                )
+            elif options["suite"] == "renderers":
+                resultados = benchmark.run_render_suite(
+                    rows=options["rows"],
+                    iterations=options["iterations"],
+                    warmup=options["warmup"],
+                    only=options["only"],
+                )
+            else:
+                resultados = benchmark.run_endpoint_suite(
+                    dataset,
+                    iterations=options["iterations"],
+                    warmup=options["warmup"],
+                    only=options["only"],
+                )
+        finally:
+            # As threads do dashboard não podem manter conexões com o banco de teste
+            dashboard.shutdown_executor()
+            teardown_databases(old_config, verbosity=0, keepdb=options["keepdb"])
+
+        relatorio = {
+            "meta": {
+                "data": datetime.now().isoformat(timespec="seconds"),
+                "commit": self._git_commit(),
+                "escala": options["scale"],
+                "usuarios": dataset["usuarios"],
+                "envios": dataset["envios"],
+                "suite": options["suite"],
+                "iteracoes": options["iterations"],
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "banco": connection.vendor,
+            },
+            "resultados": resultados,
+        }
+
+        output = Path(options["output"] or Path(settings.BASE_DIR) / "benchmarks" / f"{datetime.now():%Y%m%d-%H%M%S}.json")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(relatorio, indent=2, ensure_ascii=False))
+
+        for resultado in resultados:
+            lat = resultado["latencia_ms"]
+            if "vazao_rps" in resultado:
+                self.stdout.write(
+                    f"{resultado['nome']:<28} p50={lat['p50']:>8.2f}ms p99={lat['p99']:>8.2f}ms "
+                    f"vazão={resultado['vazao_rps']:>8.1f} req/s conexões abertas={resultado['conexoes_abertas']}"
+                )
+                continue
+            if "bytes" in resultado:
+                self.stdout.write(
+                    f"{resultado['nome']:<28} codificar p50={lat['p50']:>8.2f}ms "
+                    f"decodificar p50={resultado['decodificacao_ms']['p50']:>8.2f}ms "
+                    f"tamanho={resultado['bytes'] / 1024:>9.1f} KB"
+                )
+                continue
+            self.stdout.write(
+                f"{resultado['nome']:<28} p50={lat['p50']:>8.2f}ms p99={lat['p99']:>8.2f}ms "
+                f"consultas={resultado['consultas']['max']:>5.0f} sql={resultado['tempo_sql_ms']['p50']:>7.2f}ms "
+                f"status={resultado['status']}"
+            )
+        if anterior:
+            self.stdout.write("\nComparação com o relatório anterior (antes → depois):")
+            for diff in benchmark.compare(anterior, relatorio):
+                self.stdout.write(
+                    f"{diff['nome']:<28} p50 {diff['p50_ms'][0]} → {diff['p50_ms'][1]} ms | "
+                    f"p99 {diff['p99_ms'][0]} → {diff['p99_ms'][1]} ms | "
+                    f"consultas {diff['consultas'][0]} → {diff['consultas'][1]}"
+                )
+        self.stdout.write(self.style.SUCCESS(f"🎉 Relatório salvo em {output}"))
+
+    def _git_commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
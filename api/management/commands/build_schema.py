@@ -0,0 +1,37 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.schema import generate_schema, serialize_schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera o schema OpenAPI em OPENAPI_SCHEMA_FILE, servido pronto por /api/schema/. "
+        "Com --check, só compara: falha se o arquivo não corresponde ao código atual."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", help="Arquivo de destino (padrão: OPENAPI_SCHEMA_FILE).")
+        parser.add_argument("--check", action="store_true",
+                            help="Não grava; termina com erro se o arquivo estiver desatualizado.")
+
+    def handle(self, *args, **options):
+        path = options["file"] or settings.OPENAPI_SCHEMA_FILE
+        if not path:
+            raise CommandError("Defina OPENAPI_SCHEMA_FILE ou use --file.")
+        path = Path(path)
+        content = serialize_schema(generate_schema())
+
+        if options["check"]:
+            if not path.exists() or path.read_bytes() != content:
+                raise CommandError(
+                    f"{path} está desatualizado: rode `python manage.py build_schema`."
+                )
+            self.stdout.write(self.style.SUCCESS(f"{path} está atualizado ✅"))
+            return
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+        self.stdout.write(self.style.SUCCESS(f"Schema gravado em {path} ({len(content)} bytes) ✅"))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.pendencias import GeracaoError, gerar_pendentes
+
+
+class Command(BaseCommand):
+    help = (
+        "Cria os envios pendentes de um mês para cada professor ativo e cada disciplina/etapa "
+        "em que ele teve envio nos 12 meses anteriores. Rodar de novo não duplica nem altera "
+        "os envios existentes."
+    )
+
+    def add_arguments(self, parser):
+        hoje = timezone.localdate()
+        parser.add_argument("--mes", type=int, default=hoje.month, help="Mês (padrão: o atual).")
+        parser.add_argument("--ano", type=int, default=hoje.year, help="Ano (padrão: o atual).")
+        parser.add_argument("--dia-limite", type=int,
+                            help="Dia da data limite (padrão: ENVIO_DIA_LIMITE).")
+
+    def handle(self, *args, **options):
+        if not 1 <= options["mes"] <= 12:
+            raise CommandError("--mes deve estar entre 1 e 12.")
+        if options["dia_limite"] is not None and not 1 <= options["dia_limite"] <= 31:
+            raise CommandError("--dia-limite deve estar entre 1 e 31.")
+        try:
+            resultado = gerar_pendentes(options["ano"], options["mes"], options["dia_limite"],
+                                        criado_por="gerar_pendentes")
+        except GeracaoError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f"{resultado} ✅"))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.user_import import FORMATS, detect_format, import_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa usuários de um arquivo CSV ou JSONL (colunas: matricula, cpf, nome_usuario, "
+        "perfil, telefone, senha). Linhas inválidas são puladas e relatadas; as senhas são "
+        "calculadas em paralelo e os usuários inseridos em lote."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("arquivo", help="Caminho do arquivo .csv ou .jsonl.")
+        parser.add_argument("--format", choices=FORMATS,
+                            help="Formato do arquivo (padrão: pela extensão).")
+        parser.add_argument("--workers", type=int,
+                            help="Threads para o hash das senhas (padrão: o pool do login, LOGIN_HASH_WORKERS).")
+        parser.add_argument("--dry-run", action="store_true", help="Só valida, sem gravar.")
+
+    def handle(self, *args, **options):
+        fmt = options["format"] or detect_format(options["arquivo"])
+        if fmt is None:
+            raise CommandError("Formato não reconhecido: use --format csv ou --format jsonl.")
+        try:
+            with open(options["arquivo"], encoding="utf-8-sig", newline="") as stream:
+                result = import_users(stream, fmt, workers=options["workers"], dry_run=options["dry_run"])
+        except OSError as exc:
+            raise CommandError(f"Não foi possível ler {options['arquivo']}: {exc}")
+        except UnicodeDecodeError:
+            raise CommandError("O arquivo precisa estar em UTF-8.")
+
+        for linha, mensagens in sorted(result.erros.items()):
+            for mensagem in mensagens:
+                self.stderr.write(f"linha {linha}: {mensagem}")
+        self.stdout.write(self.style.SUCCESS(f"{result} ✅"))
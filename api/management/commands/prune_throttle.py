@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.throttling import idle_window, prune_buckets
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove os baldes do throttle (Throttle_bucket) parados há mais que a maior janela "
+        "de DEFAULT_THROTTLE_RATES; esses baldes já estão cheios e seriam recriados iguais."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--idle", type=float, default=None,
+                            help="Segundos sem uso para remover o balde (padrão: a maior janela das taxas).")
+
+    def handle(self, *args, **options):
+        idle = options["idle"] if options["idle"] is not None else idle_window()
+        removidos = prune_buckets(idle)
+        self.stdout.write(self.style.SUCCESS(f"{removidos} baldes removidos (parados há mais de {idle:g}s) ✅"))
@@ -69,15 +69,18 @@ class Command(BaseCommand):
 
         # Criando Envios de Material
         for _ in range(10):
+            # Um envio por professor, disciplina, etapa e mês (envio_chave_natural)
             EnvioMaterial.objects.get_or_create(
                 id_etapa=random.choice(etapas),
                 id_disciplina=random.choice(disciplinas),
                 id_usuario=random.choice(usuarios),
-                id_status=random.choice(status),
                 mes_referencia=random.randint(1, 12),
                 ano_referencia=2025,
-                data_envio_escola=timezone.now().date(),
-                observacoes_gerencia="Envio automático de teste",
+                defaults={
+                    "id_status": random.choice(status),
+                    "data_envio_escola": timezone.now().date(),
+                    "observacoes_gerencia": "Envio automático de teste",
+                },
             )
         self.stdout.write(self.style.SUCCESS("Envios de Material criados ✅"))
 
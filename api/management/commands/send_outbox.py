@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.outbox import send_pending
+
+
+class Command(BaseCommand):
+    help = (
+        "Envia os e-mails da fila (EmailOutbox) em lotes, reaproveitando uma conexão SMTP "
+        "por lote. Com --loop, continua rodando e verifica a fila a cada --interval segundos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50, help="Mensagens por lote.")
+        parser.add_argument("--loop", action="store_true", help="Não termina quando a fila esvazia.")
+        parser.add_argument("--interval", type=float, default=5.0,
+                            help="Espera, em segundos, quando não há mensagens (com --loop).")
+
+    def handle(self, *args, **options):
+        total_enviadas = total_falhas = 0
+        try:
+            while True:
+                enviadas, falhas = send_pending(batch_size=options["batch_size"])
+                total_enviadas += enviadas
+                total_falhas += falhas
+                if enviadas or falhas:
+                    self.stdout.write(f"Lote: {enviadas} enviadas, {falhas} com falha")
+                    continue
+                if not options["loop"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"{total_enviadas} enviadas, {total_falhas} com falha ✅"))
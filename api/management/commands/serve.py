@@ -0,0 +1,132 @@
+import importlib.util
+import math
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.warmup import warmup, warmup_worker
+
+
+ASGI_WORKER_CLASS = "uvicorn_worker.UvicornWorker"
+WSGI_THREADS = 4
+
+
+def available_cpus():
+    """
+    Núcleos disponíveis para o processo: afinidade de CPU e, em contêiner, a
+    cota do cgroup v2 (docker run --cpus).
+    """
+    cpus = os.process_cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as arquivo:
+            quota, period = arquivo.read().split()
+    except (OSError, ValueError):
+        return cpus
+    if quota == "max":
+        return cpus
+    return max(1, min(cpus, math.ceil(int(quota) / int(period))))
+
+
+def autotune(interface, cpus):
+    """
+    (workers, threads) para o número de núcleos. WSGI: 2 * núcleos + 1 processos
+    gthread com WSGI_THREADS threads, para cobrir a espera por banco e disco. ASGI:
+    um processo por núcleo, que já atende várias requisições no event loop.
+    """
+    if interface == "asgi":
+        return cpus, 1
+    return 2 * cpus + 1, WSGI_THREADS
+
+
+def _post_worker_init(worker):
+    elapsed = warmup_worker()
+    worker.log.info("Worker %s aquecido em %.0f ms", worker.pid, elapsed * 1000)
+
+
+class Command(BaseCommand):
+    help = (
+        "Inicia o servidor de produção (gunicorn, WSGI com threads ou ASGI com uvicorn). "
+        "Workers e threads são calculados pelos núcleos disponíveis; a aplicação é carregada e "
+        "aquecida (rotas, serializers, schema, templates) no processo mestre antes de abrir a "
+        "porta. SIGHUP recria os workers sem derrubar conexões; para publicar código novo use "
+        "SIGUSR2 seguido de SIGTERM no mestre antigo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bind", default="0.0.0.0:8000", help="Endereço (padrão: 0.0.0.0:8000).")
+        parser.add_argument("--interface", choices=("wsgi", "asgi"), default="wsgi",
+                            help="wsgi (gthread) ou asgi (uvicorn).")
+        parser.add_argument("--workers", type=int, help="Processos (padrão: pelos núcleos).")
+        parser.add_argument("--threads", type=int, help="Threads por processo WSGI (padrão: %d)." % WSGI_THREADS)
+        parser.add_argument("--timeout", type=int, default=30, help="Segundos até reiniciar um worker travado.")
+        parser.add_argument("--graceful-timeout", type=int, default=30,
+                            help="Segundos para terminar as requisições em andamento ao reiniciar.")
+        parser.add_argument("--max-requests", type=int, default=0,
+                            help="Recicla o worker após N requisições (0 desliga).")
+        parser.add_argument("--pid", help="Arquivo de PID do mestre, para enviar sinais.")
+        parser.add_argument("--no-warmup", action="store_true", help="Não aquece antes de abrir a porta.")
+        parser.add_argument("--check", action="store_true", help="Só mostra a configuração calculada.")
+
+    def handle(self, *args, **options):
+        interface = options["interface"]
+        workers, threads = autotune(interface, available_cpus())
+        workers = options["workers"] or workers
+        threads = 1 if interface == "asgi" else options["threads"] or threads
+
+        config = {
+            "bind": options["bind"],
+            "workers": workers,
+            "threads": threads,
+            "worker_class": ASGI_WORKER_CLASS if interface == "asgi" else "gthread",
+            "preload_app": True,
+            "timeout": options["timeout"],
+            "graceful_timeout": options["graceful_timeout"],
+            "max_requests": options["max_requests"],
+            "max_requests_jitter": options["max_requests"] // 10,
+            "pidfile": options["pid"],
+            "accesslog": "-",
+            "errorlog": "-",
+        }
+        if not options["no_warmup"]:
+            config["post_worker_init"] = _post_worker_init
+
+        self.stdout.write(
+            f"{interface.upper()} em {config['bind']}: {workers} workers x {threads} threads "
+            f"({config['worker_class']})"
+        )
+        if settings.DEBUG:
+            self.stderr.write("DEBUG=True: não use em produção.")
+        if options["check"]:
+            return
+
+        if importlib.util.find_spec("gunicorn") is None:
+            raise CommandError("gunicorn não está instalado (pip install -r requirements.txt).")
+        if interface == "asgi" and importlib.util.find_spec("uvicorn_worker") is None:
+            raise CommandError("O modo ASGI precisa de uvicorn-worker (pip install -r requirements.txt).")
+
+        from gunicorn.app.base import BaseApplication
+
+        command = self
+
+        class Server(BaseApplication):
+            def load_config(self):
+                for key, value in config.items():
+                    if value is not None:
+                        self.cfg.set(key, value)
+
+            def load(self):
+                # Com preload_app roda uma vez, no mestre, antes de abrir a porta
+                if interface == "asgi":
+                    from django.core.asgi import get_asgi_application
+                    application = get_asgi_application()
+                else:
+                    from django.core.wsgi import get_wsgi_application
+                    application = get_wsgi_application()
+                if not options["no_warmup"]:
+                    for etapa, itens, segundos in warmup():
+                        status = "falhou" if itens is None else f"{itens} itens"
+                        command.stdout.write(f"Aquecimento {etapa}: {status} em {segundos * 1000:.0f} ms")
+                return application
+
+        Server().run()
@@ -0,0 +1,284 @@
+# metrics.py
+"""
+Métricas no formato texto do Prometheus, expostas pela própria aplicação em /metrics.
+
+Os valores ficam em um arquivo SQLite local (`METRICS_DB_PATH`) compartilhado por
+todos os workers do gunicorn: cada incremento é um UPSERT atômico, então a soma é
+correta entre processos sem depender de serviço externo. Durante uma requisição os
+incrementos são acumulados em memória e gravados em uma única transação no final
+(ver MetricsMiddleware); sob ASGI essa gravação roda fora do event loop
+(`abuffered()`), pois pode esperar até 5 s pelo lock do SQLite.
+"""
+import contextvars
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# nome -> (tipo, descrição)
+METRICS = {
+    "http_requests_total": ("counter", "Requisições HTTP por rota, método e status."),
+    "http_request_duration_seconds": ("histogram", "Latência das requisições HTTP em segundos."),
+    "http_request_db_queries_total": ("counter", "Consultas SQL executadas pelas requisições HTTP."),
+    "throttle_rejections_total": ("counter", "Requisições rejeitadas pelo throttle, por escopo."),
+    "cache_requests_total": ("counter", "Leituras de cache por cache e resultado (hit/miss)."),
+    "db_pool_size": ("gauge", "Conexões abertas no pool, por worker."),
+    "db_pool_max_size": ("gauge", "Tamanho máximo do pool, por worker."),
+    "db_pool_in_use": ("gauge", "Conexões do pool em uso, por worker."),
+    "db_pool_waiting": ("gauge", "Requisições aguardando uma conexão do pool, por worker."),
+    "db_pool_requests_total": ("counter", "Conexões pedidas ao pool."),
+    "db_pool_requests_queued_total": ("counter", "Pedidos ao pool que precisaram esperar."),
+    "db_pool_acquire_wait_seconds_total": ("counter", "Tempo total de espera por uma conexão do pool."),
+    "db_pool_acquire_errors_total": ("counter", "Pedidos ao pool que falharam (timeout)."),
+    "db_pool_connections_opened_total": ("counter", "Conexões físicas abertas pelo pool."),
+    "db_pool_connections_lost_total": ("counter", "Conexões do pool perdidas (falha no health check)."),
+    "db_pool_returns_bad_total": ("counter", "Conexões devolvidas ao pool em estado inválido."),
+    "email_outbox_messages_total": ("counter", "Mensagens processadas pela fila de e-mail, por resultado."),
+    "login_requests_total": ("counter", "Pedidos de login por resultado."),
+    "login_hash_queued_total": ("counter", "Verificações de senha que esperaram na fila do pool."),
+    "login_hash_pending": ("gauge", "Verificações de senha na fila ou em execução, por worker."),
+    "login_hash_running": ("gauge", "Verificações de senha em execução, por worker."),
+    "login_hash_wait_seconds": ("histogram", "Espera na fila do pool de verificação de senha."),
+    "login_hash_duration_seconds": ("histogram", "Duração da verificação do hash da senha."),
+}
+
+_buffer = contextvars.ContextVar("metrics_buffer", default=None)
+
+
+def format_labels(labels):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+    return ",".join(f'{key}="{escape(value)}"' for key, value in sorted(labels.items()))
+
+
+class MetricsStore:
+    """
+    Armazena amostras no SQLite: (nome, labels) -> valor.
+
+    Contadores e histogramas somam; gauges substituem o valor e carregam o label `pid`,
+    para que gauges de workers que já morreram possam ser descartados na coleta.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._pid = None
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        # Conexões SQLite não sobrevivem a um fork: reabre quando o pid muda
+        if self._conn is None or self._pid != os.getpid():
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS samples ("
+                " name TEXT NOT NULL, labels TEXT NOT NULL, kind TEXT NOT NULL, value REAL NOT NULL,"
+                " PRIMARY KEY (name, labels))"
+            )
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def write(self, samples):
+        """
+        Grava uma lista de (tipo, nome, labels, valor) em uma transação.
+        """
+        if not samples:
+            return
+        adds = [(name, labels, kind, value) for kind, name, labels, value in samples if kind != "gauge"]
+        sets = [(name, labels, kind, value) for kind, name, labels, value in samples if kind == "gauge"]
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if adds:
+                    conn.executemany(
+                        "INSERT INTO samples (name, labels, kind, value) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value",
+                        adds,
+                    )
+                if sets:
+                    conn.executemany(
+                        "INSERT INTO samples (name, labels, kind, value) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (name, labels) DO UPDATE SET value = excluded.value",
+                        sets,
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def collect(self):
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute("SELECT name, labels, kind, value FROM samples ORDER BY name, labels").fetchall()
+            dead = [(name, labels) for name, labels, kind, _ in rows if kind == "gauge" and not _pid_alive(labels)]
+            if dead:
+                conn.executemany("DELETE FROM samples WHERE name = ? AND labels = ?", dead)
+        dead = set(dead)
+        return [row for row in rows if (row[0], row[1]) not in dead]
+
+    def clear(self):
+        with self._lock:
+            self._connection().execute("DELETE FROM samples")
+
+
+def _pid_alive(labels):
+    for part in labels.split(","):
+        if part.startswith('pid="'):
+            try:
+                os.kill(int(part[5:-1]), 0)
+            except ProcessLookupError:
+                return False
+            except (ValueError, PermissionError):
+                return True
+    return True
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    path = str(settings.METRICS_DB_PATH)
+    if _store is None or _store.path != path:
+        with _store_lock:
+            if _store is None or _store.path != path:
+                _store = MetricsStore(path)
+    return _store
+
+
+def _record(samples):
+    if not settings.METRICS_ENABLED:
+        return
+    buffer = _buffer.get()
+    if buffer is not None:
+        buffer.extend(samples)
+        return
+    try:
+        get_store().write(samples)
+    except sqlite3.Error:
+        logger.exception("Falha ao gravar métricas")
+
+
+def inc(name, labels=None, value=1.0):
+    _record([("counter", name, format_labels(labels or {}), value)])
+
+
+def observe(name, value, labels=None, buckets=DEFAULT_BUCKETS):
+    labels = labels or {}
+    samples = [
+        ("histogram", f"{name}_bucket", format_labels({**labels, "le": _format_value(le)}), 1.0)
+        for le in buckets if value <= le
+    ]
+    samples += [
+        ("histogram", f"{name}_bucket", format_labels({**labels, "le": "+Inf"}), 1.0),
+        ("histogram", f"{name}_sum", format_labels(labels), value),
+        ("histogram", f"{name}_count", format_labels(labels), 1.0),
+    ]
+    _record(samples)
+
+
+def set_gauge(name, value, labels=None):
+    """
+    Define um gauge do processo atual (recebe automaticamente o label `pid`).
+    """
+    _record([("gauge", name, format_labels({**(labels or {}), "pid": os.getpid()}), value)])
+
+
+def record_cache(cache_name, hit):
+    inc("cache_requests_total", {"cache": cache_name, "result": "hit" if hit else "miss"})
+
+
+def _write(samples):
+    if samples and settings.METRICS_ENABLED:
+        try:
+            get_store().write(samples)
+        except sqlite3.Error:
+            logger.exception("Falha ao gravar métricas")
+
+
+@contextmanager
+def buffered():
+    """
+    Acumula os incrementos feitos no bloco e grava todos em uma transação ao sair.
+    """
+    samples = []
+    token = _buffer.set(samples)
+    try:
+        yield samples
+    finally:
+        _buffer.reset(token)
+        _write(samples)
+
+
+@asynccontextmanager
+async def abuffered():
+    """
+    Como `buffered()`, mas a gravação roda em uma thread, sem bloquear o event loop.
+    """
+    samples = []
+    token = _buffer.set(samples)
+    try:
+        yield samples
+    finally:
+        _buffer.reset(token)
+        if samples:
+            await sync_to_async(_write, thread_sensitive=False)(samples)
+
+
+@contextmanager
+def unbuffered():
+    """
+    Grava direto no store os incrementos feitos no bloco, mesmo dentro de `buffered()`.
+    """
+    token = _buffer.set(None)
+    try:
+        yield
+    finally:
+        _buffer.reset(token)
+
+
+def _format_value(value):
+    if value == int(value):
+        return f"{value:.1f}"
+    return repr(value)
+
+
+def _base_name(name):
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and METRICS.get(name[: -len(suffix)], ("",))[0] == "histogram":
+            return name[: -len(suffix)]
+    return name
+
+
+def render_prometheus():
+    """
+    Gera o texto de exposição do Prometheus com todas as amostras do store.
+    """
+    lines = []
+    described = set()
+    for name, labels, kind, value in get_store().collect():
+        base = _base_name(name)
+        if base not in described:
+            described.add(base)
+            kind_declared, help_text = METRICS.get(base, (kind, ""))
+            if help_text:
+                lines.append(f"# HELP {base} {help_text}")
+            lines.append(f"# TYPE {base} {kind_declared}")
+        sample = f"{name}{{{labels}}}" if labels else name
+        lines.append(f"{sample} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
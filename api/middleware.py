@@ -0,0 +1,341 @@
+# middleware.py
+import cProfile
+import json
+import logging
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from fnmatch import translate
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS
+
+from . import db_routers, metrics
+from .authentication import CachedJWTAuthentication
+from .db_pool import record_pool_metrics
+from .instrumentation import QueryCounter, RequestTiming
+
+
+timing_logger = logging.getLogger("api.timing")
+profiling_logger = logging.getLogger("api.profiling")
+
+
+class HybridMiddlewareMixin:
+    """
+    Middleware síncrono e assíncrono: sob ASGI a cadeia continua assíncrona e
+    as views async (ex.: login) não passam por uma thread só por causa dele.
+    A subclasse implementa `__call__` (WSGI) e `__acall__` (ASGI).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def _set_mode(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+
+class ServerTimingMiddleware(HybridMiddlewareMixin):
+    """
+    Mede consultas SQL, tempo de SQL, view, serialização e render por requisição
+    e expõe os valores no cabeçalho `Server-Timing` e em uma linha de log JSON.
+
+    Ativado por rota (`SERVER_TIMING_ROUTES`, aceita curingas como `enviomaterial-*`)
+    ou por amostragem (`SERVER_TIMING_SAMPLE_RATE`, de 0 a 1). Sem nenhum dos dois,
+    o middleware é removido da cadeia na inicialização.
+    """
+
+    def __init__(self, get_response):
+        self._set_mode(get_response)
+        routes = list(getattr(settings, "SERVER_TIMING_ROUTES", []))
+        self.sample_rate = float(getattr(settings, "SERVER_TIMING_SAMPLE_RATE", 0.0))
+        if not routes and self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.route_pattern = re.compile("|".join(translate(route) for route in routes)) if routes else None
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self._after(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._after(request, await self.get_response(request))
+
+    def _after(self, request, response):
+        timing = getattr(request, "_server_timing", None)
+        if timing is None:
+            return response
+        try:
+            self._finish(request, response, timing)
+        finally:
+            timing.stop()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        route = request.resolver_match.view_name if request.resolver_match else None
+        if (self.route_pattern and route and self.route_pattern.match(route)) or (
+            self.sample_rate and random.random() < self.sample_rate
+        ):
+            timing = RequestTiming(route)
+            request._server_timing = timing
+            timing.start()
+
+    def process_template_response(self, request, response):
+        timing = getattr(request, "_server_timing", None)
+        if timing is not None:
+            # O render acontece logo depois deste hook; o que veio antes é tempo de view
+            timing.render_started_at = time.perf_counter()
+        return response
+
+    def _finish(self, request, response, timing):
+        end = time.perf_counter()
+        render_start = getattr(timing, "render_started_at", end)
+        metrics = {
+            "db": timing.sql_time * 1000,
+            "view": (render_start - timing.started_at) * 1000,
+            "ser": timing.spans.get("serialize", 0.0) * 1000,
+            "render": (end - render_start) * 1000,
+            "total": (end - timing.started_at) * 1000,
+        }
+        header = ", ".join(
+            f'db;dur={metrics["db"]:.2f};desc="{timing.queries} queries"' if name == "db"
+            else f"{name};dur={value:.2f}"
+            for name, value in metrics.items()
+        )
+        existing = response.get("Server-Timing")
+        response["Server-Timing"] = f"{existing}, {header}" if existing else header
+
+        timing_logger.info(json.dumps({
+            "event": "server_timing",
+            "route": timing.route,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "queries": timing.queries,
+            **{f"{name}_ms": round(value, 2) for name, value in metrics.items()},
+        }))
+
+
+class MetricsMiddleware(HybridMiddlewareMixin):
+    """
+    Registra contagem, latência e consultas SQL de cada requisição por rota
+    (nome da URL), método e status. Os incrementos feitos durante a requisição
+    (cache, throttle) são gravados junto, em uma única transação.
+
+    Rotas que não resolvem (404 do resolver) são agrupadas em `unmatched` para
+    não explodir a cardinalidade dos labels.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self._set_mode(get_response)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        counter = QueryCounter()
+        with metrics.buffered():
+            start = time.perf_counter()
+            counter.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                counter.stop()
+            self._record(request, response, counter, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        async with metrics.abuffered():
+            start = time.perf_counter()
+            counter.start()
+            try:
+                response = await self.get_response(request)
+            finally:
+                counter.stop()
+            self._record(request, response, counter, time.perf_counter() - start)
+        return response
+
+    def _record(self, request, response, counter, duration):
+        match = request.resolver_match
+        labels = {
+            "route": match.view_name if match else "unmatched",
+            "method": request.method,
+            "status": response.status_code,
+        }
+        metrics.inc("http_requests_total", labels)
+        metrics.observe("http_request_duration_seconds", duration, {"route": labels["route"], "method": request.method})
+        if counter.queries:
+            metrics.inc("http_request_db_queries_total", {"route": labels["route"]}, counter.queries)
+        record_pool_metrics()
+
+
+class ReplicaStickyMiddleware(HybridMiddlewareMixin):
+    """
+    Mantém as leituras do usuário no primário por `REPLICA_STICKY_SECONDS` depois de
+    qualquer requisição que escreve (ver api/db_routers.py).
+
+    Conta como escrita o que passa pelo roteador (`db_for_write`) e as requisições com
+    método não seguro que terminam sem erro, que cobrem o SQL direto (upsert,
+    gerar-pendentes). Sem réplica configurada, o middleware sai da cadeia.
+    """
+
+    def __init__(self, get_response):
+        if not db_routers.replica_enabled():
+            raise MiddlewareNotUsed
+        self._set_mode(get_response)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state, token = db_routers.begin_request()
+        try:
+            response = self.get_response(request)
+            self._after(request, response, state)
+        finally:
+            db_routers.end_request(state, token)
+        return response
+
+    async def __acall__(self, request):
+        state, token = db_routers.begin_request()
+        try:
+            response = await self.get_response(request)
+            if self._wrote(request, response, state):
+                # request.user da sessão é carregado sob demanda do banco: fora do event loop
+                await sync_to_async(self._after)(request, response, state)
+        finally:
+            db_routers.end_request(state, token)
+        return response
+
+    def _wrote(self, request, response, state):
+        return state.wrote or (request.method not in SAFE_METHODS and response.status_code < 400)
+
+    def _after(self, request, response, state):
+        if not self._wrote(request, response, state):
+            return
+        state.wrote = True
+        if state.user_id is None:
+            # As views DRF repassam o usuário autenticado (JWT) ao HttpRequest
+            user = getattr(request, "user", None)
+            if user is not None and user.is_authenticated:
+                state.user_id = user.pk
+
+
+class ProfilingMiddleware(HybridMiddlewareMixin):
+    """
+    Executa a requisição sob cProfile quando um usuário staff envia o cabeçalho
+    `X-Profile` ou o parâmetro `?_profile=`:
+
+    - `1`: grava `PROFILE_DIR/<rota>-<data>.prof` e devolve o nome em `X-Profile-File`;
+    - `download`: devolve o próprio arquivo .prof (abre com `python -m pstats` ou snakeviz).
+
+    O usuário vem da sessão ou do token JWT; para quem não é staff ativo o pedido é
+    ignorado. Apenas um perfil roda por vez em cada processo.
+
+    Sob ASGI o cProfile só enxerga a thread do event loop: o código síncrono das
+    views roda em outra thread e não aparece no perfil.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self._set_mode(get_response)
+        self.profile_dir = Path(settings.PROFILE_DIR)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        mode = self._requested_mode(request)
+        if mode is None or not self._is_staff(request):
+            return self.get_response(request)
+        if not self._lock.acquire(blocking=False):
+            response = self.get_response(request)
+            response["X-Profile"] = "busy"
+            return response
+
+        try:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                # O render das respostas DRF acontece dentro de get_response
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        finally:
+            self._lock.release()
+        return self._finish(request, response, profiler, mode)
+
+    async def __acall__(self, request):
+        mode = self._requested_mode(request)
+        # request.user é carregado sob demanda do banco: fora do event loop
+        if mode is None or not await sync_to_async(self._is_staff)(request):
+            return await self.get_response(request)
+        if not self._lock.acquire(blocking=False):
+            response = await self.get_response(request)
+            response["X-Profile"] = "busy"
+            return response
+
+        try:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                response = await self.get_response(request)
+            finally:
+                profiler.disable()
+        finally:
+            self._lock.release()
+        return self._finish(request, response, profiler, mode)
+
+    def _requested_mode(self, request):
+        mode = request.headers.get("X-Profile") or request.GET.get("_profile")
+        return mode if mode in ("1", "download") else None
+
+    def _finish(self, request, response, profiler, mode):
+        path = self._save(request, profiler)
+        profiling_logger.info(json.dumps({
+            "event": "profile",
+            "path": request.path,
+            "status": response.status_code,
+            "file": path.name,
+        }))
+        if mode == "download":
+            download = HttpResponse(path.read_bytes(), content_type="application/octet-stream")
+            download["Content-Disposition"] = f'attachment; filename="{path.name}"'
+            download["X-Profile-Status"] = response.status_code
+            return download
+        response["X-Profile-File"] = path.name
+        return response
+
+    def _is_staff(self, request):
+        user = getattr(request, "user", None)
+        if user is None or not user.is_authenticated:
+            try:
+                authenticated = CachedJWTAuthentication().authenticate(request)
+            except AuthenticationFailed:
+                return False
+            user = authenticated[0] if authenticated else None
+        return bool(user and user.is_active and user.is_staff)
+
+    def _save(self, request, profiler):
+        try:
+            route = resolve(request.path_info).view_name
+        except Resolver404:
+            route = "unmatched"
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        route = re.sub(r"[^\w.-]", "_", route)
+        path = self.profile_dir / f"{route}-{datetime.now():%Y%m%d-%H%M%S-%f}.prof"
+        profiler.dump_stats(path)
+        return path
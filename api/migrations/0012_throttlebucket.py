@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_rename_id_envio_enviomaterial_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThrottleBucket',
+            fields=[
+                ('chave', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='Chave')),
+                ('tokens', models.FloatField(verbose_name='Tokens Disponíveis')),
+                ('permitido', models.BooleanField(default=True, verbose_name='Última Requisição Permitida')),
+                ('atualizado_em', models.DateTimeField(verbose_name='Atualizado em')),
+            ],
+            options={
+                'verbose_name': 'Balde de Throttle',
+                'verbose_name_plural': 'Baldes de Throttle',
+                'db_table': 'Throttle_bucket',
+            },
+        ),
+    ]
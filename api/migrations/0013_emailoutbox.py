@@ -0,0 +1,36 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_throttlebucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailOutbox',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('destinatario', models.EmailField(max_length=254, verbose_name='Destinatário')),
+                ('assunto', models.CharField(max_length=255, verbose_name='Assunto')),
+                ('corpo', models.TextField(verbose_name='Corpo')),
+                ('anexo', models.CharField(blank=True, max_length=500, verbose_name='Anexo (arquivo no spool)')),
+                ('anexo_nome', models.CharField(blank=True, max_length=255, verbose_name='Nome do Anexo')),
+                ('anexo_tipo', models.CharField(blank=True, max_length=100, verbose_name='Tipo do Anexo')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('enviado', 'Enviado'), ('falhou', 'Falhou')], default='pendente', max_length=20, verbose_name='Status')),
+                ('tentativas', models.PositiveSmallIntegerField(default=0, verbose_name='Tentativas')),
+                ('proxima_tentativa_em', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próxima Tentativa em')),
+                ('ultimo_erro', models.TextField(blank=True, verbose_name='Último Erro')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('enviado_em', models.DateTimeField(blank=True, null=True, verbose_name='Enviado em')),
+            ],
+            options={
+                'verbose_name': 'E-mail na Fila',
+                'verbose_name_plural': 'E-mails na Fila',
+                'db_table': 'Email_outbox',
+                'indexes': [models.Index(condition=models.Q(('status', 'pendente')), fields=['proxima_tentativa_em'], name='email_outbox_pendentes')],
+            },
+        ),
+    ]
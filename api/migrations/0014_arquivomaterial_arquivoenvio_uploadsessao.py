@@ -0,0 +1,64 @@
+import uuid
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArquivoMaterial',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='SHA-256')),
+                ('tamanho', models.BigIntegerField(verbose_name='Tamanho (bytes)')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+            ],
+            options={
+                'verbose_name': 'Arquivo de Material',
+                'verbose_name_plural': 'Arquivos de Material',
+                'db_table': 'Arquivo_material',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArquivoEnvio',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('nome', models.CharField(max_length=255, verbose_name='Nome do Arquivo')),
+                ('tipo', models.CharField(blank=True, max_length=100, verbose_name='Tipo do Conteúdo')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Enviado em')),
+                ('id_arquivo', models.ForeignKey(db_column='Id_Arquivo', on_delete=django.db.models.deletion.PROTECT, to='api.arquivomaterial', verbose_name='Arquivo')),
+                ('id_envio', models.ForeignKey(db_column='Id_Envio', on_delete=django.db.models.deletion.CASCADE, related_name='arquivos', to='api.enviomaterial', verbose_name='Envio de Material')),
+                ('id_usuario', models.ForeignKey(blank=True, db_column='Id_Usuario', null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Enviado por')),
+            ],
+            options={
+                'verbose_name': 'Arquivo do Envio',
+                'verbose_name_plural': 'Arquivos do Envio',
+                'db_table': 'Arquivo_envio',
+            },
+        ),
+        migrations.CreateModel(
+            name='UploadSessao',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nome', models.CharField(max_length=255, verbose_name='Nome do Arquivo')),
+                ('tipo', models.CharField(blank=True, max_length=100, verbose_name='Tipo do Conteúdo')),
+                ('tamanho', models.BigIntegerField(verbose_name='Tamanho Total (bytes)')),
+                ('recebido', models.BigIntegerField(default=0, verbose_name='Bytes Recebidos')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('atualizado_em', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+                ('id_envio', models.ForeignKey(db_column='Id_Envio', on_delete=django.db.models.deletion.CASCADE, to='api.enviomaterial', verbose_name='Envio de Material')),
+                ('id_usuario', models.ForeignKey(db_column='Id_Usuario', on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'verbose_name': 'Sessão de Upload',
+                'verbose_name_plural': 'Sessões de Upload',
+                'db_table': 'Upload_sessao',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_arquivomaterial_arquivoenvio_uploadsessao'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='enviomaterial',
+            index=models.Index(condition=models.Q(('data_envio_escola__isnull', False)), fields=['data_envio_escola', 'id_status'], name='envio_serie_escola'),
+        ),
+        migrations.AddIndex(
+            model_name='enviomaterial',
+            index=models.Index(condition=models.Q(('data_validacao_gerencia__isnull', False)), fields=['data_validacao_gerencia', 'id_status'], name='envio_serie_validacao'),
+        ),
+        migrations.AddIndex(
+            model_name='enviomaterial',
+            index=models.Index(condition=models.Q(('data_envio_see__isnull', False)), fields=['data_envio_see', 'id_status'], name='envio_serie_see'),
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_enviomaterial_serie_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='enviomaterial',
+            index=models.Index(fields=['ano_referencia', 'id_usuario', 'id_disciplina', 'id_etapa', 'mes_referencia'], name='envio_atribuicao_periodo'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+CHAVE = ['ano_referencia', 'id_usuario', 'id_disciplina', 'id_etapa', 'mes_referencia']
+
+
+def verificar_duplicados(apps, schema_editor):
+    """
+    A restrição falharia com envios repetidos: interrompe com a lista, para
+    que sejam revisados (e mesclados ou removidos) antes de migrar.
+    """
+    EnvioMaterial = apps.get_model('api', 'EnvioMaterial')
+    duplicados = list(
+        EnvioMaterial.objects.using(schema_editor.connection.alias)
+        .values(*CHAVE).annotate(total=Count('id')).filter(total__gt=1).order_by(*CHAVE)[:20]
+    )
+    if duplicados:
+        linhas = "\n".join(
+            f"  ano={d['ano_referencia']} mes={d['mes_referencia']} usuario={d['id_usuario']} "
+            f"disciplina={d['id_disciplina']} etapa={d['id_etapa']}: {d['total']} envios"
+            for d in duplicados
+        )
+        raise RuntimeError(
+            "Há envios repetidos para o mesmo professor, disciplina, etapa e mês "
+            f"(até 20 listados):\n{linhas}\nResolva-os antes de aplicar a restrição envio_chave_natural."
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_enviomaterial_atribuicao_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(verificar_duplicados, migrations.RunPython.noop),
+        # A restrição cria um índice único nas mesmas colunas, na mesma ordem, e
+        # passa a atender a matriz de conformidade. O índice da 0016 foi mantido
+        # porque ela já pode estar aplicada nos bancos: reescrever as duas
+        # migrações deixaria esses bancos com o índice sobrando ou sem a restrição
+        migrations.RemoveIndex(
+            model_name='enviomaterial',
+            name='envio_atribuicao_periodo',
+        ),
+        migrations.AddConstraint(
+            model_name='enviomaterial',
+            constraint=models.UniqueConstraint(fields=['ano_referencia', 'id_usuario', 'id_disciplina', 'id_etapa', 'mes_referencia'], name='envio_chave_natural'),
+        ),
+    ]
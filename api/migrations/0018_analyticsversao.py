@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_enviomaterial_chave_natural'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsVersao',
+            fields=[
+                ('chave', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Chave')),
+                ('versao', models.BigIntegerField(default=0, verbose_name='Versão')),
+            ],
+            options={
+                'verbose_name': 'Versão do Cache Analítico',
+                'verbose_name_plural': 'Versões do Cache Analítico',
+                'db_table': 'Analytics_versao',
+            },
+        ),
+    ]
@@ -1,4 +1,6 @@
 # models.py
+import uuid
+
 from django.db import models
 from django.core.validators import RegexValidator
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
@@ -251,8 +253,42 @@ class EnvioMaterial(BaseModel):
         db_table = 'Envio_material'
         verbose_name = "Envio de Material"
         verbose_name_plural = "Envios de Material"
-        # Add unique constraint to prevent duplicate submissions
+        indexes = [
+            # Séries temporais (api/analytics.py): o intervalo de datas e o status saem
+            # do próprio índice; envios ainda sem a data ficam de fora
+            models.Index(
+                fields=['data_envio_escola', 'id_status'], name='envio_serie_escola',
+                condition=models.Q(data_envio_escola__isnull=False),
+            ),
+            models.Index(
+                fields=['data_validacao_gerencia', 'id_status'], name='envio_serie_validacao',
+                condition=models.Q(data_validacao_gerencia__isnull=False),
+            ),
+            models.Index(
+                fields=['data_envio_see', 'id_status'], name='envio_serie_see',
+                condition=models.Q(data_envio_see__isnull=False),
+            ),
+        ]
+        constraints = [
+            # Chave natural: um envio por professor, disciplina, etapa e mês. O índice
+            # também serve a matriz de conformidade (api/conformidade.py), na ordem
+            # ano, professor, disciplina, etapa, mês
+            models.UniqueConstraint(
+                fields=['ano_referencia', 'id_usuario', 'id_disciplina', 'id_etapa', 'mes_referencia'],
+                name='envio_chave_natural',
+            ),
+        ]
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Período com que o envio foi lido: se o mês/ano mudar, o cache analítico
+        # do período antigo também é descartado (api/signals.py)
+        instance._periodo_carregado = (
+            instance.__dict__.get("ano_referencia"), instance.__dict__.get("mes_referencia"),
+        )
+        return instance
+
     def __str__(self):
         return f"Envio {self.id} - {self.id_disciplina} - {self.mes_referencia}/{self.ano_referencia}"
     
@@ -260,4 +296,175 @@ class EnvioMaterial(BaseModel):
     def mes_referencia_display(self):
         """Returns the month name in Portuguese"""
         months = dict(self.MONTH_CHOICES)
-        return months.get(self.mes_referencia, self.mes_referencia)
\ No newline at end of file
+        return months.get(self.mes_referencia, self.mes_referencia)
+
+class ThrottleBucket(models.Model):
+    """
+    Balde de tokens do throttle, compartilhado por todos os workers.
+    Atualizado com um único UPSERT por verificação (ver api/throttling.py).
+    """
+    chave = models.CharField(max_length=255, primary_key=True, verbose_name="Chave")
+    tokens = models.FloatField(verbose_name="Tokens Disponíveis")
+    permitido = models.BooleanField(default=True, verbose_name="Última Requisição Permitida")
+    atualizado_em = models.DateTimeField(verbose_name="Atualizado em")
+
+    class Meta:
+        db_table = 'Throttle_bucket'
+        verbose_name = "Balde de Throttle"
+        verbose_name_plural = "Baldes de Throttle"
+
+    def __str__(self):
+        return f"{self.chave}: {self.tokens:.2f}"
+
+
+class AnalyticsVersao(models.Model):
+    """
+    Versão dos dados do cache analítico (geral e por período), incrementada no
+    banco com um único UPSERT: atômica entre workers (ver api/analytics.py).
+    """
+    chave = models.CharField(max_length=64, primary_key=True, verbose_name="Chave")
+    versao = models.BigIntegerField(default=0, verbose_name="Versão")
+
+    class Meta:
+        db_table = 'Analytics_versao'
+        verbose_name = "Versão do Cache Analítico"
+        verbose_name_plural = "Versões do Cache Analítico"
+
+    def __str__(self):
+        return f"{self.chave}: {self.versao}"
+
+
+class EmailOutbox(models.Model):
+    """
+    Fila de e-mails a enviar. A requisição só grava a mensagem (e o anexo em
+    EMAIL_SPOOL_DIR); o comando send_outbox envia em lotes (ver api/outbox.py).
+    """
+    PENDENTE = 'pendente'
+    ENVIADO = 'enviado'
+    FALHOU = 'falhou'
+    STATUS_CHOICES = [
+        (PENDENTE, 'Pendente'),
+        (ENVIADO, 'Enviado'),
+        (FALHOU, 'Falhou'),
+    ]
+
+    id = models.AutoField(primary_key=True)
+    destinatario = models.EmailField(verbose_name="Destinatário")
+    assunto = models.CharField(max_length=255, verbose_name="Assunto")
+    corpo = models.TextField(verbose_name="Corpo")
+    anexo = models.CharField(max_length=500, blank=True, verbose_name="Anexo (arquivo no spool)")
+    anexo_nome = models.CharField(max_length=255, blank=True, verbose_name="Nome do Anexo")
+    anexo_tipo = models.CharField(max_length=100, blank=True, verbose_name="Tipo do Anexo")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDENTE, verbose_name="Status")
+    tentativas = models.PositiveSmallIntegerField(default=0, verbose_name="Tentativas")
+    proxima_tentativa_em = models.DateTimeField(default=timezone.now, verbose_name="Próxima Tentativa em")
+    ultimo_erro = models.TextField(blank=True, verbose_name="Último Erro")
+    criado_em = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+    enviado_em = models.DateTimeField(blank=True, null=True, verbose_name="Enviado em")
+
+    class Meta:
+        db_table = 'Email_outbox'
+        verbose_name = "E-mail na Fila"
+        verbose_name_plural = "E-mails na Fila"
+        indexes = [
+            # A fila só consulta as pendentes: o índice não cresce com o histórico
+            models.Index(
+                fields=['proxima_tentativa_em'],
+                name='email_outbox_pendentes',
+                condition=models.Q(status='pendente'),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.assunto} -> {self.destinatario} ({self.status})"
+
+
+class ArquivoMaterial(models.Model):
+    """
+    Conteúdo de um arquivo de material, endereçado pelo SHA-256: arquivos
+    idênticos são gravados uma única vez (ver api/storage.py).
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True, verbose_name="SHA-256")
+    tamanho = models.BigIntegerField(verbose_name="Tamanho (bytes)")
+    criado_em = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+
+    class Meta:
+        db_table = 'Arquivo_material'
+        verbose_name = "Arquivo de Material"
+        verbose_name_plural = "Arquivos de Material"
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.tamanho} bytes)"
+
+
+class ArquivoEnvio(models.Model):
+    """
+    Arquivo anexado a um envio de material, com o nome original.
+    """
+    id = models.AutoField(primary_key=True)
+    id_envio = models.ForeignKey(
+        EnvioMaterial,
+        on_delete=models.CASCADE,
+        db_column='Id_Envio',
+        related_name='arquivos',
+        verbose_name="Envio de Material"
+    )
+    id_arquivo = models.ForeignKey(
+        ArquivoMaterial,
+        on_delete=models.PROTECT,
+        db_column='Id_Arquivo',
+        verbose_name="Arquivo"
+    )
+    id_usuario = models.ForeignKey(
+        Usuario,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        db_column='Id_Usuario',
+        verbose_name="Enviado por"
+    )
+    nome = models.CharField(max_length=255, verbose_name="Nome do Arquivo")
+    tipo = models.CharField(max_length=100, blank=True, verbose_name="Tipo do Conteúdo")
+    criado_em = models.DateTimeField(auto_now_add=True, verbose_name="Enviado em")
+
+    class Meta:
+        db_table = 'Arquivo_envio'
+        verbose_name = "Arquivo do Envio"
+        verbose_name_plural = "Arquivos do Envio"
+
+    def __str__(self):
+        return self.nome
+
+
+class UploadSessao(models.Model):
+    """
+    Upload retomável em andamento: os blocos são gravados em um arquivo parcial
+    até completar `tamanho` bytes (ver api/storage.py).
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id_envio = models.ForeignKey(
+        EnvioMaterial,
+        on_delete=models.CASCADE,
+        db_column='Id_Envio',
+        verbose_name="Envio de Material"
+    )
+    id_usuario = models.ForeignKey(
+        Usuario,
+        on_delete=models.CASCADE,
+        db_column='Id_Usuario',
+        verbose_name="Usuário"
+    )
+    nome = models.CharField(max_length=255, verbose_name="Nome do Arquivo")
+    tipo = models.CharField(max_length=100, blank=True, verbose_name="Tipo do Conteúdo")
+    tamanho = models.BigIntegerField(verbose_name="Tamanho Total (bytes)")
+    recebido = models.BigIntegerField(default=0, verbose_name="Bytes Recebidos")
+    criado_em = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+    atualizado_em = models.DateTimeField(auto_now=True, verbose_name="Atualizado em")
+
+    class Meta:
+        db_table = 'Upload_sessao'
+        verbose_name = "Sessão de Upload"
+        verbose_name_plural = "Sessões de Upload"
+
+    def __str__(self):
+        return f"{self.nome}: {self.recebido}/{self.tamanho}"
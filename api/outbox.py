@@ -0,0 +1,163 @@
+# outbox.py
+"""
+Fila de e-mails no banco (model EmailOutbox).
+
+A requisição só grava o anexo em EMAIL_SPOOL_DIR (em blocos, sem carregar o
+arquivo em memória) e insere a mensagem; o envio fica com o comando
+`send_outbox`, que processa lotes sobre uma única conexão SMTP.
+
+O lote é reservado em uma transação curta: `SELECT ... FOR UPDATE SKIP LOCKED`
+e `proxima_tentativa_em` adiada por EMAIL_OUTBOX_LEASE_SECONDS, então vários
+workers podem rodar em paralelo sem enviar a mesma mensagem e nenhuma linha
+fica bloqueada durante o SMTP. Os resultados são gravados em outra transação,
+depois do envio. A entrega é "pelo menos uma vez": se o worker parar (ou a
+gravação falhar) depois do envio, a mensagem sai de novo quando a reserva vence.
+"""
+import logging
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import EmailOutbox
+
+
+logger = logging.getLogger(__name__)
+
+
+def spool_storage():
+    return FileSystemStorage(location=settings.EMAIL_SPOOL_DIR)
+
+
+def enqueue_email(destinatario, assunto, corpo, anexo=None):
+    """
+    Coloca uma mensagem na fila. `anexo` é um File/UploadedFile, copiado para o spool.
+    """
+    campos = {}
+    if anexo is not None:
+        nome = Path(anexo.name).name
+        campos = {
+            "anexo": spool_storage().save(f"{uuid.uuid4().hex}{Path(nome).suffix[:20]}", anexo),
+            "anexo_nome": nome,
+            "anexo_tipo": getattr(anexo, "content_type", None) or "",
+        }
+    return EmailOutbox.objects.create(destinatario=destinatario, assunto=assunto, corpo=corpo, **campos)
+
+
+def backoff(tentativas):
+    return timedelta(seconds=settings.EMAIL_OUTBOX_BACKOFF_SECONDS * 2 ** (tentativas - 1))
+
+
+def build_message(item, storage):
+    message = EmailMessage(subject=item.assunto, body=item.corpo, to=[item.destinatario])
+    if item.anexo:
+        with storage.open(item.anexo, "rb") as arquivo:
+            message.attach(item.anexo_nome or item.anexo, arquivo.read(), item.anexo_tipo or None)
+    return message
+
+
+def _sent(item, now):
+    item.tentativas += 1
+    item.status = EmailOutbox.ENVIADO
+    item.enviado_em = now
+    item.ultimo_erro = ""
+    metrics.inc("email_outbox_messages_total", {"result": "sent"})
+
+
+def _failed(item, now, error, final=False):
+    item.tentativas += 1
+    item.ultimo_erro = f"{type(error).__name__}: {error}"
+    if final or item.tentativas >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        # O anexo fica no spool para inspeção
+        item.status = EmailOutbox.FALHOU
+        metrics.inc("email_outbox_messages_total", {"result": "failed"})
+    else:
+        item.proxima_tentativa_em = now + backoff(item.tentativas)
+        metrics.inc("email_outbox_messages_total", {"result": "retry"})
+    logger.warning("Falha ao enviar e-mail %s (tentativa %s): %s", item.pk, item.tentativas, item.ultimo_erro)
+
+
+def claim(batch_size, now):
+    """
+    Reserva um lote de mensagens vencidas: ficam fora da fila até a reserva vencer.
+    """
+    with transaction.atomic():
+        items = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status=EmailOutbox.PENDENTE, proxima_tentativa_em__lte=now)
+            .order_by("proxima_tentativa_em")[:batch_size]
+        )
+        if items:
+            EmailOutbox.objects.filter(pk__in=[item.pk for item in items]).update(
+                proxima_tentativa_em=now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE_SECONDS),
+            )
+    return items
+
+
+def send_pending(batch_size=50, connection=None):
+    """
+    Envia um lote de mensagens vencidas. Retorna (enviadas, com falha).
+    """
+    storage = spool_storage()
+    now = timezone.now()
+    items = claim(batch_size, now)
+    if not items:
+        return 0, 0
+
+    # Fora de transação: o SMTP não segura bloqueios no banco
+    connection = connection or get_connection()
+    enviadas = falhas = 0
+    pendentes = iter(items)
+    try:
+        # Uma conexão SMTP para o lote inteiro
+        connection.open()
+        for item in pendentes:
+            try:
+                message = build_message(item, storage)
+            except OSError as e:
+                # Anexo ilegível: falha da mensagem, não do SMTP (a conexão segue aberta).
+                # Sem o arquivo no spool, uma nova tentativa falharia igual
+                _failed(item, now, e, final=isinstance(e, FileNotFoundError))
+                falhas += 1
+                continue
+            try:
+                connection.send_messages([message])
+            except Exception as e:
+                _failed(item, now, e)
+                falhas += 1
+                # A conexão pode ter ficado inválida: reabre para as próximas (send_messages
+                # sem conexão aberta abriria e fecharia uma por mensagem)
+                _close(connection)
+                connection.open()
+            else:
+                _sent(item, now)
+                enviadas += 1
+    except Exception as e:
+        # Servidor indisponível: as mensagens restantes contam como tentativa
+        for item in pendentes:
+            _failed(item, now, e)
+            falhas += 1
+    finally:
+        _close(connection)
+
+    with transaction.atomic():
+        EmailOutbox.objects.bulk_update(
+            items, ["status", "tentativas", "proxima_tentativa_em", "ultimo_erro", "enviado_em"]
+        )
+        for item in items:
+            if item.status == EmailOutbox.ENVIADO and item.anexo:
+                transaction.on_commit(lambda nome=item.anexo: storage.delete(nome))
+    return enviadas, falhas
+
+
+def _close(connection):
+    try:
+        connection.close()
+    except Exception:
+        logger.debug("Erro ao fechar a conexão SMTP", exc_info=True)
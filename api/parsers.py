@@ -0,0 +1,32 @@
+# parsers.py
+"""
+Parsers da API. `FastJSONParser` lê o corpo com orjson e `MessagePackParser`
+lê `application/msgpack`, com as mesmas extensões de data do
+MessagePackRenderer (ver api/renderers.py).
+"""
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+
+from .renderers import msgpack, msgpack_ext_hook, orjson
+
+
+class FastJSONParser(JSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            # orjson já rejeita NaN e Infinity, como o JSONParser com STRICT_JSON
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
+
+
+class MessagePackParser(BaseParser):
+    media_type = "application/msgpack"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            # timestamp=3: a extensão Timestamp volta como datetime em UTC
+            return msgpack.unpackb(stream.read(), ext_hook=msgpack_ext_hook, timestamp=3)
+        except (ValueError, TypeError, OverflowError, msgpack.UnpackException) as exc:
+            raise ParseError(f"MessagePack parse error - {exc}")
@@ -0,0 +1,116 @@
+# pendencias.py
+"""
+Geração dos envios pendentes de um mês.
+
+Não há cadastro de atribuições: cada professor ativo deve um envio por
+(disciplina, etapa) em que teve envio nos 12 meses anteriores ao mês gerado
+(como na matriz de conformidade, api/conformidade.py). `gerar_pendentes` cria
+esses envios com o status Pendente e `data_limite_envio` no dia
+ENVIO_DIA_LIMITE do mês (ou no último dia, em meses mais curtos) em um único
+`INSERT ... SELECT ... ON CONFLICT DO NOTHING`: as atribuições são lidas e
+inseridas no próprio banco, sem montar um objeto por envio no Python (o que,
+com `bulk_create`, levava segundos para dezenas de milhares de linhas), e a
+restrição `envio_chave_natural` descarta os que já existem. Gerar de novo o
+mesmo mês não cria nada e não altera os envios existentes.
+
+O INSERT direto não dispara sinais: o cache das consultas analíticas do
+período é descartado ao final.
+"""
+import calendar
+from datetime import date
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import CharField, DateField, DateTimeField, Q, Value
+from django.utils import timezone
+
+from . import analytics
+from .models import EnvioMaterial, StatusEnvio
+
+
+class GeracaoError(Exception):
+    pass
+
+
+class ResultadoGeracao:
+    def __init__(self, ano, mes, data_limite_envio):
+        self.ano = ano
+        self.mes = mes
+        self.data_limite_envio = data_limite_envio
+        self.esperados = 0
+        self.criados = 0
+
+    @property
+    def existentes(self):
+        return self.esperados - self.criados
+
+    def __str__(self):
+        return (
+            f"{self.mes:02d}/{self.ano}: {self.criados} envios pendentes criados, "
+            f"{self.existentes} já existiam (limite {self.data_limite_envio:%d/%m/%Y})"
+        )
+
+
+def data_limite(ano, mes, dia=None):
+    """
+    Dia `dia` (padrão ENVIO_DIA_LIMITE) de mes/ano, limitado ao fim do mês.
+    """
+    dia = settings.ENVIO_DIA_LIMITE if dia is None else dia
+    return date(ano, mes, min(dia, calendar.monthrange(ano, mes)[1]))
+
+
+def atribuicoes(ano, mes):
+    """
+    (usuario, disciplina, etapa) de professores ativos com envio nos 12 meses anteriores a mes/ano.
+    """
+    return EnvioMaterial.objects.filter(
+        Q(ano_referencia=ano, mes_referencia__lt=mes) | Q(ano_referencia=ano - 1, mes_referencia__gte=mes),
+        id_usuario__is_active=True,
+    ).order_by().values_list("id_usuario", "id_disciplina", "id_etapa").distinct()
+
+
+def gerar_pendentes(ano, mes, dia_limite=None, criado_por=None):
+    """
+    Cria os envios pendentes de mes/ano que ainda não existem. GeracaoError
+    se o status Pendente não estiver cadastrado.
+    """
+    pendente = StatusEnvio.objects.filter(descricao_status__iexact="Pendente").first()
+    if pendente is None:
+        raise GeracaoError('Status "Pendente" não encontrado.')
+
+    resultado = ResultadoGeracao(ano, mes, data_limite(ano, mes, dia_limite))
+    agora = timezone.now()
+    valores = {
+        "id_status": Value(pendente.pk),
+        "mes_referencia": Value(mes),
+        "ano_referencia": Value(ano),
+        "data_limite_envio": Value(resultado.data_limite_envio, output_field=DateField()),
+        "created_by": Value(criado_por, output_field=CharField()),
+        "created_at": Value(agora, output_field=DateTimeField()),
+        "updated_at": Value(agora, output_field=DateTimeField()),
+    }
+    # Anotações com outro nome: os campos do model não podem ser reanotados
+    selecao = atribuicoes(ano, mes).annotate(
+        **{f"novo_{campo}": valor for campo, valor in valores.items()}
+    ).values_list("id_usuario", "id_disciplina", "id_etapa", *(f"novo_{campo}" for campo in valores))
+    select_sql, params = selecao.query.sql_with_params()
+
+    connection = connections[selecao.db]
+    qn = connection.ops.quote_name
+    colunas = ", ".join(
+        qn(EnvioMaterial._meta.get_field(campo).column)
+        for campo in ("id_usuario", "id_disciplina", "id_etapa", *valores)
+    )
+    sql = (
+        f"WITH esperados AS ({select_sql}), novos AS ("
+        f"INSERT INTO {qn(EnvioMaterial._meta.db_table)} ({colunas}) SELECT * FROM esperados "
+        f"ON CONFLICT DO NOTHING RETURNING 1) "
+        f"SELECT (SELECT COUNT(*) FROM esperados), (SELECT COUNT(*) FROM novos)"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        resultado.esperados, resultado.criados = cursor.fetchone()
+
+    if resultado.criados:
+        analytics.invalidate([(ano, mes)])
+    return resultado
@@ -0,0 +1,90 @@
+# renderers.py
+"""
+Renderers da API.
+
+`FastJSONRenderer` gera o JSON com orjson, várias vezes mais rápido que o
+módulo json da biblioteca padrão nas listas grandes de envios. Datas, horas e
+UUID são convertidos pelo próprio orjson; o que ele não conhece (Decimal, lazy
+strings, QuerySet) passa pelo encoder do DRF, como no JSONRenderer. Sem orjson
+instalado, ou quando o cliente pede indentação (API navegável, `; indent=4`),
+o JSONRenderer do DRF é usado.
+
+`MessagePackRenderer` responde `application/msgpack` nas views com
+`MessagePackMixin` (api/views.py), para clientes de sincronização que baixam listas grandes:
+o corpo é menor e decodifica mais rápido que JSON. Datas e horas viram
+inteiros: datetime usa o Timestamp do próprio MessagePack (extensão -1,
+segundos desde a época) e date a extensão DATE_EXT_TYPE, com os dias desde
+1970-01-01.
+"""
+from datetime import date, datetime
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+_encoder = JSONEncoder()
+
+DATE_EXT_TYPE = 1
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b""
+        ret = orjson.dumps(
+            data, default=_encoder.default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z,
+        )
+        # Como o JSONRenderer: U+2028/U+2029 escapados, seguros dentro de <script>
+        if b"\xe2\x80" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
+
+
+# As listas repetem poucas datas distintas: cada uma é convertida uma vez só
+@lru_cache(maxsize=4096)
+def _date_ext(value):
+    return msgpack.ExtType(DATE_EXT_TYPE, msgpack.packb(value.toordinal() - EPOCH_ORDINAL))
+
+
+def msgpack_default(obj):
+    if isinstance(obj, datetime):
+        # datetime com fuso já sai como Timestamp; sem fuso, vale o do projeto
+        return msgpack.Timestamp.from_datetime(timezone.make_aware(obj))
+    if isinstance(obj, date):
+        return _date_ext(obj)
+    return _encoder.default(obj)
+
+
+@lru_cache(maxsize=4096)
+def msgpack_ext_hook(code, data):
+    if code == DATE_EXT_TYPE:
+        return date.fromordinal(EPOCH_ORDINAL + msgpack.unpackb(data))
+    return msgpack.ExtType(code, data)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=msgpack_default, datetime=True)
+
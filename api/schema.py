@@ -0,0 +1,92 @@
+# schema.py
+"""
+Schema OpenAPI gerado uma vez e servido pronto.
+
+Gerar o schema percorre todas as rotas, views e serializers da API (centenas
+de milissegundos); o resultado só muda quando o código muda. O documento é
+gravado em OPENAPI_SCHEMA_FILE pelo comando `build_schema` (versionado junto
+com o código; `build_schema --check` falha se ele estiver desatualizado) e
+lido uma vez por processo. Sem o arquivo, é gerado na primeira requisição (ou
+no aquecimento do `serve`). Cada formato (YAML/JSON) é renderizado uma vez e
+guardado em memória, com o ETag derivado do conteúdo.
+
+A extensão do SimpleJWT no drf-spectacular não reconhece subclasses de
+JWTAuthentication: `CachedJWTScheme` descreve CachedJWTAuthentication (o
+esquema `jwtAuth`, usado no botão "Authorize" do Swagger). Este módulo é
+importado em ApiConfig.ready, para que a extensão esteja registrada antes de
+qualquer geração do schema.
+"""
+import hashlib
+import json
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from rest_framework.utils.encoders import JSONEncoder
+
+
+_document = None
+_lock = threading.Lock()
+
+
+class CachedJWTScheme(SimpleJWTScheme):
+    target_class = "api.authentication.CachedJWTAuthentication"
+
+
+def generate_schema():
+    """
+    Gera o schema a partir do código (sem request: o schema da API é público).
+    """
+    from drf_spectacular.generators import SchemaGenerator
+
+    return SchemaGenerator().get_schema(request=None, public=True)
+
+
+def serialize_schema(schema):
+    """
+    Forma canônica do arquivo: JSON indentado, na ordem do gerador.
+    """
+    return json.dumps(schema, cls=JSONEncoder, ensure_ascii=False, indent=2).encode("utf-8") + b"\n"
+
+
+class SchemaDocument:
+    def __init__(self, content):
+        self.content = content
+        self.data = json.loads(content)
+        # Muda sempre que o schema muda: ETag e parâmetro de versão da URL
+        self.digest = hashlib.sha256(content).hexdigest()[:16]
+        self._rendered = {}
+
+    def render(self, renderer):
+        """
+        Bytes do schema no formato de `renderer`, renderizados uma única vez.
+        """
+        key = (type(renderer), renderer.media_type)
+        content = self._rendered.get(key)
+        if content is None:
+            content = self._rendered[key] = renderer.render(self.data, renderer.media_type, {})
+        return content
+
+
+def get_schema_document():
+    global _document
+    if _document is None:
+        with _lock:
+            if _document is None:
+                path = Path(settings.OPENAPI_SCHEMA_FILE) if settings.OPENAPI_SCHEMA_FILE else None
+                if path and path.exists():
+                    content = path.read_bytes()
+                else:
+                    content = serialize_schema(generate_schema())
+                _document = SchemaDocument(content)
+    return _document
+
+
+def reset_schema_document():
+    """
+    Descarta o documento em memória; o próximo acesso lê o arquivo de novo.
+    """
+    global _document
+    with _lock:
+        _document = None
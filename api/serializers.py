@@ -2,10 +2,34 @@
 from rest_framework import serializers
 from drf_spectacular.utils import extend_schema_field
 from drf_spectacular.openapi import OpenApiTypes
-from .models import Perfil, Usuario, EtapaEscolar, Disciplina, StatusEnvio, EnvioMaterial
+from django.conf import settings
+from django.utils import timezone
+from .models import Perfil, Usuario, EtapaEscolar, Disciplina, StatusEnvio, EnvioMaterial, ArquivoEnvio, UploadSessao
+from .instrumentation import TimedSerializerMixin
 from datetime import datetime
 
 
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """
+    ListSerializer que registra o tempo de serialização (ver ServerTimingMiddleware)
+    """
+
+
+class NativeDatesMixin:
+    """
+    Com `native_dates` no contexto, os campos de data e hora devolvem date/datetime
+    em vez de texto, para renderers com tipo próprio para datas (MessagePack).
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.context.get('native_dates'):
+            for field in fields.values():
+                if isinstance(field, (serializers.DateField, serializers.DateTimeField)):
+                    field.format = None
+        return fields
+
+
 class PerfilSerializer(serializers.ModelSerializer):
     """
     Serializer para o modelo Perfil
@@ -100,7 +124,7 @@ class StatusEnvioSerializer(serializers.ModelSerializer):
         fields = ['id', 'descricao_status']
 
 
-class EnvioMaterialSerializer(serializers.ModelSerializer):
+class EnvioMaterialSerializer(NativeDatesMixin, TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer para o modelo EnvioMaterial.
     Retorna as datas no formato DD-MM-YYYY.
@@ -118,8 +142,10 @@ class EnvioMaterialSerializer(serializers.ModelSerializer):
         help_text="Data limite no formato DD-MM-YYYY"
     )
 
-    mes_referencia = serializers.IntegerField(required=False, allow_null=True)
-    ano_referencia = serializers.IntegerField(required=False, allow_null=True)
+    # Sem mês/ano, o período atual (no TIME_ZONE, não em UTC): o padrão é aplicado
+    # antes da verificação da chave natural (envio_chave_natural), que precisa dos dois
+    mes_referencia = serializers.IntegerField(default=lambda: timezone.localdate().month, allow_null=True)
+    ano_referencia = serializers.IntegerField(default=lambda: timezone.localdate().year, allow_null=True)
 
     class Meta:
         model = EnvioMaterial
@@ -130,6 +156,7 @@ class EnvioMaterialSerializer(serializers.ModelSerializer):
             'observacoes_gerencia', 'data_envio_escola', 'data_envio_see',
             'data_validacao_gerencia', 'data_envio_formador', 'data_limite_envio'
         ]
+        list_serializer_class = TimedListSerializer
         extra_kwargs = {
             'mes_referencia': {'help_text': 'Mês de referência (1-12)', 'required': False},
             'ano_referencia': {'help_text': 'Ano de referência (ex: 2024)', 'required': False},
@@ -140,6 +167,8 @@ class EnvioMaterialSerializer(serializers.ModelSerializer):
         Formata todas as datas no formato DD-MM-YYYY ao retornar os dados.
         """
         data = super().to_representation(instance)
+        if self.context.get('native_dates'):
+            return data
 
         # Lista dos campos de data que você quer formatar
         date_fields = [
@@ -196,7 +225,7 @@ class UsuarioCreateSerializer(serializers.ModelSerializer):
         return user
 
 
-class EnvioMaterialResumoSerializer(serializers.ModelSerializer):
+class EnvioMaterialResumoSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer resumido para listagem de envios
     Inclui apenas os campos essenciais para performance
@@ -213,6 +242,7 @@ class EnvioMaterialResumoSerializer(serializers.ModelSerializer):
             'status_descricao', 'mes_referencia', 'ano_referencia',
             'data_envio_escola', 'data_limite_envio'
         ]
+        list_serializer_class = TimedListSerializer
 
 
 class EnvioMaterialStatsSerializer(serializers.Serializer):
@@ -229,4 +259,82 @@ class EnvioMaterialStatsSerializer(serializers.Serializer):
 
 class FileUploadSerializer(serializers.Serializer):
     email = serializers.EmailField()
-    file = serializers.FileField()
\ No newline at end of file
+    file = serializers.FileField()
+
+
+class GerarPendentesSerializer(serializers.Serializer):
+    """
+    Mês a gerar; sem `dia_limite`, vale ENVIO_DIA_LIMITE.
+    """
+    mes = serializers.IntegerField(min_value=1, max_value=12)
+    ano = serializers.IntegerField(min_value=2000, max_value=9999)
+    dia_limite = serializers.IntegerField(min_value=1, max_value=31, required=False)
+
+
+class EnvioUpsertSerializer(serializers.Serializer):
+    """
+    Linha do upsert de envios: a chave natural é obrigatória; dos demais campos,
+    só os informados são gravados (null limpa o campo).
+    """
+    id_usuario = serializers.IntegerField()
+    id_etapa = serializers.IntegerField()
+    id_disciplina = serializers.IntegerField()
+    mes_referencia = serializers.IntegerField(min_value=1, max_value=12)
+    ano_referencia = serializers.IntegerField(min_value=2000, max_value=9999)
+    id_status = serializers.IntegerField(required=False)
+    observacoes_gerencia = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    data_envio_escola = serializers.DateField(
+        input_formats=['%d-%m-%Y', '%Y-%m-%d'], required=False, allow_null=True,
+    )
+    data_envio_see = serializers.DateField(
+        input_formats=['%d-%m-%Y', '%Y-%m-%d'], required=False, allow_null=True,
+    )
+    data_validacao_gerencia = serializers.DateField(
+        input_formats=['%d-%m-%Y', '%Y-%m-%d'], required=False, allow_null=True,
+    )
+    data_envio_formador = serializers.DateField(
+        input_formats=['%d-%m-%Y', '%Y-%m-%d'], required=False, allow_null=True,
+    )
+    data_limite_envio = serializers.DateField(
+        input_formats=['%d-%m-%Y', '%Y-%m-%d'], required=False, allow_null=True,
+    )
+
+
+class ArquivoEnvioSerializer(NativeDatesMixin, serializers.ModelSerializer):
+    """
+    Arquivo anexado a um envio; o conteúdo é baixado em `arquivos/{id}/`.
+    """
+    sha256 = serializers.CharField(source='id_arquivo_id', read_only=True)
+    tamanho = serializers.IntegerField(source='id_arquivo.tamanho', read_only=True)
+
+    class Meta:
+        model = ArquivoEnvio
+        fields = ['id', 'id_envio', 'nome', 'tipo', 'tamanho', 'sha256', 'id_usuario', 'criado_em']
+        read_only_fields = fields
+
+
+class ArquivoUploadSerializer(serializers.Serializer):
+    file = serializers.FileField()
+
+    def validate_file(self, value):
+        if value.size > settings.MATERIAL_MAX_FILE_SIZE:
+            raise serializers.ValidationError("Arquivo maior que o limite permitido.")
+        return value
+
+
+class UploadSessaoSerializer(serializers.ModelSerializer):
+    """
+    Sessão de upload retomável. `recebido` é o offset do próximo bloco.
+    """
+
+    class Meta:
+        model = UploadSessao
+        fields = ['id', 'id_envio', 'nome', 'tipo', 'tamanho', 'recebido', 'criado_em', 'atualizado_em']
+        read_only_fields = ['id', 'recebido', 'criado_em', 'atualizado_em']
+
+    def validate_tamanho(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("O tamanho deve ser maior que zero.")
+        if value > settings.MATERIAL_MAX_FILE_SIZE:
+            raise serializers.ValidationError("Arquivo maior que o limite permitido.")
+        return value
@@ -0,0 +1,39 @@
+# signals.py
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import analytics
+from .authentication import invalidate_users
+from .models import EnvioMaterial, Perfil, Usuario
+
+
+@receiver([post_save, post_delete], sender=Usuario)
+def invalidar_usuario_em_cache(sender, instance, **kwargs):
+    invalidate_users([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Perfil)
+def invalidar_usuarios_do_perfil(sender, instance, **kwargs):
+    invalidate_users(Usuario.objects.filter(id_perfil=instance.pk).values_list("pk", flat=True))
+
+
+@receiver(pre_save, sender=EnvioMaterial)
+def guardar_periodo_anterior(sender, instance, **kwargs):
+    # Lido sem mês/ano (only/defer) ou montado com a pk: busca o período gravado
+    if instance.pk is None or None not in getattr(instance, "_periodo_carregado", (None,)):
+        return
+    instance._periodo_carregado = sender.objects.filter(pk=instance.pk).values_list(
+        "ano_referencia", "mes_referencia",
+    ).first()
+
+
+@receiver([post_save, post_delete], sender=EnvioMaterial)
+def invalidar_analytics(sender, instance, **kwargs):
+    # O período atual e, se o envio mudou de mês/ano, o anterior: as entradas
+    # por período (meses encerrados) só olham a versão do próprio período
+    periodos = {(instance.ano_referencia, instance.mes_referencia)}
+    anterior = getattr(instance, "_periodo_carregado", None)
+    if anterior:
+        periodos.add(anterior)
+    instance._periodo_carregado = (instance.ano_referencia, instance.mes_referencia)
+    analytics.invalidate(sorted(periodos))
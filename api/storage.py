@@ -0,0 +1,253 @@
+# storage.py
+"""
+Armazenamento dos arquivos de material, endereçado pelo conteúdo.
+
+Cada arquivo fica em `MATERIAL_STORAGE_DIR/ab/cd/<sha256>`: o mesmo conteúdo
+enviado várias vezes (ou anexado a vários envios) ocupa o disco uma vez só.
+Os dados sempre passam em blocos de CHUNK_SIZE, calculando o SHA-256 durante a
+gravação, então a memória usada não depende do tamanho do arquivo.
+
+Uploads retomáveis (UploadSessao) acumulam os blocos em `uploads/<id>.part`;
+o arquivo parcial é a fonte da verdade do progresso e, ao completar, é lido
+de novo só para o hash (o estado do sha256 não sobrevive entre requisições).
+"""
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.http import FileResponse, HttpResponse
+
+from .models import ArquivoEnvio, ArquivoMaterial, UploadSessao
+
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class UploadError(Exception):
+    """
+    Erro do cliente no upload; `status` é o código HTTP da resposta.
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class MaterialStorage:
+    def __init__(self, location):
+        self.root = Path(location)
+
+    def path(self, sha256):
+        return self.root / sha256[:2] / sha256[2:4] / sha256
+
+    def partial_path(self, sessao_id):
+        return self.root / "uploads" / f"{sessao_id}.part"
+
+    def save_chunks(self, chunks, max_size=None):
+        """
+        Grava os blocos em um arquivo temporário calculando o SHA-256 e o move
+        para o endereço do conteúdo. Retorna (sha256, tamanho).
+        """
+        tmp_dir = self.root / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_name = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        raise UploadError("Arquivo maior que o limite permitido", status=413)
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            sha256 = digest.hexdigest()
+            self.commit(Path(tmp_name), sha256)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+        return sha256, size
+
+    def commit(self, source, sha256):
+        """
+        Move `source` para o endereço de `sha256`; se o conteúdo já existe, descarta a cópia.
+        """
+        dest = self.path(sha256)
+        if dest.exists():
+            source.unlink()
+            return dest
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source, dest)
+        return dest
+
+    def hash_file(self, path):
+        digest = hashlib.sha256()
+        with open(path, "rb") as arquivo:
+            while chunk := arquivo.read(CHUNK_SIZE):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+
+def get_storage():
+    return MaterialStorage(settings.MATERIAL_STORAGE_DIR)
+
+
+def _attach(envio, usuario, nome, tipo, sha256, tamanho):
+    arquivo = ArquivoMaterial(sha256=sha256, tamanho=tamanho)
+    # INSERT ... ON CONFLICT DO NOTHING: o conteúdo pode já existir (de outro envio ou
+    # de um upload concorrente), sem SELECT prévio nem savepoint
+    ArquivoMaterial.objects.bulk_create([arquivo], ignore_conflicts=True)
+    return ArquivoEnvio.objects.create(
+        id_envio=envio, id_arquivo=arquivo, id_usuario=usuario, nome=nome, tipo=tipo,
+    )
+
+
+def store_upload(envio, uploaded_file, usuario):
+    """
+    Grava um arquivo enviado de uma vez (UploadedFile) e o anexa ao envio.
+    """
+    sha256, tamanho = get_storage().save_chunks(
+        uploaded_file.chunks(CHUNK_SIZE), max_size=settings.MATERIAL_MAX_FILE_SIZE,
+    )
+    return _attach(
+        envio, usuario, Path(uploaded_file.name).name, uploaded_file.content_type or "", sha256, tamanho,
+    )
+
+
+def append_chunk(sessao_id, usuario, offset, stream):
+    """
+    Acrescenta os bytes de `stream` ao upload retomável de `usuario` a partir de `offset`, que
+    precisa ser igual ao já recebido. Retorna (sessão, ArquivoEnvio ou None): com
+    o último bloco o arquivo é movido para o armazenamento e a sessão removida.
+    """
+    storage = get_storage()
+    with transaction.atomic():
+        # Serializa blocos concorrentes da mesma sessão
+        sessao = UploadSessao.objects.select_for_update().get(pk=sessao_id, id_usuario=usuario)
+        if offset != sessao.recebido:
+            raise UploadError(f"Offset esperado: {sessao.recebido}", status=409)
+
+        path = storage.partial_path(sessao.pk)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        restante = sessao.tamanho - sessao.recebido
+        with open(path, "ab" if path.exists() else "wb") as parcial:
+            # Descarta bytes de uma gravação interrompida antes de atualizar a sessão
+            parcial.truncate(sessao.recebido)
+            parcial.seek(sessao.recebido)
+            while stream is not None and (chunk := stream.read(min(CHUNK_SIZE, restante + 1))):
+                if len(chunk) > restante:
+                    raise UploadError("Bloco ultrapassa o tamanho declarado do arquivo", status=413)
+                parcial.write(chunk)
+                restante -= len(chunk)
+            sessao.recebido = parcial.tell()
+
+        if sessao.recebido < sessao.tamanho:
+            sessao.save(update_fields=["recebido", "atualizado_em"])
+            return sessao, None
+
+        sha256 = storage.hash_file(path)
+        storage.commit(path, sha256)
+        arquivo_envio = _attach(
+            sessao.id_envio, sessao.id_usuario, sessao.nome, sessao.tipo, sha256, sessao.tamanho,
+        )
+        sessao.delete()
+        return sessao, arquivo_envio
+
+
+def cancel_upload(sessao):
+    """
+    Remove a sessão e, depois do commit, o arquivo parcial.
+    """
+    path = get_storage().partial_path(sessao.pk)
+    sessao.delete()
+    transaction.on_commit(lambda: path.unlink(missing_ok=True))
+
+
+class RangeFile:
+    """
+    Leitura limitada a `length` bytes de um arquivo já posicionado. Não expõe
+    fileno(), para o servidor não usar sendfile no arquivo inteiro.
+    """
+
+    def __init__(self, arquivo, length):
+        self.arquivo = arquivo
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.arquivo.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.arquivo.close()
+
+
+def parse_range(header, size):
+    """
+    Interpreta um cabeçalho Range de um único intervalo. Retorna (início, fim)
+    inclusivos, None se o cabeçalho deve ser ignorado ou False se não há
+    intervalo satisfazível (416).
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    start, end = match.groups()
+    if not start:
+        # bytes=-N: os últimos N bytes; em um arquivo vazio não há nenhum
+        length = int(end)
+        if length == 0 or size == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def file_response(request, arquivo_envio):
+    """
+    Download do arquivo com suporte a Range/If-Range. O arquivo inteiro vai como
+    FileResponse (o servidor pode usar sendfile); intervalos são lidos em blocos.
+    """
+    arquivo = arquivo_envio.id_arquivo
+    path = get_storage().path(arquivo.sha256)
+    etag = f'"{arquivo.sha256}"'
+    content_type = arquivo_envio.tipo or None
+
+    byte_range = None
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    if range_header and (not if_range or if_range == etag):
+        byte_range = parse_range(range_header, arquivo.tamanho)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{arquivo.tamanho}"
+    elif byte_range:
+        start, end = byte_range
+        handle = open(path, "rb")
+        handle.seek(start)
+        response = FileResponse(
+            RangeFile(handle, end - start + 1), status=206, as_attachment=True,
+            filename=arquivo_envio.nome, content_type=content_type,
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{arquivo.tamanho}"
+        response["Content-Length"] = str(end - start + 1)
+    else:
+        response = FileResponse(
+            open(path, "rb"), as_attachment=True, filename=arquivo_envio.nome, content_type=content_type,
+        )
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    return response
@@ -1,3 +1,2125 @@
-from django.test import TestCase
+import asyncio
+import importlib.util
+import io
+import json
+import multiprocessing
+import pstats
+import signal
+import socket
+import socketserver
+import sqlite3
+import subprocess
+import sys
+import urllib.request
+import zipfile
+import threading
+import time
+import tempfile
+from contextlib import ExitStack
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail import EmailMessage
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models import Count
+from django.http import HttpResponse
+from django.contrib.auth.models import AnonymousUser
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from drf_spectacular.renderers import OpenApiYamlRenderer
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from config.urls import router
+from . import analytics, dashboard, db_pool, db_routers, metrics, renderers, schema, user_import, warmup
+from .management.commands import serve
+from .middleware import ReplicaStickyMiddleware
+from .views import DashboardEnvioViewSet
+from .authentication import get_cached_user, user_cache_key
+from .hashing import get_hash_pool
+from .instrumentation import QueryCounter
+from .parsers import FastJSONParser, MessagePackParser
+from .renderers import FastJSONRenderer, MessagePackRenderer
+from .throttling import AnonTokenBucketThrottle, UserTokenBucketThrottle
+from .outbox import send_pending
+from .storage import CHUNK_SIZE, get_storage, parse_range, store_upload
+from .user_import import import_users
+from .models import Perfil, Usuario, EtapaEscolar, Disciplina, StatusEnvio, EnvioMaterial, ThrottleBucket, EmailOutbox
+from .models import AnalyticsVersao, ArquivoEnvio, ArquivoMaterial, UploadSessao
+
+
+# Número máximo de consultas SQL por rota da API: (nome da rota, método) -> orçamento.
+# Os valores incluem a contagem da paginação e o UPSERT do throttle (um por classe
+# de throttle aplicável: dois para anônimos). O usuário do JWT vem do cache.
+# Os orçamentos não podem depender do volume de dados: cada rota é verificada
+# em dois tamanhos de base (QueryBudgetSmallTests e QueryBudgetLargeTests).
+API_QUERY_BUDGETS = {
+    ('home', 'get'): 0,
+    ('api-root', 'get'): 1,
+    ('schema', 'get'): 1,
+    ('swagger-ui', 'get'): 1,
+    ('redoc', 'get'): 1,
+    ('token_obtain_pair', 'post'): 2,      # throttle + usuário (view assíncrona)
+    ('token_refresh', 'post'): 3,
+    ('hello', 'get'): 1,
+    ('file-upload', 'post'): 2,            # throttle + INSERT na fila de e-mail
+    ('metrics', 'get'): 0,
+    ('perfil-list', 'get'): 3,
+    ('perfil-list', 'post'): 3,            # + invalidação do cache dos usuários do perfil
+    ('perfil-detail', 'get'): 2,
+    ('perfil-detail', 'patch'): 4,          # + invalidação do cache dos usuários do perfil
+    ('usuario-list', 'get'): 3,
+    ('usuario-list', 'post'): 5,
+    ('usuario-detail', 'get'): 2,
+    ('usuario-detail', 'patch'): 3,
+    ('usuario-by-perfil', 'get'): 2,
+    ('usuario-me', 'get'): 2,
+    ('usuario-create-professor', 'post'): 6,
+    ('etapaescolar-list', 'get'): 3,
+    ('etapaescolar-detail', 'get'): 2,
+    ('disciplina-list', 'get'): 3,
+    ('disciplina-detail', 'get'): 2,
+    ('statusenvio-list', 'get'): 3,
+    ('statusenvio-detail', 'get'): 2,
+    ('enviomaterial-list', 'get'): 3,
+    ('enviomaterial-list', 'post'): 7,          # + verificação da chave natural
+    ('enviomaterial-detail', 'get'): 2,
+    ('enviomaterial-detail', 'patch'): 3,
+    ('enviomaterial-by-user', 'get'): 2,
+    ('enviomaterial-by-period', 'get'): 2,
+    ('enviomaterial-pending', 'get'): 2,
+    ('enviomaterial-stats', 'get'): 2,
+    ('enviomaterial-overdue', 'get'): 2,
+    ('enviomaterial-validar', 'post'): 4,
+    ('enviomaterial-mudar-status', 'post'): 4,
+    ('dashboard-envios-dashboard-me', 'get'): 5,
+    ('dashboard-envios-dashboard-geral', 'get'): 5,
+    ('enviomaterial-arquivos', 'get'): 3,
+    ('enviomaterial-arquivos', 'post'): 4,      # envio + INSERT ... ON CONFLICT do conteúdo + INSERT
+    ('enviomaterial-baixar-arquivo', 'get'): 2,
+    ('enviomaterial-pacote', 'get'): 3,          # envios + arquivos (prefetch)
+    ('enviomaterial-analytics', 'get'): 3,       # versão do cache + uma consulta com GROUPING SETS
+    ('enviomaterial-serie-temporal', 'get'): 3,  # versão + generate_series + LEFT JOIN das contagens
+    ('enviomaterial-tempos-ciclo', 'get'): 3,    # versão + percentile_cont por GROUPING SETS
+    ('enviomaterial-conformidade', 'get'): 3,    # resumo por etapa + página (anti-join)
+    ('enviomaterial-gerar-pendentes', 'post'): 3,  # status + INSERT ... SELECT das atribuições
+    ('enviomaterial-upsert', 'post'): 8,  # ids por relação + INSERT ... ON CONFLICT, no savepoint
+    ('upload-list', 'post'): 3,
+    ('upload-detail', 'get'): 2,
+    ('upload-detail', 'patch'): 5,             # savepoint + SELECT ... FOR UPDATE + UPDATE
+    ('upload-detail', 'delete'): 3,
+}
+
+# Rotas cujo corpo é enviado como multipart (arquivos)
+MULTIPART_ROUTES = {'file-upload', 'enviomaterial-arquivos'}
+
+# Número máximo de consultas SQL por página do admin: (modelo, página) -> orçamento.
+ADMIN_QUERY_BUDGETS = {
+    ('index', None): 3,
+    ('perfil', 'changelist'): 5,
+    ('perfil', 'add'): 3,
+    ('perfil', 'change'): 3,
+    ('usuario', 'changelist'): 7,
+    ('usuario', 'add'): 4,
+    ('usuario', 'change'): 4,
+    ('etapaescolar', 'changelist'): 5,
+    ('etapaescolar', 'add'): 3,
+    ('etapaescolar', 'change'): 3,
+    ('disciplina', 'changelist'): 5,
+    ('disciplina', 'add'): 3,
+    ('disciplina', 'change'): 3,
+    ('statusenvio', 'changelist'): 5,
+    ('statusenvio', 'add'): 3,
+    ('statusenvio', 'change'): 3,
+    ('enviomaterial', 'changelist'): 11,
+    ('enviomaterial', 'add'): 7,
+    ('enviomaterial', 'change'): 8,
+    ('emailoutbox', 'changelist'): 5,
+    ('emailoutbox', 'add'): 3,
+    ('emailoutbox', 'change'): 3,
+}
+
+
+def limpar_caches():
+    """
+    Limpa todos os caches, inclusive o compartilhado em arquivo, que sobrevive
+    entre execuções e guarda usuários autenticados por id.
+    """
+    for backend in caches.all():
+        backend.clear()
+
+
+def cliente_autenticado(usuario):
+    """
+    APIClient com o token de acesso JWT de `usuario`.
+    """
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(usuario).access_token}")
+    return client
+
+
+def popular_base(tamanho):
+    """
+    Cria perfis, status, etapas, disciplinas, usuários e envios proporcionais a `tamanho`.
+    """
+    perfis = {
+        nome: Perfil.objects.create(nome_perfil=nome)
+        for nome in ["Administrador", "Professor", "Coordenador"]
+    }
+    status = [
+        StatusEnvio.objects.create(descricao_status=nome)
+        for nome in ["Pendente", "Enviado", "Validado", "Rejeitado"]
+    ]
+    etapas = EtapaEscolar.objects.bulk_create(
+        [EtapaEscolar(nome_etapa=f"Etapa {i}") for i in range(2 * tamanho)]
+    )
+    disciplinas = Disciplina.objects.bulk_create(
+        [Disciplina(nome_disciplina=f"Disciplina {i}") for i in range(2 * tamanho)]
+    )
+    usuarios = Usuario.objects.bulk_create([
+        Usuario(
+            id_perfil=perfis["Professor"],
+            nome_usuario=f"Professor {i}",
+            matricula=f"PROF{i:04d}",
+            cpf=f"100.000.{i:03d}-00",
+        )
+        for i in range(3 * tamanho)
+    ])
+    admin_user = Usuario.objects.create_superuser(
+        matricula="ADMIN", cpf="999.999.999-99", senha="senha123",
+        id_perfil=perfis["Administrador"], nome_usuario="Administrador",
+    )
+    usuarios.append(admin_user)
+    EnvioMaterial.objects.bulk_create([
+        EnvioMaterial(
+            id_etapa=etapas[i % len(etapas)],
+            id_disciplina=disciplinas[i % len(disciplinas)],
+            id_usuario=usuarios[i % len(usuarios)],
+            id_status=status[i % len(status)],
+            # Cada professor passa para o mês seguinte a cada volta: a chave natural não se repete
+            mes_referencia=i // len(usuarios) % 12 + 1,
+            ano_referencia=2025,
+            data_envio_escola=date(2025, i // len(usuarios) % 12 + 1, 10),
+            data_limite_envio=date(2025, i // len(usuarios) % 12 + 1, 5),
+            observacoes_gerencia="Envio de teste",
+        )
+        for i in range(20 * tamanho)
+    ])
+    return admin_user
+
+
+class QueryBudgetMixin:
+    """
+    Verifica que cada rota da API e cada página do admin respeita o orçamento de consultas.
+    """
+    tamanho = 1
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = popular_base(cls.tamanho)
+        cls.envio = EnvioMaterial.objects.order_by('id').first()
+
+    def setUp(self):
+        # Os caches (inclusive o de ContentType) são limpos para que a contagem
+        # não dependa da ordem de execução dos testes
+        limpar_caches()
+        ContentType.objects.clear_cache()
+        spool = tempfile.TemporaryDirectory()
+        self.addCleanup(spool.cleanup)
+        materiais = tempfile.TemporaryDirectory()
+        self.addCleanup(materiais.cleanup)
+        settings_override = override_settings(EMAIL_SPOOL_DIR=spool.name, MATERIAL_STORAGE_DIR=materiais.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = cliente_autenticado(self.admin_user)
+
+    def api_requests(self):
+        """
+        Requisições verificadas: (nome da rota, método, kwargs da URL, query string, corpo, status esperado).
+        """
+        envio, usuario = self.envio, self.admin_user
+        perfil = usuario.id_perfil
+        status_obj = StatusEnvio.objects.get(descricao_status="Pendente")
+        validado = StatusEnvio.objects.get(descricao_status="Validado")
+        upload = SimpleUploadedFile("material.txt", b"conteudo", content_type="text/plain")
+        arquivo = store_upload(envio, SimpleUploadedFile("plano.txt", b"plano de aula"), usuario)
+        sessao = UploadSessao.objects.create(id_envio=envio, id_usuario=usuario, nome="video.mp4", tamanho=10)
+        return [
+            ('home', 'get', {}, '', None, 200),
+            ('api-root', 'get', {}, '', None, 200),
+            ('schema', 'get', {}, '', None, 200),
+            ('swagger-ui', 'get', {}, '', None, 200),
+            ('redoc', 'get', {}, '', None, 200),
+            ('token_obtain_pair', 'post', {}, '', {'matricula': 'ADMIN', 'password': 'senha123'}, 200),
+            ('token_refresh', 'post', {}, '', {'refresh': str(RefreshToken.for_user(usuario))}, 200),
+            ('hello', 'get', {}, '', None, 200),
+            ('file-upload', 'post', {}, '', {'email': 'professor@example.com', 'file': upload}, 202),
+            ('metrics', 'get', {}, '', None, 200),
+            ('perfil-list', 'get', {}, '', None, 200),
+            ('perfil-detail', 'get', {'pk': perfil.pk}, '', None, 200),
+            ('usuario-list', 'get', {}, '', None, 200),
+            ('usuario-detail', 'get', {'pk': usuario.pk}, '', None, 200),
+            ('usuario-by-perfil', 'get', {}, f'perfil_id={perfil.pk}', None, 200),
+            ('usuario-me', 'get', {}, '', None, 200),
+            ('etapaescolar-list', 'get', {}, '', None, 200),
+            ('etapaescolar-detail', 'get', {'pk': envio.id_etapa_id}, '', None, 200),
+            ('disciplina-list', 'get', {}, '', None, 200),
+            ('disciplina-detail', 'get', {'pk': envio.id_disciplina_id}, '', None, 200),
+            ('statusenvio-list', 'get', {}, '', None, 200),
+            ('statusenvio-detail', 'get', {'pk': status_obj.pk}, '', None, 200),
+            ('enviomaterial-list', 'get', {}, '', None, 200),
+            ('enviomaterial-detail', 'get', {'pk': envio.pk}, '', None, 200),
+            ('enviomaterial-by-user', 'get', {}, f'user_id={usuario.pk}', None, 200),
+            ('enviomaterial-by-period', 'get', {}, 'mes=1&ano=2025', None, 200),
+            ('enviomaterial-pending', 'get', {}, '', None, 200),
+            ('enviomaterial-stats', 'get', {}, 'mes=1&ano=2025', None, 200),
+            ('enviomaterial-overdue', 'get', {}, '', None, 200),
+            ('enviomaterial-arquivos', 'get', {'pk': envio.pk}, '', None, 200),
+            ('enviomaterial-baixar-arquivo', 'get', {'pk': envio.pk, 'arquivo_id': arquivo.pk}, '', None, 200),
+            ('enviomaterial-pacote', 'get', {},
+             f'mes={envio.mes_referencia}&ano={envio.ano_referencia}&etapa={envio.id_etapa_id}', None, 200),
+            ('enviomaterial-analytics', 'get', {}, 'dimensoes=ano,mes,etapa,disciplina,status,usuario', None, 200),
+            ('enviomaterial-serie-temporal', 'get', {},
+             'inicio=2025-01-01&fim=2025-12-31&periodo=semana&por_status=true', None, 200),
+            ('enviomaterial-tempos-ciclo', 'get', {}, 'ano=2025', None, 200),
+            ('enviomaterial-conformidade', 'get', {}, f'ano={envio.ano_referencia}', None, 200),
+            ('enviomaterial-gerar-pendentes', 'post', {}, '', {'mes': 1, 'ano': 2026}, 201),
+            ('enviomaterial-upsert', 'post', {}, '', [{
+                'id_usuario': usuario.pk, 'id_etapa': envio.id_etapa_id, 'id_disciplina': envio.id_disciplina_id,
+                'mes_referencia': 1, 'ano_referencia': 2027, 'id_status': envio.id_status_id,
+            }], 200),
+            ('upload-detail', 'get', {'pk': sessao.pk}, '', None, 200),
+            ('dashboard-envios-dashboard-me', 'get', {}, '', None, 200),
+            ('dashboard-envios-dashboard-me', 'get', {}, 'resumido=true', None, 200),
+            ('dashboard-envios-dashboard-geral', 'get', {}, '', None, 200),
+            ('dashboard-envios-dashboard-geral', 'get', {}, 'resumido=true', None, 200),
+            # Escritas por último, para não alterar os dados das leituras
+            ('perfil-list', 'post', {}, '', {'nome_perfil': 'Novo Perfil'}, 201),
+            ('perfil-detail', 'patch', {'pk': perfil.pk}, '', {'nome_perfil': 'Administrador'}, 200),
+            ('usuario-list', 'post', {}, '', {
+                'id_perfil': perfil.pk, 'nome_usuario': 'Novo Usuário', 'matricula': 'NOVO1',
+                'cpf': '200.000.000-01', 'senha': 'senha123', 'confirm_senha': 'senha123',
+            }, 201),
+            ('usuario-detail', 'patch', {'pk': usuario.pk}, '', {'nome_usuario': 'Administrador Geral'}, 200),
+            ('usuario-create-professor', 'post', {}, '', {
+                'nome_usuario': 'Novo Professor', 'matricula': 'NOVO2',
+                'cpf': '200.000.000-02', 'senha': 'senha123', 'confirm_senha': 'senha123',
+            }, 201),
+            ('enviomaterial-list', 'post', {}, '', {
+                'id_etapa': envio.id_etapa_id, 'id_disciplina': envio.id_disciplina_id,
+                'id_usuario': usuario.pk, 'id_status': status_obj.pk,
+                'mes_referencia': 3, 'ano_referencia': 2026, 'data_limite_envio': '15-03-2026',
+            }, 201),
+            ('enviomaterial-detail', 'patch', {'pk': envio.pk}, '', {'observacoes_gerencia': 'Revisado'}, 200),
+            ('enviomaterial-validar', 'post', {'pk': envio.pk}, '', {'validado': True}, 200),
+            ('enviomaterial-mudar-status', 'post', {'pk': envio.pk}, '', {'status_id': validado.pk}, 200),
+            ('enviomaterial-arquivos', 'post', {'pk': envio.pk}, '', {
+                'file': SimpleUploadedFile("plano.txt", b"plano de aula", content_type="text/plain"),
+            }, 201),
+            ('upload-list', 'post', {}, '', {'id_envio': envio.pk, 'nome': 'aula.pdf', 'tamanho': 4}, 201),
+            ('upload-detail', 'patch', {'pk': sessao.pk}, 'offset=0', b'video', 200),
+            ('upload-detail', 'delete', {'pk': sessao.pk}, '', None, 204),
+        ]
+
+    def assertWithinBudget(self, budget, label, func):
+        # Conta as consultas em todos os bancos (primário e réplica, se houver)
+        with ExitStack() as stack:
+            contexts = [stack.enter_context(CaptureQueriesContext(conn)) for conn in connections.all()]
+            response = func()
+        captured = [q for ctx in contexts for q in ctx.captured_queries]
+        executed = len(captured)
+        self.assertLessEqual(
+            executed, budget,
+            f"{label} executou {executed} consultas (orçamento: {budget}):\n"
+            + "\n".join(q['sql'] for q in captured)
+        )
+        return response
+
+    def test_every_api_route_has_budget(self):
+        budgeted = {name for name, _ in API_QUERY_BUDGETS}
+        missing = {url.name for url in router.urls} - budgeted
+        self.assertFalse(missing, f"Rotas sem orçamento de consultas: {sorted(missing)}")
+
+    def test_api_query_budgets(self):
+        for name, method, kwargs, query, data, expected_status in self.api_requests():
+            # Os orçamentos consideram o usuário autenticado já no cache (as escritas
+            # em Usuario/Perfil o invalidam para a requisição seguinte)
+            get_cached_user(self.admin_user.pk)
+            budget = API_QUERY_BUDGETS[(name, method)]
+            url = reverse(name, kwargs=kwargs) + (f'?{query}' if query else '')
+            if isinstance(data, bytes):
+                # Corpo bruto (blocos do upload retomável)
+                options = {'content_type': 'application/octet-stream'}
+            else:
+                options = {'format': 'multipart' if name in MULTIPART_ROUTES else 'json'}
+            with self.subTest(route=name, method=method, query=query):
+                response = self.assertWithinBudget(
+                    budget, f"{method.upper()} {url}",
+                    lambda: getattr(self.client, method)(url, data, **options),
+                )
+                self.assertEqual(response.status_code, expected_status, getattr(response, 'data', None))
+
+    def test_admin_query_budgets(self):
+        client = self.client_class()
+        client.force_login(self.admin_user)
+        objetos = {
+            'perfil': self.admin_user.id_perfil,
+            'usuario': self.admin_user,
+            'etapaescolar': self.envio.id_etapa,
+            'disciplina': self.envio.id_disciplina,
+            'statusenvio': self.envio.id_status,
+            'enviomaterial': self.envio,
+            'emailoutbox': EmailOutbox.objects.create(
+                destinatario='professor@example.com', assunto='Teste', corpo='Corpo',
+            ),
+        }
+        registrados = {model._meta.model_name for model in admin.site._registry if model._meta.app_label == 'api'}
+        self.assertEqual(registrados, set(objetos))
+
+        self.assertWithinBudget(ADMIN_QUERY_BUDGETS[('index', None)], 'admin index',
+                                lambda: client.get(reverse('admin:index')))
+        for model_name, obj in objetos.items():
+            for page, args in (('changelist', []), ('add', []), ('change', [obj.pk])):
+                url = reverse(f'admin:api_{model_name}_{page}', args=args)
+                with self.subTest(model=model_name, page=page):
+                    response = self.assertWithinBudget(
+                        ADMIN_QUERY_BUDGETS[(model_name, page)], url, lambda: client.get(url)
+                    )
+                    self.assertEqual(response.status_code, 200)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class QueryBudgetSmallTests(QueryBudgetMixin, TestCase):
+    tamanho = 1
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class QueryBudgetLargeTests(QueryBudgetMixin, TestCase):
+    tamanho = 8
+
+
+@override_settings(SERVER_TIMING_ROUTES=['enviomaterial-*'], SERVER_TIMING_SAMPLE_RATE=0.0)
+class ServerTimingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = popular_base(1)
+
+    def setUp(self):
+        limpar_caches()
+        self.client = cliente_autenticado(self.admin_user)
+
+    def test_header_and_log_for_enabled_route(self):
+        with self.assertLogs('api.timing', level='INFO') as logs:
+            response = self.client.get(reverse('enviomaterial-list'))
+        header = response['Server-Timing']
+        for name in ('db;', 'view;', 'ser;', 'render;', 'total;'):
+            self.assertIn(name, header)
+        self.assertIn('desc="4 queries"', header)
+        self.assertIn('"route": "enviomaterial-list"', logs.output[0])
+
+    def test_disabled_for_other_routes(self):
+        response = self.client.get(reverse('perfil-list'))
+        self.assertNotIn('Server-Timing', response)
+
+
+def _incrementar_metricas(vezes):
+    for _ in range(vezes):
+        metrics.inc("http_requests_total", {"route": "teste", "method": "GET", "status": 200})
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = popular_base(1)
+
+    def setUp(self):
+        limpar_caches()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings_override = override_settings(METRICS_DB_PATH=str(Path(tmp.name) / "metrics.sqlite3"))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = cliente_autenticado(self.admin_user)
+
+    def test_request_metrics_exposed(self):
+        self.client.get(reverse('enviomaterial-list'))
+        self.client.get(reverse('enviomaterial-list'))
+        body = self.client.get(reverse('metrics')).content.decode()
+
+        self.assertIn('# TYPE http_requests_total counter', body)
+        self.assertIn('http_requests_total{method="GET",route="enviomaterial-list",status="200"} 2.0', body)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn('http_request_duration_seconds_bucket{le="+Inf",method="GET",route="enviomaterial-list"} 2.0', body)
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="enviomaterial-list"} 2.0', body)
+        self.assertIn('http_request_db_queries_total{route="enviomaterial-list"} 7.0', body)
+
+    def test_cache_hits_and_misses_counted(self):
+        cache.get('chave')
+        cache.set('chave', 1)
+        cache.get('chave')
+        body = metrics.render_prometheus()
+        self.assertIn('cache_requests_total{cache="default",result="hit"} 1.0', body)
+        self.assertIn('cache_requests_total{cache="default",result="miss"} 1.0', body)
+
+    def test_unresolved_routes_grouped(self):
+        self.client.get('/nao-existe/')
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('route="unmatched",status="404"', body)
+
+    def test_throttle_rejections_counted(self):
+        class UmPorHora(AnonTokenBucketThrottle):
+            rate = '1/hour'
+
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        self.assertTrue(UmPorHora().allow_request(request, None))
+        self.assertFalse(UmPorHora().allow_request(request, None))
+        body = metrics.render_prometheus()
+        self.assertIn('throttle_rejections_total{scope="anon"} 1.0', body)
+
+    @skipUnless(settings.DB_POOL, "Defina DB_POOL=True para testar as métricas do pool")
+    def test_pool_metrics_exposed(self):
+        # Só a leitura do /metrics registra o pool: as estatísticas têm de sair na mesma resposta
+        with mock.patch.object(db_pool, 'RECORD_INTERVAL', 3600), \
+                mock.patch.object(db_pool, '_last_record', time.monotonic()):
+            self.client.get(reverse('perfil-list'))
+            body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('# TYPE db_pool_in_use gauge', body)
+        self.assertIn('db_pool_max_size{alias="default",pid=', body)
+        self.assertIn('db_pool_requests_total{alias="default"}', body)
+
+    @override_settings(METRICS_TOKEN='segredo')
+    def test_token_required_when_configured(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        response = APIClient().get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(response.status_code, 200)
+
+    def test_counters_aggregate_across_processes(self):
+        contexto = multiprocessing.get_context('fork')
+        processos = [contexto.Process(target=_incrementar_metricas, args=(50,)) for _ in range(4)]
+        for processo in processos:
+            processo.start()
+        for processo in processos:
+            processo.join()
+        body = metrics.render_prometheus()
+        self.assertIn('http_requests_total{method="GET",route="teste",status="200"} 200.0', body)
+
+
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = popular_base(1)
+        cls.professor = Usuario.objects.get(matricula="PROF0000")
+
+    def setUp(self):
+        limpar_caches()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.profile_dir = Path(tmp.name)
+        settings_override = override_settings(PROFILE_DIR=tmp.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def client_for(self, usuario):
+        return cliente_autenticado(usuario)
+
+    def test_staff_profile_saved_with_route_name(self):
+        with self.assertLogs('api.profiling', level='INFO') as logs:
+            response = self.client_for(self.admin_user).get(
+                reverse('dashboard-envios-dashboard-geral'), HTTP_X_PROFILE='1'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('"event": "profile"', logs.output[0])
+        arquivo = response['X-Profile-File']
+        self.assertTrue(arquivo.startswith('dashboard-envios-dashboard-geral-'))
+        stats = pstats.Stats(str(self.profile_dir / arquivo))
+        self.assertTrue(any(func[2] == '_get_dashboard_data' for func in stats.stats))
+
+    def test_staff_profile_download(self):
+        with self.assertLogs('api.profiling', level='INFO'):
+            response = self.client_for(self.admin_user).get(reverse('enviomaterial-list'), {'_profile': 'download'})
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertEqual(response['X-Profile-Status'], '200')
+        self.assertIn('attachment;', response['Content-Disposition'])
+
+    def test_never_for_non_staff(self):
+        for client in (self.client_for(self.professor), APIClient()):
+            response = client.get(reverse('perfil-list'), {'_profile': 'download'}, HTTP_X_PROFILE='1')
+            self.assertNotIn('X-Profile-File', response)
+            self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(list(self.profile_dir.iterdir()), [])
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def test_reads_go_to_primary_outside_read_actions(self):
+        self.assertEqual(db_routers.ReplicaRouter().db_for_read(EnvioMaterial), 'default')
+
+    def test_write_pins_request_to_primary(self):
+        router = db_routers.ReplicaRouter()
+        state = db_routers._RoutingState()
+        state.use_replica = True
+        token = db_routers._state.set(state)
+        try:
+            self.assertEqual(router.db_for_read(EnvioMaterial), 'replica')
+            self.assertEqual(router.db_for_write(EnvioMaterial), 'default')
+            self.assertEqual(router.db_for_read(EnvioMaterial), 'default')
+        finally:
+            db_routers._state.reset(token)
+
+
+    def sticky_middleware(self, get_response):
+        with mock.patch.object(db_routers, 'replica_enabled', return_value=True):
+            return ReplicaStickyMiddleware(get_response)
+
+    def test_unsafe_request_pins_user_without_router_write(self):
+        # SQL direto (upsert, gerar-pendentes) não passa pelo db_for_write
+        caches[settings.REPLICA_STICKY_CACHE].delete_many(['replica:sticky:41', 'replica:sticky:42'])
+        usuario = mock.Mock(is_authenticated=True, pk=42)
+        middleware = self.sticky_middleware(lambda request: HttpResponse(status=200))
+        request = RequestFactory().post('/')
+        request.user = usuario
+        with mock.patch.object(db_routers, 'replica_enabled', return_value=True):
+            middleware(request)
+            self.assertTrue(db_routers.is_sticky(42))
+
+            falha = self.sticky_middleware(lambda request: HttpResponse(status=400))
+            request = RequestFactory().post('/')
+            request.user = mock.Mock(is_authenticated=True, pk=41)
+            falha(request)
+            self.assertFalse(db_routers.is_sticky(41))
+
+    def test_async_view_reports_user_written(self):
+        caches[settings.REPLICA_STICKY_CACHE].delete('replica:sticky:43')
+
+        async def login(request):
+            # Como o login: o usuário só é conhecido na view
+            db_routers.note_write(43)
+            return HttpResponse(status=200)
+
+        middleware = self.sticky_middleware(login)
+        request = RequestFactory().post('/')
+        request.user = AnonymousUser()
+        with mock.patch.object(db_routers, 'replica_enabled', return_value=True):
+            asyncio.run(middleware(request))
+            self.assertTrue(db_routers.is_sticky(43))
+
+
+@skipUnless('replica' in settings.DATABASES, "Defina DB_REPLICA_NAME/DB_REPLICA_HOST para testar a réplica")
+@override_settings(DASHBOARD_QUERY_WORKERS=0)
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    TransactionTestCase: a réplica (TEST MIRROR) é outra conexão e só enxerga dados confirmados.
+    Os dashboards rodam em sequência para as consultas ficarem nas conexões capturadas.
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        self.admin_user = popular_base(1)
+        limpar_caches()
+        get_cached_user(self.admin_user.pk)
+        self.client = cliente_autenticado(self.admin_user)
+
+    def queries_by_alias(self, method, url, data=None):
+        with CaptureQueriesContext(connections['default']) as primario, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = getattr(self.client, method)(url, data, format='json')
+        return response, len(primario), len(replica)
+
+    def test_read_actions_use_replica(self):
+        for name in ('enviomaterial-list', 'enviomaterial-stats', 'enviomaterial-overdue',
+                     'enviomaterial-pending', 'dashboard-envios-dashboard-geral'):
+            with self.subTest(name=name):
+                response, primario, replica = self.queries_by_alias('get', reverse(name))
+                self.assertEqual(response.status_code, 200)
+                # No primário fica apenas o throttle (o usuário do JWT vem do cache)
+                self.assertEqual(primario, 1)
+                self.assertGreater(replica, 0)
+
+    def test_write_actions_and_sticky_window_use_primary(self):
+        envio = EnvioMaterial.objects.first()
+        response, _, replica = self.queries_by_alias(
+            'post', reverse('enviomaterial-validar', kwargs={'pk': envio.pk}), {'validado': True}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(replica, 0)
+
+        response, _, replica = self.queries_by_alias('get', reverse('enviomaterial-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(replica, 0)
+
+        caches[settings.REPLICA_STICKY_CACHE].clear()
+        _, _, replica = self.queries_by_alias('get', reverse('enviomaterial-list'))
+        self.assertGreater(replica, 0)
+
+    def test_raw_sql_write_pins_user(self):
+        # gerar-pendentes grava com SQL direto, sem passar pelo db_for_write
+        response, _, _ = self.queries_by_alias('post', reverse('enviomaterial-gerar-pendentes'), {'mes': 1, 'ano': 2026})
+        self.assertEqual(response.status_code, 201)
+        _, _, replica = self.queries_by_alias('get', reverse('enviomaterial-list'))
+        self.assertEqual(replica, 0)
+
+
+class DashboardConcurrencyTests(TransactionTestCase):
+    """
+    TransactionTestCase: as threads do dashboard usam outras conexões, que só enxergam dados confirmados.
+    """
+    DEMORA = 0.3
+
+    def setUp(self):
+        self.admin_user = popular_base(1)
+        limpar_caches()
+        self.addCleanup(dashboard.shutdown_executor)
+        self.client = cliente_autenticado(self.admin_user)
+
+    def lenta(self, parte, conexoes):
+        def executar(queryset, context):
+            with connections[queryset.db].cursor() as cursor:
+                cursor.execute("SELECT pg_backend_pid() FROM pg_sleep(%s)", [self.DEMORA])
+                conexoes.append(cursor.fetchone()[0])
+            return parte(queryset, context)
+        return executar
+
+    def test_aggregates_run_concurrently_on_separate_connections(self):
+        url = reverse('dashboard-envios-dashboard-geral')
+        with override_settings(DASHBOARD_QUERY_WORKERS=0):
+            esperado = self.client.get(url).data
+
+        conexoes = []
+        partes = tuple(self.lenta(parte, conexoes) for parte in dashboard.PARTES)
+        with mock.patch.object(dashboard, 'PARTES', partes):
+            inicio = time.perf_counter()
+            response = self.client.get(url)
+            duracao = time.perf_counter() - inicio
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, esperado)
+        self.assertEqual(len(set(conexoes)), len(partes))
+        # Perto da parte mais lenta, longe da soma das quatro
+        self.assertLess(duracao, self.DEMORA * 2)
+
+    def test_threaded_path_query_budget(self):
+        # Fora do bloco atômico dos testes: as partes rodam nas threads do executor, em
+        # outras conexões, que o CaptureQueriesContext não vê; o QueryCounter acompanha o contexto
+        url = reverse('dashboard-envios-dashboard-geral')
+        self.client.get(url)
+        contador = QueryCounter()
+        contador.start()
+        try:
+            response = self.client.get(url)
+        finally:
+            contador.stop()
+        self.assertEqual(response.status_code, 200)
+        # throttle + uma consulta por parte
+        self.assertEqual(contador.queries, 1 + len(dashboard.PARTES))
+
+    @skipUnless(not settings.DB_POOL, "Com DB_POOL=True cada parte pega a conexão do pool")
+    def test_worker_connections_reused_across_requests(self):
+        abertas = []
+
+        def contar(sender, connection, **kwargs):
+            abertas.append(connection)
+
+        connection_created.connect(contar)
+        self.addCleanup(connection_created.disconnect, contar)
+        for _ in range(3):
+            self.assertEqual(self.client.get(reverse('dashboard-envios-dashboard-geral')).status_code, 200)
+        # Uma conexão por thread do executor, mantida entre as requisições (DB_CONN_MAX_AGE)
+        self.assertLessEqual(len(abertas), settings.DASHBOARD_QUERY_WORKERS)
+
+
+class TokenBucketThrottleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = popular_base(1)
+
+    def request_for(self, usuario):
+        request = RequestFactory().get('/')
+        request.user = usuario
+        return request
+
+    def test_cost_per_action_and_shared_bucket(self):
+        class DezPorHora(UserTokenBucketThrottle):
+            rate = '10/hour'
+
+        view = DashboardEnvioViewSet(action='dashboard_geral')
+        request = self.request_for(self.admin_user)
+        # Instâncias diferentes (como em workers diferentes) usam o mesmo balde
+        self.assertTrue(DezPorHora().allow_request(request, view))
+        self.assertTrue(DezPorHora().allow_request(request, view))
+        throttle = DezPorHora()
+        self.assertFalse(throttle.allow_request(request, view))
+        # 5 tokens a 10/hora: ~30 minutos
+        self.assertAlmostEqual(throttle.wait(), 1800, delta=5)
+
+        self.assertEqual(ThrottleBucket.objects.get(chave=throttle.key).permitido, False)
+
+    def test_rejected_request_does_not_consume_tokens(self):
+        class CincoPorHora(UserTokenBucketThrottle):
+            rate = '5/hour'
+
+        request = self.request_for(self.admin_user)
+        cara = DashboardEnvioViewSet(action='dashboard_geral')
+        barata = DashboardEnvioViewSet(action='dashboard_me')
+        self.assertTrue(CincoPorHora().allow_request(request, barata))
+        self.assertFalse(CincoPorHora().allow_request(request, cara))
+        for _ in range(4):
+            self.assertTrue(CincoPorHora().allow_request(request, barata))
+        self.assertFalse(CincoPorHora().allow_request(request, barata))
+
+    def test_cost_above_capacity_is_capped(self):
+        class DoisPorHora(UserTokenBucketThrottle):
+            rate = '2/hour'
+
+        # dashboard_geral custa 5: com o balde cheio, passa consumindo a capacidade toda
+        view = DashboardEnvioViewSet(action='dashboard_geral')
+        request = self.request_for(self.admin_user)
+        self.assertTrue(DoisPorHora().allow_request(request, view))
+        throttle = DoisPorHora()
+        self.assertFalse(throttle.allow_request(request, view))
+        self.assertAlmostEqual(throttle.wait(), 3600, delta=5)
+
+    def test_prune_removes_only_idle_buckets(self):
+        agora = timezone.now()
+        ThrottleBucket.objects.create(chave='parado', tokens=0, atualizado_em=agora - timedelta(days=2))
+        ThrottleBucket.objects.create(chave='ativo', tokens=0, atualizado_em=agora - timedelta(minutes=5))
+        out = io.StringIO()
+        call_command('prune_throttle', stdout=out)
+        self.assertEqual(list(ThrottleBucket.objects.values_list('chave', flat=True)), ['ativo'])
+        self.assertIn('1 baldes removidos', out.getvalue())
+
+    def test_api_returns_429_with_retry_after(self):
+        client = cliente_autenticado(self.admin_user)
+        with mock.patch.dict(UserTokenBucketThrottle.THROTTLE_RATES, {'user': '5/hour'}):
+            self.assertEqual(client.get(reverse('dashboard-envios-dashboard-geral')).status_code, 200)
+            response = client.get(reverse('dashboard-envios-dashboard-geral'))
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = popular_base(1)
+
+    def setUp(self):
+        limpar_caches()
+        self.client = cliente_autenticado(self.admin_user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connections['default']) as ctx:
+            response = self.client.get(url)
+        return response, len(ctx.captured_queries)
+
+    def test_cached_user_saves_one_query(self):
+        _, primeira = self.count_queries(reverse('usuario-me'))
+        response, segunda = self.count_queries(reverse('usuario-me'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(segunda, primeira - 1)
+
+    def test_deactivated_user_rejected_after_save(self):
+        self.assertEqual(self.client.get(reverse('usuario-me')).status_code, 200)
+        self.admin_user.is_active = False
+        self.admin_user.save()
+        self.assertEqual(self.client.get(reverse('usuario-me')).status_code, 401)
+
+    def test_perfil_change_invalidates_users(self):
+        self.client.get(reverse('usuario-me'))
+        cache_usuarios = caches[settings.AUTH_USER_CACHE]
+        self.assertIsNotNone(cache_usuarios.get(user_cache_key(self.admin_user.pk)))
+        perfil = self.admin_user.id_perfil
+        perfil.nome_perfil = 'Administração'
+        perfil.save()
+        self.assertIsNone(cache_usuarios.get(user_cache_key(self.admin_user.pk)))
+
+    def test_password_hash_not_cached(self):
+        self.client.get(reverse('usuario-me'))
+        usuario = caches[settings.AUTH_USER_CACHE].get(user_cache_key(self.admin_user.pk))
+        self.assertIn('password', usuario.get_deferred_fields())
+
+
+class LoginTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Hasher padrão (PBKDF2): o custo real do login
+        cls.admin_user = popular_base(1)
+
+    def setUp(self):
+        limpar_caches()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings_override = override_settings(METRICS_DB_PATH=str(Path(tmp.name) / "metrics.sqlite3"))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.url = reverse('token_obtain_pair')
+
+    def login(self, **data):
+        return self.client.post(self.url, data, content_type='application/json')
+
+    def test_returns_token_pair(self):
+        response = self.login(matricula='ADMIN', password='senha123')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {'refresh', 'access'})
+        me = self.client.get(reverse('usuario-me'), HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+        self.assertEqual(me.json()['matricula'], 'ADMIN')
+        self.assertIn('login_requests_total{result="success"} 1.0', metrics.render_prometheus())
+
+    def test_invalid_credentials(self):
+        self.assertEqual(self.login(matricula='ADMIN', password='errada').status_code, 401)
+        self.assertEqual(self.login(matricula='NINGUEM', password='senha123').status_code, 401)
+        self.assertEqual(self.login(matricula='ADMIN').json(), {'password': ['Este campo é obrigatório.']})
+        Usuario.objects.filter(pk=self.admin_user.pk).update(is_active=False)
+        self.assertEqual(self.login(matricula='ADMIN', password='senha123').status_code, 401)
+
+    @override_settings(LOGIN_HASH_MAX_PENDING=0)
+    def test_full_pool_returns_503(self):
+        response = self.login(matricula='ADMIN', password='senha123')
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertIn('login_requests_total{result="overloaded"} 1.0', metrics.render_prometheus())
+
+    async def test_hashing_does_not_block_event_loop(self):
+        ticks = 0
+        done = asyncio.Event()
+
+        async def ticker():
+            nonlocal ticks
+            while not done.is_set():
+                ticks += 1
+                await asyncio.sleep(0.001)
+
+        task = asyncio.create_task(ticker())
+        response = await AsyncClient().post(
+            self.url, {'matricula': 'ADMIN', 'password': 'senha123'}, content_type='application/json'
+        )
+        done.set()
+        await task
+        self.assertEqual(response.status_code, 200)
+        # O loop seguiu rodando durante o PBKDF2 (centenas de ms)
+        self.assertGreater(ticks, 20)
+
+    async def test_queries_counted_under_asgi(self):
+        token = RefreshToken.for_user(self.admin_user).access_token
+        client = AsyncClient()
+        response = await client.get(reverse('enviomaterial-list'), headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+        body = await client.get(reverse('metrics'))
+        self.assertIn('http_request_db_queries_total{route="enviomaterial-list"}', body.content.decode())
+
+    async def test_metrics_flush_does_not_block_event_loop(self):
+        metrics.get_store().collect()
+        # Outro worker com o lock de escrita do SQLite por 0,3 s: a gravação das métricas espera
+        bloqueio = sqlite3.connect(settings.METRICS_DB_PATH, isolation_level=None, check_same_thread=False)
+        self.addCleanup(bloqueio.close)
+        bloqueio.execute("BEGIN IMMEDIATE")
+        threading.Timer(0.3, bloqueio.rollback).start()
+
+        ticks = 0
+        done = asyncio.Event()
+
+        async def ticker():
+            nonlocal ticks
+            while not done.is_set():
+                ticks += 1
+                await asyncio.sleep(0.001)
+
+        task = asyncio.create_task(ticker())
+        response = await AsyncClient().get(reverse('enviomaterial-list'))
+        done.set()
+        await task
+        self.assertEqual(response.status_code, 401)
+        self.assertGreater(ticks, 100)
+        self.assertIn('http_requests_total{method="GET",route="enviomaterial-list",status="401"} 1.0',
+                      metrics.render_prometheus())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class UserImportTests(TestCase):
+    CSV = (
+        "matricula;cpf;nome_usuario;perfil;telefone;senha\n"
+        "NOVO1;200.000.000-01;Ana;professor;(11) 91234-5678;s1\n"
+        "NOVO2;200-000;Bruno;Professor;;s2\n"
+        "NOVO1;200.000.000-03;Carla;Professor;;s3\n"
+        "NOVO4;100.000.000-00;Davi;Professor;;s4\n"
+        "NOVO5;200.000.000-05;Eva;Diretor;;s5\n"
+        "NOVO6;200.000.000-06;Fábio;Coordenador;;s6\n"
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = popular_base(1)
+
+    def test_command_imports_valid_rows_and_reports_errors(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as arquivo:
+            arquivo.write(self.CSV)
+        self.addCleanup(Path(arquivo.name).unlink)
+        stdout, stderr = io.StringIO(), io.StringIO()
+        # Pool próprio de duas threads, mesmo abaixo de PARALLEL_MIN_ROWS
+        with mock.patch.object(user_import, 'PARALLEL_MIN_ROWS', 1):
+            call_command('import_usuarios', arquivo.name, workers=2, stdout=stdout, stderr=stderr)
+
+        self.assertIn('2 usuários importados, 4 linhas com erro', stdout.getvalue())
+        erros = stderr.getvalue()
+        self.assertIn('linha 3: cpf: CPF deve estar no formato', erros)
+        self.assertIn('linha 4: matricula: NOVO1 repetido no arquivo (linha 2)', erros)
+        self.assertIn('linha 5: cpf: 100.000.000-00 já cadastrado', erros)
+        self.assertIn('linha 6: perfil: Diretor não existe', erros)
+
+        ana = Usuario.objects.select_related('id_perfil').get(matricula='NOVO1')
+        self.assertEqual((ana.nome_usuario, ana.id_perfil.nome_perfil), ('Ana', 'Professor'))
+        self.assertTrue(ana.check_password('s1'))
+        self.assertTrue(Usuario.objects.get(matricula='NOVO6').check_password('s6'))
+
+    def test_uniqueness_checked_per_batch(self):
+        linhas = [
+            json.dumps({'matricula': f'LOTE{i}', 'cpf': f'300.000.{i:03d}-00', 'nome_usuario': f'Usuário {i}',
+                        'perfil': 'Professor', 'senha': 'senha'})
+            for i in range(30)
+        ]
+        # Perfis + (verificação de unicidade + INSERT) por lote de 10 + savepoint
+        with self.assertNumQueries(1 + 2 * 3 + 2):
+            result = import_users(io.StringIO("\n".join(linhas)), 'jsonl', workers=1, batch_size=10)
+        self.assertEqual((result.importados, result.erros), (30, {}))
+
+    def test_large_batches_use_login_hash_pool(self):
+        linhas = [
+            json.dumps({'matricula': f'POOL{i}', 'cpf': f'400.000.{i:03d}-00', 'nome_usuario': f'Usuário {i}',
+                        'perfil': 'Professor', 'senha': f'senha{i}'})
+            for i in range(12)
+        ]
+        pool = get_hash_pool()
+        # Lote de 10 no pool; o de 2, abaixo do limite, na própria thread
+        with mock.patch.object(user_import, 'PARALLEL_MIN_ROWS', 5), \
+                mock.patch.object(pool, 'map', wraps=pool.map) as mapa:
+            result = import_users(io.StringIO("\n".join(linhas)), 'jsonl', batch_size=10)
+        self.assertEqual((result.importados, result.erros), (12, {}))
+        self.assertEqual(mapa.call_count, 1)
+        self.assertEqual(len(mapa.call_args.args[1]), 10)
+        self.assertTrue(Usuario.objects.get(matricula='POOL7').check_password('senha7'))
+        self.assertTrue(Usuario.objects.get(matricula='POOL11').check_password('senha11'))
+
+    def test_dry_run_writes_nothing(self):
+        result = import_users(io.StringIO(self.CSV), 'csv', dry_run=True)
+        self.assertEqual(result.importados, 2)
+        self.assertFalse(Usuario.objects.filter(matricula='NOVO1').exists())
+
+    def test_admin_upload(self):
+        self.client.force_login(self.admin_user)
+        url = reverse('admin:api_usuario_importar')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        arquivo = SimpleUploadedFile('usuarios.csv', self.CSV.encode(), content_type='text/csv')
+        response = self.client.post(url, {'arquivo': arquivo})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'repetido no arquivo')
+        self.assertTrue(Usuario.objects.filter(matricula='NOVO6').exists())
+
+
+class SMTPStandInHandler(socketserver.StreamRequestHandler):
+    """
+    Servidor SMTP mínimo para os testes: aceita tudo, menos os destinatários em
+    `server.recusados`, e guarda as mensagens recebidas.
+    """
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.server.conexoes += 1
+        self.reply("220 localhost")
+        while line := self.rfile.readline():
+            comando = line.decode(errors="replace").strip()
+            verbo = comando[:4].upper()
+            if verbo in ("EHLO", "HELO"):
+                self.reply("250 localhost")
+            elif verbo == "RCPT" and any(recusado in comando for recusado in self.server.recusados):
+                self.reply("550 Caixa postal inexistente")
+            elif verbo == "DATA":
+                self.reply("354 Termine com <CRLF>.<CRLF>")
+                linhas = []
+                while (dado := self.rfile.readline()) not in (b".\r\n", b""):
+                    linhas.append(dado)
+                self.server.mensagens.append(b"".join(linhas).decode(errors="replace"))
+                self.reply("250 OK")
+            elif verbo == "QUIT":
+                self.reply("221 Até logo")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class OutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = popular_base(1)
+
+    def setUp(self):
+        limpar_caches()
+        self.smtp = socketserver.ThreadingTCPServer(("127.0.0.1", 0), SMTPStandInHandler)
+        self.smtp.daemon_threads = True
+        self.smtp.conexoes, self.smtp.mensagens, self.smtp.recusados = 0, [], set()
+        threading.Thread(target=self.smtp.serve_forever, daemon=True).start()
+        self.addCleanup(self.smtp.server_close)
+        self.addCleanup(self.smtp.shutdown)
+
+        spool = tempfile.TemporaryDirectory()
+        self.addCleanup(spool.cleanup)
+        self.spool = Path(spool.name)
+        settings_override = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=self.smtp.server_address[1], EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='', DEFAULT_FROM_EMAIL='sistema@example.com',
+            EMAIL_SPOOL_DIR=spool.name, EMAIL_OUTBOX_MAX_ATTEMPTS=2,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def enfileirar(self, *destinatarios):
+        return [
+            EmailOutbox.objects.create(destinatario=destinatario, assunto='Aviso', corpo='Corpo')
+            for destinatario in destinatarios
+        ]
+
+    def test_upload_is_spooled_and_sent_by_worker(self):
+        client = cliente_autenticado(self.admin_user)
+        upload = SimpleUploadedFile('plano.txt', b'conteudo do plano', content_type='text/plain')
+        response = client.post(reverse('file-upload'), {'email': 'professor@example.com', 'file': upload},
+                               format='multipart')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.smtp.mensagens, [])
+        self.assertEqual(len(list(self.spool.iterdir())), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('send_outbox', stdout=io.StringIO())
+
+        self.assertEqual(len(self.smtp.mensagens), 1)
+        self.assertIn('filename="plano.txt"', self.smtp.mensagens[0])
+        item = EmailOutbox.objects.get(pk=response.data['id'])
+        self.assertEqual((item.status, item.tentativas), (EmailOutbox.ENVIADO, 1))
+        self.assertEqual(list(self.spool.iterdir()), [])
+
+    def test_batch_reuses_one_connection(self):
+        self.enfileirar('a@example.com', 'b@example.com', 'c@example.com')
+        self.assertEqual(send_pending(), (3, 0))
+        self.assertEqual((self.smtp.conexoes, len(self.smtp.mensagens)), (1, 3))
+
+    def test_failures_retried_with_backoff_then_marked_failed(self):
+        self.smtp.recusados.add('ruim@example.com')
+        ruim, _ = self.enfileirar('ruim@example.com', 'bom@example.com')
+        with self.assertLogs('api.outbox', 'WARNING'):
+            self.assertEqual(send_pending(), (1, 1))
+        ruim.refresh_from_db()
+        self.assertEqual((ruim.status, ruim.tentativas), (EmailOutbox.PENDENTE, 1))
+        self.assertIn('SMTPRecipientsRefused', ruim.ultimo_erro)
+        self.assertGreater(ruim.proxima_tentativa_em, ruim.criado_em)
+        # Ainda no intervalo de espera
+        self.assertEqual(send_pending(), (0, 0))
+
+        EmailOutbox.objects.filter(pk=ruim.pk).update(proxima_tentativa_em=ruim.criado_em)
+        with self.assertLogs('api.outbox', 'WARNING'):
+            self.assertEqual(send_pending(), (0, 1))
+        ruim.refresh_from_db()
+        self.assertEqual((ruim.status, ruim.tentativas), (EmailOutbox.FALHOU, 2))
+
+    def test_failure_reopens_one_connection_for_the_rest(self):
+        self.smtp.recusados.add('ruim@example.com')
+        self.enfileirar('a@example.com', 'ruim@example.com', 'b@example.com', 'c@example.com')
+        with self.assertLogs('api.outbox', 'WARNING'):
+            self.assertEqual(send_pending(), (3, 1))
+        self.assertEqual((self.smtp.conexoes, len(self.smtp.mensagens)), (2, 3))
+
+    def test_unreadable_attachment_fails_only_its_message(self):
+        _, com_anexo, _ = self.enfileirar('a@example.com', 'b@example.com', 'c@example.com')
+        EmailOutbox.objects.filter(pk=com_anexo.pk).update(anexo='sumiu.txt', anexo_nome='plano.txt')
+        with self.assertLogs('api.outbox', 'WARNING'):
+            self.assertEqual(send_pending(), (2, 1))
+        # A mesma conexão SMTP atende as outras mensagens
+        self.assertEqual((self.smtp.conexoes, len(self.smtp.mensagens)), (1, 2))
+        com_anexo.refresh_from_db()
+        self.assertEqual((com_anexo.status, com_anexo.tentativas), (EmailOutbox.FALHOU, 1))
+        self.assertIn('FileNotFoundError', com_anexo.ultimo_erro)
+
+    def test_claimed_batch_is_skipped_while_sending(self):
+        self.enfileirar('a@example.com', 'b@example.com')
+        concorrentes = []
+
+        def build(item, storage):
+            # Outro worker no meio do envio: o lote já está reservado
+            concorrentes.append(send_pending())
+            return EmailMessage(subject=item.assunto, body=item.corpo, to=[item.destinatario])
+
+        with mock.patch('api.outbox.build_message', build):
+            self.assertEqual(send_pending(), (2, 0))
+        self.assertEqual(concorrentes, [(0, 0), (0, 0)])
+        self.assertEqual(set(EmailOutbox.objects.values_list('status', flat=True)), {EmailOutbox.ENVIADO})
+
+    def test_smtp_unavailable_counts_as_attempt(self):
+        self.enfileirar('a@example.com')
+        with override_settings(EMAIL_PORT=1), self.assertLogs('api.outbox', 'WARNING'):
+            self.assertEqual(send_pending(), (0, 1))
+        self.assertEqual(EmailOutbox.objects.get().tentativas, 1)
+
+
+class ArquivoMaterialTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = popular_base(1)
+        cls.envio = EnvioMaterial.objects.order_by('id').first()
+
+    def setUp(self):
+        limpar_caches()
+        materiais = tempfile.TemporaryDirectory()
+        self.addCleanup(materiais.cleanup)
+        self.materiais = Path(materiais.name)
+        settings_override = override_settings(MATERIAL_STORAGE_DIR=materiais.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = cliente_autenticado(self.admin_user)
+
+    def anexar(self, nome, conteudo):
+        url = reverse('enviomaterial-arquivos', kwargs={'pk': self.envio.pk})
+        return self.client.post(url, {'file': SimpleUploadedFile(nome, conteudo)}, format='multipart')
+
+    def baixar(self, arquivo_id, **headers):
+        url = reverse('enviomaterial-baixar-arquivo', kwargs={'pk': self.envio.pk, 'arquivo_id': arquivo_id})
+        response = self.client.get(url, headers=headers)
+        return response
+
+    def enviar_bloco(self, sessao_id, offset, dados):
+        url = reverse('upload-detail', kwargs={'pk': sessao_id})
+        return self.client.patch(f'{url}?offset={offset}', dados, content_type='application/octet-stream')
+
+    def test_same_content_stored_once(self):
+        conteudo = b"plano de aula\n" * 10000
+        primeiro = self.anexar("plano.txt", conteudo)
+        segundo = self.anexar("copia.txt", conteudo)
+        self.assertEqual(primeiro.status_code, 201, primeiro.data)
+        self.assertEqual(segundo.data['sha256'], primeiro.data['sha256'])
+        self.assertEqual(segundo.data['tamanho'], len(conteudo))
+
+        self.assertEqual(ArquivoMaterial.objects.count(), 1)
+        self.assertEqual(ArquivoEnvio.objects.filter(id_envio=self.envio).count(), 2)
+        blobs = [path for path in self.materiais.rglob('*') if path.is_file()]
+        self.assertEqual(blobs, [get_storage().path(primeiro.data['sha256'])])
+        self.assertEqual(blobs[0].read_bytes(), conteudo)
+
+        listagem = self.client.get(reverse('enviomaterial-arquivos', kwargs={'pk': self.envio.pk}))
+        self.assertEqual([item['nome'] for item in listagem.data], ["plano.txt", "copia.txt"])
+
+    def test_resumable_upload_in_chunks(self):
+        conteudo = bytes(range(256)) * 1000
+        criada = self.client.post(reverse('upload-list'), {
+            'id_envio': self.envio.pk, 'nome': 'video.mp4', 'tipo': 'video/mp4', 'tamanho': len(conteudo),
+        }, format='json')
+        self.assertEqual(criada.status_code, 201, criada.data)
+        sessao_id = criada.data['id']
+
+        response = self.enviar_bloco(sessao_id, 0, conteudo[:100000])
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response['Upload-Offset'], '100000')
+
+        # Bloco repetido (ex: resposta perdida): 409 com o offset para retomar
+        response = self.enviar_bloco(sessao_id, 0, conteudo[:100000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['recebido'], 100000)
+        consulta = self.client.get(reverse('upload-detail', kwargs={'pk': sessao_id}))
+        self.assertEqual(consulta.data['recebido'], 100000)
+
+        # Mais bytes que o declarado
+        response = self.enviar_bloco(sessao_id, 100000, conteudo[100000:] + b"extra")
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.data['recebido'], 100000)
+
+        response = self.enviar_bloco(sessao_id, 100000, conteudo[100000:])
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['nome'], 'video.mp4')
+        self.assertFalse(UploadSessao.objects.filter(pk=sessao_id).exists())
+        self.assertFalse(get_storage().partial_path(sessao_id).exists())
+        self.assertEqual(get_storage().path(response.data['sha256']).read_bytes(), conteudo)
+
+    def test_download_with_range(self):
+        conteudo = b"0123456789" * 1000
+        arquivo = self.anexar("numeros.txt", conteudo).data
+
+        completo = self.baixar(arquivo['id'])
+        self.assertEqual(completo.status_code, 200)
+        self.assertEqual(completo['Accept-Ranges'], 'bytes')
+        self.assertEqual(completo.getvalue(), conteudo)
+
+        parcial = self.baixar(arquivo['id'], Range='bytes=10-19')
+        self.assertEqual(parcial.status_code, 206)
+        self.assertEqual(parcial['Content-Range'], f'bytes 10-19/{len(conteudo)}')
+        self.assertEqual(parcial.getvalue(), conteudo[10:20])
+
+        final = self.baixar(arquivo['id'], Range='bytes=-5', **{'If-Range': completo['ETag']})
+        self.assertEqual(final.status_code, 206)
+        self.assertEqual(final.getvalue(), conteudo[-5:])
+
+        # If-Range com outro ETag: o arquivo mudou, vai inteiro
+        mudou = self.baixar(arquivo['id'], Range='bytes=10-19', **{'If-Range': '"outro"'})
+        self.assertEqual(mudou.status_code, 200)
+        self.assertEqual(mudou.getvalue(), conteudo)
+
+        fora = self.baixar(arquivo['id'], Range=f'bytes={len(conteudo)}-')
+        self.assertEqual(fora.status_code, 416)
+        self.assertEqual(fora['Content-Range'], f'bytes */{len(conteudo)}')
+
+    def test_suffix_range_of_empty_file_not_satisfiable(self):
+        self.assertIs(parse_range('bytes=-5', 0), False)
+        # A API recusa arquivos vazios; gravado direto, como um arquivo já existente
+        arquivo = store_upload(self.envio, SimpleUploadedFile("vazio.txt", b""), self.admin_user)
+        response = self.baixar(arquivo.pk, Range='bytes=-5')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */0')
+
+    def test_period_bundle_streams_zip_with_manifest(self):
+        texto = b"plano de aula\n" * 20000
+        pdf = bytes(range(256)) * 2000
+        self.anexar("plano.txt", texto)
+        self.anexar("apostila.pdf", pdf)
+        self.anexar("plano.txt", texto)
+        envio = self.envio
+
+        url = reverse('enviomaterial-pacote')
+        response = self.client.get(
+            f'{url}?mes={envio.mes_referencia}&ano={envio.ano_referencia}&etapa={envio.id_etapa_id}'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        partes = list(response.streaming_content)
+        # Enviado aos poucos, nunca o arquivo inteiro de uma vez
+        self.assertGreater(len(partes), 3)
+        self.assertLessEqual(max(len(parte) for parte in partes), 2 * CHUNK_SIZE)
+
+        with zipfile.ZipFile(io.BytesIO(b"".join(partes))) as pacote:
+            self.assertIsNone(pacote.testzip())
+            nomes = pacote.namelist()
+            self.assertEqual(nomes[0], 'manifest.json')
+            self.assertEqual(len(nomes), 4)
+            entradas = {info.filename: info for info in pacote.infolist()}
+            txt, pdf_nome, repetido = nomes[1:]
+            self.assertTrue(txt.endswith('/plano.txt'))
+            self.assertNotEqual(repetido, txt)
+            self.assertEqual(entradas[txt].compress_type, zipfile.ZIP_DEFLATED)
+            self.assertEqual(entradas[pdf_nome].compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(pacote.read(pdf_nome), pdf)
+            self.assertEqual(pacote.read(repetido), texto)
+
+            manifesto = json.loads(pacote.read('manifest.json'))['envios']
+        do_periodo = EnvioMaterial.objects.filter(
+            mes_referencia=envio.mes_referencia, ano_referencia=envio.ano_referencia, id_etapa=envio.id_etapa,
+        )
+        self.assertEqual([item['id'] for item in manifesto], sorted(do_periodo.values_list('id', flat=True)))
+        item = next(item for item in manifesto if item['id'] == envio.pk)
+        self.assertEqual(item['disciplina'], envio.id_disciplina.nome_disciplina)
+        self.assertEqual([arquivo['caminho'] for arquivo in item['arquivos']], nomes[1:])
+
+        vazio = self.client.get(f'{url}?mes=1&ano=1990&etapa={envio.id_etapa_id}')
+        self.assertEqual(vazio.status_code, 404)
+
+
+class ServeCommandTests(SimpleTestCase):
+    def test_autotune_from_cpus(self):
+        self.assertEqual(serve.autotune("wsgi", 2), (5, serve.WSGI_THREADS))
+        self.assertEqual(serve.autotune("asgi", 2), (2, 1))
+
+    def test_cgroup_quota_limits_cpus(self):
+        with mock.patch("os.process_cpu_count", return_value=16), \
+                mock.patch("builtins.open", mock.mock_open(read_data="150000 100000\n")):
+            self.assertEqual(serve.available_cpus(), 2)
+        with mock.patch("os.process_cpu_count", return_value=16), \
+                mock.patch("builtins.open", mock.mock_open(read_data="max 100000\n")):
+            self.assertEqual(serve.available_cpus(), 16)
+
+    def test_check_prints_configuration(self):
+        stdout = io.StringIO()
+        with mock.patch.object(serve, "available_cpus", return_value=2):
+            call_command("serve", "--check", "--bind", "127.0.0.1:9000", stdout=stdout, stderr=io.StringIO())
+        self.assertIn("127.0.0.1:9000: 5 workers x 4 threads (gthread)", stdout.getvalue())
+
+    def test_warmup_steps_succeed(self):
+        resultados = warmup.warmup()
+        self.assertEqual([etapa for etapa, _, _ in resultados], [etapa for etapa, _ in warmup.STEPS])
+        for etapa, itens, _ in resultados:
+            with self.subTest(etapa=etapa):
+                self.assertTrue(itens)
+
+    @skipUnless(importlib.util.find_spec("gunicorn"), "gunicorn não está instalado")
+    def test_serves_and_reloads_gracefully(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            porta = sock.getsockname()[1]
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        log = Path(pasta.name) / "serve.log"
+        with open(log, "wb") as saida:
+            processo = subprocess.Popen(
+                [sys.executable, "manage.py", "serve", "--bind", f"127.0.0.1:{porta}", "--workers", "1",
+                 "--threads", "1", "--graceful-timeout", "5"],
+                cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL, stderr=saida,
+            )
+        self.addCleanup(processo.kill)
+
+        def aguardar_resposta():
+            limite = time.monotonic() + 60
+            while time.monotonic() < limite:
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{porta}/", timeout=2) as response:
+                        return response.status
+                except OSError:
+                    time.sleep(0.2)
+            self.fail("O servidor não respondeu")
+
+        self.assertEqual(aguardar_resposta(), 200)
+        processo.send_signal(signal.SIGHUP)
+        self.assertEqual(aguardar_resposta(), 200)
+        processo.send_signal(signal.SIGTERM)
+        self.assertEqual(processo.wait(timeout=30), 0)
+        self.assertIn("aquecido", log.read_text())
+
+
+
+class SchemaTests(TestCase):
+    def setUp(self):
+        schema.reset_schema_document()
+        self.addCleanup(schema.reset_schema_document)
+
+    def test_schema_file_is_current(self):
+        # Falha quando uma mudança na API não foi acompanhada de `build_schema`
+        call_command("build_schema", "--check", stdout=io.StringIO())
+
+    def test_schema_file_declares_jwt_auth(self):
+        documento = json.loads(Path(settings.OPENAPI_SCHEMA_FILE).read_bytes())
+        self.assertEqual(documento["components"]["securitySchemes"]["jwtAuth"]["scheme"], "bearer")
+        operacao = documento["paths"]["/api/envios-material/"]["get"]
+        self.assertIn({"jwtAuth": []}, operacao["security"])
+
+    def test_check_fails_when_stale(self):
+        with tempfile.NamedTemporaryFile(suffix=".json") as arquivo:
+            arquivo.write(b"{}\n")
+            arquivo.flush()
+            with self.assertRaisesMessage(CommandError, "desatualizado"):
+                call_command("build_schema", "--check", "--file", arquivo.name, stdout=io.StringIO())
+            call_command("build_schema", "--file", arquivo.name, stdout=io.StringIO())
+            call_command("build_schema", "--check", "--file", arquivo.name, stdout=io.StringIO())
+
+    def test_serves_prebuilt_file_with_etag(self):
+        with tempfile.NamedTemporaryFile(suffix=".json") as arquivo:
+            arquivo.write(b'{"openapi": "3.0.3", "paths": {}}\n')
+            arquivo.flush()
+            with override_settings(OPENAPI_SCHEMA_FILE=arquivo.name), \
+                    mock.patch.object(schema, "generate_schema") as generate:
+                response = self.client.get("/api/schema/?format=json")
+                generate.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {"openapi": "3.0.3", "paths": {}})
+        self.assertTrue(response["ETag"].endswith('-json"'))
+        self.assertIn("no-cache", response["Cache-Control"])
+
+        response = self.client.get("/api/schema/?format=json", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_docs_request_immutable_versioned_schema(self):
+        digest = schema.get_schema_document().digest
+        response = self.client.get("/api/docs/")
+        self.assertContains(response, f"v\\u003D{digest}")
+
+        response = self.client.get(f"/api/schema/?v={digest}")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(response.content, schema.get_schema_document().render(OpenApiYamlRenderer()))
+
+
+class FastJSONTests(SimpleTestCase):
+    data = {
+        "data": date(2025, 3, 15),
+        "criado_em": timezone.make_aware(datetime(2025, 3, 15, 10, 30)),
+        "valor": Decimal("12.50"),
+        "rotulo": gettext_lazy("Pendente"),
+        "texto": "linha\u2028separada ção",
+        1: None,
+    }
+
+    def test_matches_drf_json_renderer(self):
+        rapido = FastJSONRenderer().render(self.data, "application/json", {})
+        padrao = JSONRenderer().render(self.data, "application/json", {})
+        self.assertEqual(json.loads(rapido), json.loads(padrao))
+        self.assertIn(b"\\u2028", rapido)
+
+    def test_indent_and_missing_orjson_fall_back(self):
+        padrao = JSONRenderer().render(self.data, "application/json; indent=4", {})
+        self.assertEqual(FastJSONRenderer().render(self.data, "application/json; indent=4", {}), padrao)
+        with mock.patch.object(renderers, "orjson", None):
+            self.assertEqual(
+                FastJSONRenderer().render(self.data, "application/json", {}),
+                JSONRenderer().render(self.data, "application/json", {}),
+            )
+
+    def test_parser(self):
+        corpo = b'{"mes_referencia": 3, "observacoes": "\\u00e7\\u00e3o"}'
+        self.assertEqual(
+            FastJSONParser().parse(io.BytesIO(corpo)), {"mes_referencia": 3, "observacoes": "ção"},
+        )
+        for invalido in (b"{", b'{"valor": NaN}'):
+            with self.subTest(corpo=invalido), self.assertRaises(ParseError):
+                FastJSONParser().parse(io.BytesIO(invalido))
+
+
+@skipUnless(renderers.msgpack, "msgpack não está instalado")
+class MessagePackTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = popular_base(1)
+        EnvioMaterial.objects.update(data_limite_envio=date(2025, 3, 15))
+
+    def setUp(self):
+        limpar_caches()
+        self.client = cliente_autenticado(self.admin_user)
+
+    def get_msgpack(self, url):
+        response = self.client.get(url, HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        return MessagePackParser().parse(io.BytesIO(response.content))
+
+    def test_round_trip_encodes_dates_as_extensions(self):
+        data = {
+            "data": date(2025, 3, 15),
+            "antiga": date(1900, 1, 1),
+            "criado_em": datetime(2025, 3, 15, 10, 30, tzinfo=dt_timezone.utc),
+            "valor": Decimal("12.50"),
+        }
+        corpo = MessagePackRenderer().render(data)
+        # Dias desde 1970 em uma extensão de 6 bytes, contra 12 do texto ISO em JSON
+        self.assertEqual(len(MessagePackRenderer().render(date(2025, 3, 15))), 6)
+        self.assertEqual(MessagePackParser().parse(io.BytesIO(corpo)), {**data, "valor": 12.5})
+
+    def test_list_and_actions_keep_dates_native(self):
+        envio = EnvioMaterial.objects.order_by("id").first()
+        for url in (reverse("enviomaterial-list"), reverse("enviomaterial-by-period") + "?mes=1&ano=2025"):
+            with self.subTest(url=url):
+                envios = self.get_msgpack(url)
+                envios = envios["results"] if isinstance(envios, dict) else envios
+                self.assertTrue(envios)
+                self.assertTrue(all(item["data_limite_envio"] == date(2025, 3, 15) for item in envios))
+
+        detalhe = self.get_msgpack(reverse("enviomaterial-detail", kwargs={"pk": envio.pk}))
+        json_detalhe = self.client.get(reverse("enviomaterial-detail", kwargs={"pk": envio.pk})).json()
+        self.assertEqual(json_detalhe["data_limite_envio"], "15-03-2025")
+        self.assertEqual(detalhe, {
+            campo: datetime.strptime(valor, "%d-%m-%Y").date() if campo.startswith("data_") and valor else valor
+            for campo, valor in json_detalhe.items()
+        })
+
+    def test_dashboard(self):
+        dados = self.get_msgpack(reverse("dashboard-envios-dashboard-geral"))
+        self.assertEqual(dados["total_envios"], EnvioMaterial.objects.count())
+        self.assertEqual(dados["envios"][0]["data_limite_envio"], date(2025, 3, 15))
+
+    def test_create_from_msgpack_body(self):
+        envio = EnvioMaterial.objects.order_by("id").first()
+        corpo = MessagePackRenderer().render({
+            "id_etapa": envio.id_etapa_id, "id_disciplina": envio.id_disciplina_id,
+            "id_usuario": self.admin_user.pk, "id_status": envio.id_status_id,
+            "mes_referencia": 4, "ano_referencia": 2026, "data_limite_envio": date(2026, 4, 20),
+        })
+        response = self.client.post(
+            reverse("enviomaterial-list"), corpo, content_type="application/msgpack",
+            HTTP_ACCEPT="application/msgpack",
+        )
+        self.assertEqual(response.status_code, 201)
+        criado = MessagePackParser().parse(io.BytesIO(response.content))
+        self.assertEqual(criado["data_limite_envio"], date(2026, 4, 20))
+        self.assertEqual(EnvioMaterial.objects.get(pk=criado["id"]).data_limite_envio, date(2026, 4, 20))
+
+        response = self.client.post(reverse("enviomaterial-list"), b"\xc1", content_type="application/msgpack")
+        self.assertEqual(response.status_code, 400)
+
+
+class AnalyticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = popular_base(2)
+
+    def setUp(self):
+        limpar_caches()
+        self.client = cliente_autenticado(self.admin_user)
+        self.url = reverse('enviomaterial-analytics')
+
+    def test_cube_matches_group_by(self):
+        response = self.client.get(self.url, {'dimensoes': 'etapa,status'})
+        self.assertEqual(response.status_code, 200)
+        resultados = response.data['resultados']
+
+        por_agrupamento = {}
+        for linha in resultados:
+            por_agrupamento.setdefault(tuple(linha['agrupamento']), []).append(linha)
+        self.assertEqual(set(por_agrupamento), {('etapa', 'status'), ('etapa',), ('status',), ()})
+        self.assertEqual(por_agrupamento[()][0]['total'], EnvioMaterial.objects.count())
+
+        esperado = {
+            (item['id_etapa'], item['id_status']): item['total']
+            for item in EnvioMaterial.objects.values('id_etapa', 'id_status').annotate(total=Count('id'))
+        }
+        self.assertEqual({
+            (linha['valores']['etapa_id'], linha['valores']['status_id']): linha['total']
+            for linha in por_agrupamento[('etapa', 'status')]
+        }, esperado)
+        etapa = EtapaEscolar.objects.get(pk=por_agrupamento[('etapa',)][0]['valores']['etapa_id'])
+        self.assertEqual(por_agrupamento[('etapa',)][0]['valores']['etapa'], etapa.nome_etapa)
+
+    def test_grouping_sets_and_filters(self):
+        with CaptureQueriesContext(connections['default']) as ctx:
+            response = self.client.get(
+                self.url, {'conjunto': ['mes', ''], 'mes_referencia': 3},
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['dimensoes'], ['mes'])
+        filtrados = EnvioMaterial.objects.filter(mes_referencia=3).count()
+        self.assertEqual(
+            [(linha['agrupamento'], linha['valores'], linha['total']) for linha in response.data['resultados']],
+            [([], {}, filtrados), (['mes'], {'mes': 3}, filtrados)],
+        )
+        self.assertEqual(sum('GROUPING SETS' in q['sql'] for q in ctx.captured_queries), 1)
+
+    def test_cached_per_signature_until_envio_changes(self):
+        params = {'dimensoes': 'status'}
+        self.client.get(self.url, params)
+        with CaptureQueriesContext(connections['default']) as ctx:
+            self.client.get(self.url, params)
+        self.assertFalse([q for q in ctx.captured_queries if 'GROUPING' in q['sql']])
+
+        # Outro filtro é outra assinatura
+        with CaptureQueriesContext(connections['default']) as ctx:
+            self.client.get(self.url, {**params, 'ano_referencia': 2025})
+        self.assertTrue([q for q in ctx.captured_queries if 'GROUPING' in q['sql']])
+
+        envio = EnvioMaterial.objects.first()
+        envio.observacoes_gerencia = 'Alterado'
+        # A versão muda no commit
+        with self.captureOnCommitCallbacks(execute=True):
+            envio.save()
+        with CaptureQueriesContext(connections['default']) as ctx:
+            self.client.get(self.url, params)
+        self.assertTrue([q for q in ctx.captured_queries if 'GROUPING' in q['sql']])
+
+    def test_version_changes_only_after_commit(self):
+        chave = 'analytics:versao:2025-01'
+        with self.captureOnCommitCallbacks() as callbacks:
+            analytics.invalidate([(2025, 1)])
+            analytics.invalidate([(2025, 1)])
+        self.assertFalse(AnalyticsVersao.objects.filter(chave=chave).exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(AnalyticsVersao.objects.get(chave=chave).versao, 2)
+        self.assertEqual(AnalyticsVersao.objects.get(chave=analytics.VERSION_KEY).versao, 2)
+
+    def test_invalid_dimensions(self):
+        for params in ({}, {'dimensoes': 'cor'}, {'dimensoes': 'ano,ano'},
+                       {'dimensoes': 'ano', 'conjunto': 'mes'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+
+class SerieTemporalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = popular_base(2)
+
+    def setUp(self):
+        limpar_caches()
+        self.client = cliente_autenticado(self.admin_user)
+        self.url = reverse('enviomaterial-serie-temporal')
+
+    def pontos(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [(str(ponto['periodo']), ponto['total']) for ponto in response.data['pontos']]
+
+    def test_gaps_filled_with_zero(self):
+        por_mes = lambda mes: EnvioMaterial.objects.filter(data_envio_escola__month=mes).count()
+        self.assertEqual(self.pontos(inicio='2024-11-15', fim='2025-02-28'), [
+            ('2024-11-01', 0), ('2024-12-01', 0), ('2025-01-01', por_mes(1)), ('2025-02-01', por_mes(2)),
+        ])
+        self.assertEqual(self.pontos(inicio='2025-01-08', fim='2025-01-11', periodo='dia'), [
+            ('2025-01-08', 0), ('2025-01-09', 0), ('2025-01-10', por_mes(1)), ('2025-01-11', 0),
+        ])
+        # Semanas começam na segunda-feira
+        self.assertEqual(self.pontos(inicio='2025-01-01', fim='2025-01-20', periodo='semana'), [
+            ('2024-12-30', 0), ('2025-01-06', por_mes(1)), ('2025-01-13', 0), ('2025-01-20', 0),
+        ])
+
+    def test_other_dates_and_filters(self):
+        envio = EnvioMaterial.objects.filter(mes_referencia=3).first()
+        envio.data_validacao_gerencia = date(2025, 3, 20)
+        envio.save()
+        self.assertEqual(self.pontos(inicio='2025-03-01', fim='2025-04-30', campo='data_validacao_gerencia'),
+                         [('2025-03-01', 1), ('2025-04-01', 0)])
+        self.assertEqual(
+            self.pontos(inicio='2025-03-01', fim='2025-03-31', id_etapa=envio.id_etapa_id),
+            [('2025-03-01', EnvioMaterial.objects.filter(mes_referencia=3, id_etapa=envio.id_etapa).count())],
+        )
+
+    def test_breakdown_by_status(self):
+        response = self.client.get(self.url, {'inicio': '2025-01-01', 'fim': '2025-03-31', 'por_status': 'true'})
+        self.assertEqual(response.status_code, 200)
+        nomes = set(StatusEnvio.objects.values_list('descricao_status', flat=True))
+        for ponto in response.data['pontos']:
+            self.assertEqual(set(ponto['por_status']), nomes)
+            self.assertEqual(sum(ponto['por_status'].values()), ponto['total'])
+            mes = ponto['periodo'].month
+            for nome, total in ponto['por_status'].items():
+                self.assertEqual(total, EnvioMaterial.objects.filter(
+                    data_envio_escola__month=mes, id_status__descricao_status=nome,
+                ).count())
+
+    def test_invalid_params(self):
+        for params in ({}, {'inicio': '2025-01-01'}, {'inicio': '2025-13-01', 'fim': '2025-12-31'},
+                       {'inicio': '2025-02-01', 'fim': '2025-01-01'},
+                       {'inicio': '2025-01-01', 'fim': '2025-12-31', 'campo': 'data_limite_envio'},
+                       {'inicio': '2025-01-01', 'fim': '2025-12-31', 'periodo': 'ano'},
+                       {'inicio': '2000-01-01', 'fim': '2025-12-31', 'periodo': 'dia'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+
+def percentil(valores, fracao):
+    """
+    Interpolação linear, como o percentile_cont do PostgreSQL.
+    """
+    valores = sorted(valores)
+    posicao = (len(valores) - 1) * fracao
+    base = int(posicao)
+    if base + 1 == len(valores):
+        return float(valores[base])
+    return valores[base] + (valores[base + 1] - valores[base]) * (posicao - base)
+
+
+class TemposCicloTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = popular_base(2)
+        envios = list(EnvioMaterial.objects.filter(mes_referencia__in=[1, 2]).order_by('id'))
+        for i, envio in enumerate(envios):
+            envio.data_validacao_gerencia = envio.data_envio_escola + timedelta(days=i * 3 % 11)
+            if i % 2:
+                envio.data_envio_see = envio.data_validacao_gerencia + timedelta(days=i)
+        EnvioMaterial.objects.bulk_update(envios, ['data_validacao_gerencia', 'data_envio_see'])
+
+    def setUp(self):
+        limpar_caches()
+        self.client = cliente_autenticado(self.admin_user)
+        self.url = reverse('enviomaterial-tempos-ciclo')
+
+    def esperado(self, envios, inicio, fim):
+        dias = [
+            (getattr(envio, fim) - getattr(envio, inicio)).days
+            for envio in envios if getattr(envio, inicio) and getattr(envio, fim)
+        ]
+        if not dias:
+            return {"envios": 0, "p50": None, "p90": None, "p99": None}
+        return {"envios": len(dias), **{
+            nome: round(percentil(dias, fracao), 2)
+            for nome, fracao in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))
+        }}
+
+    def test_percentiles_match_python(self):
+        with CaptureQueriesContext(connections['default']) as ctx:
+            response = self.client.get(self.url, {'ano': 2025})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['fechado'])
+        self.assertEqual(sum('percentile_cont' in q['sql'] for q in ctx.captured_queries), 1)
+
+        por_agrupamento = {}
+        for linha in response.data['resultados']:
+            por_agrupamento.setdefault(tuple(linha['agrupamento']), []).append(linha)
+        self.assertEqual(set(por_agrupamento), {(), ('etapa',), ('disciplina',), ('ano', 'mes')})
+
+        envios = list(EnvioMaterial.objects.filter(ano_referencia=2025))
+        total = por_agrupamento[()][0]['trechos']
+        self.assertEqual(total['validacao'], self.esperado(envios, 'data_envio_escola', 'data_validacao_gerencia'))
+        self.assertEqual(total['see'], self.esperado(envios, 'data_validacao_gerencia', 'data_envio_see'))
+        self.assertEqual(total['formador']['envios'], 0)
+
+        for linha in por_agrupamento[('etapa',)]:
+            do_grupo = [envio for envio in envios if envio.id_etapa_id == linha['valores']['etapa_id']]
+            self.assertEqual(linha['trechos']['validacao'],
+                             self.esperado(do_grupo, 'data_envio_escola', 'data_validacao_gerencia'))
+        fevereiro = next(linha for linha in por_agrupamento[('ano', 'mes')] if linha['valores']['mes'] == 2)
+        self.assertEqual(fevereiro['trechos']['see'], self.esperado(
+            [envio for envio in envios if envio.mes_referencia == 2], 'data_validacao_gerencia', 'data_envio_see',
+        ))
+
+    def test_closed_period_cache_follows_its_own_envios(self):
+        params = {'ano': 2025, 'mes': 1, 'dimensoes': 'etapa'}
+        self.client.get(self.url, params)
+
+        # Envio de outro período não descarta o resultado
+        outro = EnvioMaterial.objects.filter(mes_referencia=5).first()
+        outro.observacoes_gerencia = 'Alterado'
+        with self.captureOnCommitCallbacks(execute=True):
+            outro.save()
+        with CaptureQueriesContext(connections['default']) as ctx:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.data['mes'], 1)
+        self.assertFalse([q for q in ctx.captured_queries if 'percentile_cont' in q['sql']])
+
+        envio = EnvioMaterial.objects.filter(mes_referencia=1).first()
+        envio.data_validacao_gerencia = envio.data_envio_escola + timedelta(days=30)
+        with self.captureOnCommitCallbacks(execute=True):
+            envio.save()
+        with CaptureQueriesContext(connections['default']) as ctx:
+            self.client.get(self.url, params)
+        self.assertTrue([q for q in ctx.captured_queries if 'percentile_cont' in q['sql']])
+
+    def percentis_recalculados(self, params):
+        with CaptureQueriesContext(connections['default']) as ctx:
+            self.client.get(self.url, params)
+        return bool([q for q in ctx.captured_queries if 'percentile_cont' in q['sql']])
+
+    def test_moving_envio_invalidates_both_periods(self):
+        janeiro, anterior = {'ano': 2025, 'mes': 1}, {'ano': 2024, 'mes': 1}
+        self.client.get(self.url, janeiro)
+        self.client.get(self.url, anterior)
+
+        envio = EnvioMaterial.objects.filter(mes_referencia=1, ano_referencia=2025).first()
+        envio.ano_referencia = 2024
+        with self.captureOnCommitCallbacks(execute=True):
+            envio.save()
+        self.assertTrue(self.percentis_recalculados(janeiro))
+        self.assertTrue(self.percentis_recalculados(anterior))
+
+        # Lido sem o mês/ano: o período gravado vem do banco
+        envio = EnvioMaterial.objects.only('id', 'observacoes_gerencia').get(pk=envio.pk)
+        envio.observacoes_gerencia = 'Movido'
+        with self.captureOnCommitCallbacks(execute=True):
+            envio.save()
+        self.assertTrue(self.percentis_recalculados(anterior))
+        self.assertFalse(self.percentis_recalculados(janeiro))
+
+    def test_admin_status_actions_invalidate_periods(self):
+        janeiro, maio = {'ano': 2025, 'mes': 1}, {'ano': 2025, 'mes': 5}
+        self.client.get(self.url, janeiro)
+        self.client.get(self.url, maio)
+        # As ações do admin procuram o status pelo id
+        if not StatusEnvio.objects.filter(pk=2).exists():
+            StatusEnvio.objects.create(pk=2, descricao_status='Aprovado')
+
+        admin_client = self.client_class()
+        admin_client.force_login(self.admin_user)
+        selecionados = EnvioMaterial.objects.filter(mes_referencia=1).values_list('pk', flat=True)[:2]
+        with self.captureOnCommitCallbacks(execute=True):
+            admin_client.post(reverse('admin:api_enviomaterial_changelist'), {
+                'action': 'mark_as_approved', '_selected_action': list(selecionados),
+            })
+        self.assertEqual(EnvioMaterial.objects.filter(pk__in=list(selecionados), id_status=2).count(), 2)
+        self.assertTrue(self.percentis_recalculados(janeiro))
+        self.assertFalse(self.percentis_recalculados(maio))
+
+    def test_invalid_params(self):
+        for params in ({}, {'ano': 'x'}, {'ano': 2025, 'mes': 13}, {'ano': 2025, 'dimensoes': 'cor'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+
+class ConformidadeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = popular_base(2)
+
+    def setUp(self):
+        self.client = cliente_autenticado(self.admin_user)
+        self.url = reverse('enviomaterial-conformidade')
+
+    def esperado(self, meses=range(1, 13), **filtros):
+        envios = EnvioMaterial.objects.filter(ano_referencia=2025, id_usuario__is_active=True, **filtros)
+        existentes = set(envios.values_list('id_usuario', 'id_disciplina', 'id_etapa', 'mes_referencia'))
+        atribuicoes = {chave[:3] for chave in existentes}
+        return sorted(
+            (usuario, disciplina, etapa, mes)
+            for usuario, disciplina, etapa in atribuicoes for mes in meses
+            if (usuario, disciplina, etapa, mes) not in existentes
+        )
+
+    def todas_as_paginas(self, params):
+        faltantes, url = [], f"{self.url}?{params}"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            faltantes += response.data['results']
+            url = response.data['next']
+        return response.data, faltantes
+
+    def test_missing_combinations_across_pages(self):
+        dados, faltantes = self.todas_as_paginas('ano=2025')
+        esperado = self.esperado()
+        self.assertGreater(len(esperado), 20)
+        self.assertEqual(dados['count'], len(esperado))
+        self.assertEqual(sorted(
+            (item['usuario_id'], item['disciplina_id'], item['etapa_id'], item['mes']) for item in faltantes
+        ), esperado)
+        primeiro = faltantes[0]
+        self.assertEqual(primeiro['usuario'], Usuario.objects.get(pk=primeiro['usuario_id']).nome_usuario)
+
+        for etapa in dados['etapas']:
+            self.assertEqual(etapa['faltantes'], sum(1 for item in esperado if item[2] == etapa['etapa_id']))
+            self.assertEqual(etapa['esperados'] - etapa['faltantes'], EnvioMaterial.objects.filter(
+                ano_referencia=2025, id_etapa=etapa['etapa_id'],
+            ).values('id_usuario', 'id_disciplina', 'id_etapa', 'mes_referencia').distinct().count())
+
+    def test_filters_month_and_inactive_users(self):
+        envio = EnvioMaterial.objects.order_by('id').first()
+        _, faltantes = self.todas_as_paginas(f'ano=2025&mes=4&etapa={envio.id_etapa_id}')
+        self.assertEqual(
+            sorted((item['usuario_id'], item['disciplina_id'], item['etapa_id'], item['mes']) for item in faltantes),
+            self.esperado(meses=[4], id_etapa=envio.id_etapa_id),
+        )
+
+        Usuario.objects.filter(pk=envio.id_usuario_id).update(is_active=False)
+        _, faltantes = self.todas_as_paginas('ano=2025')
+        self.assertNotIn(envio.id_usuario_id, {item['usuario_id'] for item in faltantes})
+
+    def test_page_is_a_single_anti_join(self):
+        with CaptureQueriesContext(connections['default']) as ctx:
+            self.client.get(self.url, {'ano': 2025})
+        self.assertEqual(sum('NOT EXISTS' in q['sql'] for q in ctx.captured_queries), 1)
+
+    def test_invalid_params(self):
+        for params, codigo in (({}, 400), ({'ano': 'x'}, 400), ({'ano': 2025, 'mes': 0}, 400),
+                               ({'ano': 2025, 'page': 0}, 404), ({'ano': 2025, 'page': 999}, 404)):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, codigo)
+
+
+class GerarPendentesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = popular_base(1)
+
+    def setUp(self):
+        self.client = cliente_autenticado(self.admin_user)
+        self.url = reverse('enviomaterial-gerar-pendentes')
+
+    def atribuicoes(self):
+        return set(EnvioMaterial.objects.filter(ano_referencia=2025).values_list(
+            'id_usuario', 'id_disciplina', 'id_etapa',
+        ))
+
+    def test_creates_pending_envios_once(self):
+        validado = StatusEnvio.objects.get(descricao_status='Validado')
+        usuario, disciplina, etapa = sorted(self.atribuicoes())[0]
+        existente = EnvioMaterial.objects.create(
+            id_usuario_id=usuario, id_disciplina_id=disciplina, id_etapa_id=etapa,
+            id_status=validado, mes_referencia=1, ano_referencia=2026,
+        )
+
+        response = self.client.post(self.url, {'mes': 1, 'ano': 2026}, format='json')
+        self.assertEqual(response.status_code, 201)
+        esperados = len(self.atribuicoes())
+        self.assertEqual((response.data['esperados'], response.data['criados'], response.data['existentes']),
+                         (esperados, esperados - 1, 1))
+        self.assertEqual(response.data['data_limite_envio'], date(2026, 1, 15))
+
+        gerados = EnvioMaterial.objects.filter(ano_referencia=2026, mes_referencia=1).exclude(pk=existente.pk)
+        self.assertEqual(
+            set(gerados.values_list('id_usuario', 'id_disciplina', 'id_etapa')) | {(usuario, disciplina, etapa)},
+            self.atribuicoes(),
+        )
+        self.assertEqual(set(gerados.values_list('id_status__descricao_status', 'data_limite_envio')),
+                         {('Pendente', date(2026, 1, 15))})
+        existente.refresh_from_db()
+        self.assertEqual(existente.id_status, validado)
+
+        response = self.client.post(self.url, {'mes': 1, 'ano': 2026}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['criados'], response.data['existentes']), (0, esperados))
+
+    def test_deadline_window_and_inactive_users(self):
+        Usuario.objects.filter(pk=self.admin_user.pk).update(is_active=False)
+        response = self.client.post(self.url, {'mes': 2, 'ano': 2026, 'dia_limite': 31}, format='json')
+        self.assertEqual(response.data['data_limite_envio'], date(2026, 2, 28))
+        # Janela de 12 meses: fevereiro/2025 em diante
+        esperado = set(EnvioMaterial.objects.filter(
+            ano_referencia=2025, mes_referencia__gte=2, id_usuario__is_active=True,
+        ).values_list('id_usuario', 'id_disciplina', 'id_etapa'))
+        self.assertEqual(set(EnvioMaterial.objects.filter(ano_referencia=2026, mes_referencia=2).values_list(
+            'id_usuario', 'id_disciplina', 'id_etapa',
+        )), esperado)
+
+    def test_command_is_idempotent(self):
+        saida = io.StringIO()
+        call_command('gerar_pendentes', mes=3, ano=2026, stdout=saida)
+        criados = EnvioMaterial.objects.filter(ano_referencia=2026, mes_referencia=3).count()
+        self.assertIn(f"{criados} envios pendentes criados", saida.getvalue())
+        call_command('gerar_pendentes', mes=3, ano=2026, stdout=saida)
+        self.assertIn(f"0 envios pendentes criados, {criados} já existiam", saida.getvalue())
+
+    def test_invalid_params(self):
+        for dados in ({}, {'mes': 13, 'ano': 2026}, {'mes': 1, 'ano': 2026, 'dia_limite': 0}):
+            with self.subTest(dados=dados):
+                self.assertEqual(self.client.post(self.url, dados, format='json').status_code, 400)
+        StatusEnvio.objects.filter(descricao_status='Pendente').update(descricao_status='Aguardando')
+        self.assertEqual(self.client.post(self.url, {'mes': 1, 'ano': 2026}, format='json').status_code, 400)
+
+    def test_natural_key_on_envio_api(self):
+        envio = EnvioMaterial.objects.order_by('id').first()
+        dados = {
+            'id_etapa': envio.id_etapa_id, 'id_disciplina': envio.id_disciplina_id,
+            'id_usuario': envio.id_usuario_id, 'id_status': envio.id_status_id,
+        }
+        url = reverse('enviomaterial-list')
+        repetido = {**dados, 'mes_referencia': envio.mes_referencia, 'ano_referencia': envio.ano_referencia}
+        self.assertEqual(self.client.post(url, repetido, format='json').status_code, 400)
+
+        # Sem mês/ano, o período atual
+        response = self.client.post(url, dados, format='json')
+        self.assertEqual(response.status_code, 201)
+        hoje = timezone.localdate()
+        self.assertEqual((response.data['mes_referencia'], response.data['ano_referencia']), (hoje.month, hoje.year))
+
+    def test_default_period_uses_local_date(self):
+        envio = EnvioMaterial.objects.order_by('id').first()
+        dados = {
+            'id_etapa': envio.id_etapa_id, 'id_disciplina': envio.id_disciplina_id,
+            'id_usuario': envio.id_usuario_id, 'id_status': envio.id_status_id,
+        }
+        # 31/12/2026 às 23:30 em Fortaleza (UTC-3) já é janeiro de 2027 em UTC
+        agora = datetime(2027, 1, 1, 2, 30, tzinfo=dt_timezone.utc)
+        with mock.patch.object(timezone, 'now', return_value=agora):
+            response = self.client.post(reverse('enviomaterial-list'), dados, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['mes_referencia'], response.data['ano_referencia']), (12, 2026))
+
+
+class UpsertTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = popular_base(1)
+
+    def setUp(self):
+        limpar_caches()
+        self.client = cliente_autenticado(self.admin_user)
+        self.url = reverse('enviomaterial-upsert')
+        self.validado = StatusEnvio.objects.get(descricao_status='Validado')
+
+    def chave(self, envio):
+        return {
+            'id_usuario': envio.id_usuario_id, 'id_etapa': envio.id_etapa_id,
+            'id_disciplina': envio.id_disciplina_id, 'mes_referencia': envio.mes_referencia,
+            'ano_referencia': envio.ano_referencia,
+        }
+
+    def test_created_updated_and_unchanged(self):
+        alterado, igual = EnvioMaterial.objects.order_by('id')[:2]
+        modelo = {**self.chave(alterado), 'ano_referencia': 2027}
+        linhas = [
+            {**self.chave(alterado), 'id_status': self.validado.pk, 'data_validacao_gerencia': '10-03-2025'},
+            {**self.chave(igual), 'id_status': igual.id_status_id, 'observacoes_gerencia': igual.observacoes_gerencia},
+            {**modelo, 'observacoes_gerencia': 'Novo'},
+        ]
+        with CaptureQueriesContext(connections['default']) as ctx:
+            response = self.client.post(self.url, linhas, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(linha['indice'], linha['resultado']) for linha in response.data['resultados']],
+            [(0, 'atualizado'), (1, 'inalterado'), (2, 'criado')],
+        )
+        self.assertEqual((response.data['criados'], response.data['atualizados'], response.data['inalterados']),
+                         (1, 1, 1))
+        # Um INSERT por conjunto de campos informados
+        self.assertEqual(sum(q['sql'].startswith('INSERT INTO "Envio_material"') for q in ctx.captured_queries), 3)
+
+        alterado_antes = alterado.updated_at
+        alterado.refresh_from_db()
+        self.assertEqual(response.data['resultados'][0]['id'], alterado.pk)
+        self.assertEqual((alterado.id_status, alterado.data_validacao_gerencia), (self.validado, date(2025, 3, 10)))
+        self.assertGreater(alterado.updated_at, alterado_antes)
+        self.assertEqual(alterado.updated_by, self.admin_user.matricula)
+
+        igual_antes = igual.updated_at
+        igual.refresh_from_db()
+        self.assertEqual((response.data['resultados'][1]['id'], igual.updated_at), (igual.pk, igual_antes))
+
+        novo = EnvioMaterial.objects.get(pk=response.data['resultados'][2]['id'])
+        self.assertEqual((novo.ano_referencia, novo.observacoes_gerencia, novo.created_by),
+                         (2027, 'Novo', self.admin_user.matricula))
+        # Sem status informado, Pendente
+        self.assertEqual(novo.id_status.descricao_status, 'Pendente')
+
+    def test_only_informed_fields_are_written(self):
+        envio = EnvioMaterial.objects.exclude(data_envio_escola=None).order_by('id').first()
+        response = self.client.post(self.url, [
+            {**self.chave(envio), 'data_envio_see': None, 'observacoes_gerencia': 'Revisar'},
+        ], format='json')
+        self.assertEqual(response.data['resultados'][0]['resultado'], 'atualizado')
+        antes = envio
+        envio = EnvioMaterial.objects.get(pk=envio.pk)
+        self.assertEqual((envio.data_envio_see, envio.observacoes_gerencia), (None, 'Revisar'))
+        self.assertEqual((envio.id_status_id, envio.data_envio_escola), (antes.id_status_id, antes.data_envio_escola))
+
+        # Só a chave: nada a gravar
+        response = self.client.post(self.url, [self.chave(envio)], format='json')
+        self.assertEqual(response.data['resultados'], [{'indice': 0, 'id': envio.pk, 'resultado': 'inalterado'}])
+
+    def test_same_batch_twice_is_unchanged(self):
+        linhas = [
+            {**self.chave(envio), 'ano_referencia': 2028, 'id_status': self.validado.pk, 'data_envio_see': '2028-01-05'}
+            for envio in EnvioMaterial.objects.order_by('id')[:20]
+        ]
+        primeira = self.client.post(self.url, linhas, format='json')
+        self.assertEqual(primeira.data['criados'], 20)
+        segunda = self.client.post(self.url, linhas, format='json')
+        self.assertEqual(segunda.data['inalterados'], 20)
+        self.assertEqual([linha['id'] for linha in segunda.data['resultados']],
+                         [linha['id'] for linha in primeira.data['resultados']])
+
+    def test_invalid_rows_write_nothing(self):
+        envio = EnvioMaterial.objects.order_by('id').first()
+        total = EnvioMaterial.objects.count()
+        response = self.client.post(self.url, [
+            {**self.chave(envio), 'ano_referencia': 2027},
+            {**self.chave(envio), 'ano_referencia': 2027, 'id_status': 9999},
+            {**self.chave(envio), 'id_disciplina': 9999},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(sorted(response.data['erros']), [1, 2])
+        self.assertIn('Chave repetida', response.data['erros'][1][0])
+        self.assertIn('id_status', response.data['erros'][1][1])
+        self.assertIn('id_disciplina', response.data['erros'][2][0])
+        self.assertEqual(EnvioMaterial.objects.count(), total)
+
+        for dados in ({}, [{'id_usuario': envio.id_usuario_id}], [{**self.chave(envio), 'mes_referencia': 13}]):
+            with self.subTest(dados=dados):
+                self.assertEqual(self.client.post(self.url, dados, format='json').status_code, 400)
+
+    def test_invalidates_changed_periods(self):
+        analytics_url = reverse('enviomaterial-analytics')
+        params = {'dimensoes': 'ano'}
+        self.client.get(analytics_url, params)
+        envio = EnvioMaterial.objects.order_by('id').first()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, [self.chave(envio)], format='json')
+        with CaptureQueriesContext(connections['default']) as ctx:
+            self.client.get(analytics_url, params)
+        self.assertFalse([q for q in ctx.captured_queries if 'GROUPING' in q['sql']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, [{**self.chave(envio), 'observacoes_gerencia': 'Alterado'}], format='json')
+        with CaptureQueriesContext(connections['default']) as ctx:
+            self.client.get(analytics_url, params)
+        self.assertTrue([q for q in ctx.captured_queries if 'GROUPING' in q['sql']])
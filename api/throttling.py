@@ -0,0 +1,155 @@
+# throttling.py
+"""
+Throttle por balde de tokens, consistente entre workers.
+
+Cada chave (usuário ou IP) tem um balde com capacidade igual ao número de
+requisições da taxa (`1000/hour` -> 1000 tokens) que se recompleta de forma
+contínua (1000 tokens por hora). A verificação é um único UPSERT atômico no
+PostgreSQL: recompleta, desconta o custo se houver tokens e devolve o resultado.
+
+Ações caras podem custar mais de um token com `throttle_costs` na view:
+
+    throttle_costs = {"dashboard_geral": 5}
+
+Um custo maior que a capacidade é limitado à capacidade: a requisição passa
+quando o balde está cheio, em vez de nunca passar.
+
+Um balde parado por mais que capacidade/taxa (a janela da taxa) está cheio, e
+apagá-lo equivale a recriá-lo; `prune_buckets` (comando `prune_throttle`) remove
+esses baldes para a tabela não crescer com cada IP ou usuário já visto.
+"""
+from datetime import timedelta
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+from rest_framework import throttling
+from rest_framework.settings import api_settings
+
+from . import metrics
+
+
+# Tabela do model ThrottleBucket. Vai direto na conexão do primário: o roteador
+# da réplica não participa, então a verificação não fixa a requisição no primário.
+TAKE_TOKENS_SQL = """
+INSERT INTO "Throttle_bucket" AS bucket (chave, tokens, permitido, atualizado_em)
+VALUES (
+    %(chave)s,
+    CASE WHEN %(capacidade)s >= %(custo)s THEN %(capacidade)s - %(custo)s ELSE %(capacidade)s END,
+    %(capacidade)s >= %(custo)s,
+    clock_timestamp()
+)
+ON CONFLICT (chave) DO UPDATE SET
+    tokens = CASE
+        WHEN LEAST(%(capacidade)s, bucket.tokens + %(reposicao)s * EXTRACT(EPOCH FROM clock_timestamp() - bucket.atualizado_em)) >= %(custo)s
+        THEN LEAST(%(capacidade)s, bucket.tokens + %(reposicao)s * EXTRACT(EPOCH FROM clock_timestamp() - bucket.atualizado_em)) - %(custo)s
+        ELSE LEAST(%(capacidade)s, bucket.tokens + %(reposicao)s * EXTRACT(EPOCH FROM clock_timestamp() - bucket.atualizado_em))
+    END,
+    permitido = LEAST(%(capacidade)s, bucket.tokens + %(reposicao)s * EXTRACT(EPOCH FROM clock_timestamp() - bucket.atualizado_em)) >= %(custo)s,
+    atualizado_em = clock_timestamp()
+RETURNING permitido, tokens
+"""
+
+
+def take_tokens(chave, capacidade, reposicao, custo=1):
+    """
+    Tenta descontar `custo` tokens do balde `chave`. Retorna (permitido, tokens restantes).
+    `reposicao` é a quantidade de tokens recompletada por segundo.
+    """
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute(TAKE_TOKENS_SQL, {
+            "chave": chave,
+            "capacidade": float(capacidade),
+            "reposicao": float(reposicao),
+            "custo": float(custo),
+        })
+        permitido, tokens = cursor.fetchone()
+    return permitido, tokens
+
+
+def idle_window():
+    """
+    Maior janela (em segundos) entre as taxas de DEFAULT_THROTTLE_RATES: depois dela,
+    qualquer balde parado já se recompletou.
+    """
+    janelas = [
+        throttling.SimpleRateThrottle.parse_rate(None, rate)[1]
+        for rate in api_settings.DEFAULT_THROTTLE_RATES.values() if rate
+    ]
+    return max(janelas, default=0)
+
+
+def prune_buckets(idle_seconds=None):
+    """
+    Apaga os baldes sem verificação há mais de `idle_seconds` (padrão: `idle_window()`).
+    Retorna a quantidade de baldes apagados.
+    """
+    if idle_seconds is None:
+        idle_seconds = idle_window()
+    limite = timezone.now() - timedelta(seconds=idle_seconds)
+    # Mesma conexão do UPSERT (primário), sem passar pelo roteador
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute('DELETE FROM "Throttle_bucket" WHERE atualizado_em < %s', [limite])
+        return cursor.rowcount
+
+
+class MetricsThrottleMixin:
+    """
+    Conta as rejeições no contador `throttle_rejections_total`, por escopo.
+    """
+
+    def throttle_failure(self):
+        metrics.inc("throttle_rejections_total", {"scope": self.scope})
+        return super().throttle_failure()
+
+
+class TokenBucketMixin:
+    """
+    Substitui o histórico de timestamps no cache do SimpleRateThrottle por um
+    balde de tokens no banco. Reaproveita `rate`, `scope` e `get_cache_key`.
+    """
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        # Acima da capacidade, o custo nunca caberia no balde
+        self.cost = min(self.get_cost(view), self.num_requests)
+        self.refill_rate = self.num_requests / self.duration
+        allowed, self.tokens = take_tokens(self.key, self.num_requests, self.refill_rate, self.cost)
+        if not allowed:
+            return self.throttle_failure()
+        return self.throttle_success()
+
+    def get_cost(self, view):
+        costs = getattr(view, "throttle_costs", {})
+        return costs.get(getattr(view, "action", None), 1)
+
+    def throttle_success(self):
+        return True
+
+    def wait(self):
+        """
+        Segundos até o balde ter tokens suficientes para o custo da requisição.
+        """
+        return max(0.0, (self.cost - self.tokens) / self.refill_rate)
+
+
+class AnonTokenBucketThrottle(MetricsThrottleMixin, TokenBucketMixin, throttling.AnonRateThrottle):
+    pass
+
+
+class UserTokenBucketThrottle(MetricsThrottleMixin, TokenBucketMixin, throttling.UserRateThrottle):
+    pass
+
+
+class LoginTokenBucketThrottle(AnonTokenBucketThrottle):
+    """
+    Throttle do login assíncrono: usa o balde `anon` do IP, como o antigo
+    TokenObtainPairView, sem tocar em `request.user` (que consultaria o banco).
+    """
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {"scope": self.scope, "ident": self.get_ident(request)}
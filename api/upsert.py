@@ -0,0 +1,161 @@
+# upsert.py
+"""
+Gravação em lote de envios pela chave natural (professor, etapa, disciplina,
+mês e ano), para sistemas externos que reenviam o estado dos envios.
+
+Cada lote vira um `INSERT ... ON CONFLICT ON CONSTRAINT envio_chave_natural DO UPDATE` por
+conjunto de campos informados (em geral, um só): o envio novo é inserido e o
+existente recebe só os campos enviados, e apenas se algum deles mudou
+(`WHERE ... IS DISTINCT FROM`); sem mudança, a linha não é reescrita. O
+RETURNING diz, por linha, se ela foi inserida (`xmax = 0`) ou atualizada; as
+que não voltam estavam iguais.
+
+O INSERT direto não dispara sinais: o cache das consultas analíticas dos
+períodos alterados é descartado ao final.
+"""
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import analytics
+from .models import Disciplina, EnvioMaterial, EtapaEscolar, StatusEnvio, Usuario
+
+
+CHAVE = ("id_usuario", "id_etapa", "id_disciplina", "mes_referencia", "ano_referencia")
+CAMPOS = (
+    "id_status", "observacoes_gerencia", "data_envio_escola", "data_envio_see",
+    "data_validacao_gerencia", "data_envio_formador", "data_limite_envio",
+)
+RELACOES = {
+    "id_usuario": Usuario,
+    "id_etapa": EtapaEscolar,
+    "id_disciplina": Disciplina,
+    "id_status": StatusEnvio,
+}
+MAX_LINHAS = 1000
+
+CRIADO = "criado"
+ATUALIZADO = "atualizado"
+INALTERADO = "inalterado"
+
+
+class UpsertError(Exception):
+    def __init__(self, erros):
+        super().__init__("Linhas inválidas")
+        self.erros = erros   # índice da linha -> [mensagens]
+
+
+def _validar(linhas, using):
+    """
+    Chaves repetidas no lote e ids inexistentes, com uma consulta por relação.
+    Retorna o id do status Pendente, dado aos envios novos sem `id_status`.
+    """
+    erros = {}
+    vistas = {}
+    for indice, linha in enumerate(linhas):
+        chave = tuple(linha[campo] for campo in CHAVE)
+        if chave in vistas:
+            erros.setdefault(indice, []).append(f"Chave repetida no lote (linha {vistas[chave]}).")
+        vistas.setdefault(chave, indice)
+
+    for campo, model in RELACOES.items():
+        ids = {linha[campo] for linha in linhas if linha.get(campo) is not None}
+        existentes = set(model.objects.using(using).filter(pk__in=ids).values_list("pk", flat=True))
+        for indice, linha in enumerate(linhas):
+            if campo in linha and linha[campo] is not None and linha[campo] not in existentes:
+                erros.setdefault(indice, []).append(f"{campo}: id {linha[campo]} não existe.")
+
+    pendente = None
+    sem_status = [indice for indice, linha in enumerate(linhas) if "id_status" not in linha]
+    if sem_status:
+        pendente = StatusEnvio.objects.using(using).filter(
+            descricao_status__iexact="Pendente",
+        ).values_list("pk", flat=True).first()
+        if pendente is None:
+            for indice in sem_status:
+                erros.setdefault(indice, []).append('id_status: obrigatório (status "Pendente" não encontrado).')
+    if erros:
+        raise UpsertError(erros)
+    return pendente
+
+
+def upsert_envios(linhas, usuario=None, using="default"):
+    """
+    Insere ou atualiza os envios de `linhas` (dicts com os campos de CHAVE e
+    qualquer subconjunto de CAMPOS; sem `id_status`, o envio novo fica
+    Pendente). Retorna [(id, CRIADO | ATUALIZADO |
+    INALTERADO)], na ordem das linhas. UpsertError com os erros por linha.
+    """
+    pendente = _validar(linhas, using)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    tabela = qn(EnvioMaterial._meta.db_table)
+
+    def coluna(campo):
+        return qn(EnvioMaterial._meta.get_field(campo).column)
+
+    grupos = {}
+    for indice, linha in enumerate(linhas):
+        campos = tuple(campo for campo in CAMPOS if campo in linha)
+        grupos.setdefault(campos, []).append(indice)
+
+    agora = timezone.now()
+    autor = getattr(usuario, "matricula", None)
+    resultados = {}
+    with transaction.atomic(using=using):
+        with connection.cursor() as cursor:
+            for campos, indices in grupos.items():
+                # Sem status, o envio novo fica Pendente (como em api/pendencias.py); o existente mantém o seu
+                padroes = [] if "id_status" in campos else [pendente]
+                inseridas = [
+                    *CHAVE, *campos, *(["id_status"] if padroes else []),
+                    "created_at", "updated_at", "created_by", "updated_by",
+                ]
+                valores = ", ".join(["(" + ", ".join(["%s"] * len(inseridas)) + ")"] * len(indices))
+                params = [
+                    valor
+                    for indice in indices
+                    for valor in (
+                        *(linhas[indice][campo] for campo in (*CHAVE, *campos)), *padroes, agora, agora, autor, autor,
+                    )
+                ]
+                atualizadas = [*campos, "updated_at", "updated_by"]
+                if campos:
+                    conflito = (
+                        f"DO UPDATE SET {', '.join(f'{coluna(c)} = EXCLUDED.{coluna(c)}' for c in atualizadas)} "
+                        f"WHERE ROW({', '.join(f'e.{coluna(c)}' for c in campos)}) "
+                        f"IS DISTINCT FROM ROW({', '.join(f'EXCLUDED.{coluna(c)}' for c in campos)})"
+                    )
+                else:
+                    # Só a chave: nada a atualizar
+                    conflito = "DO NOTHING"
+                cursor.execute(
+                    f"INSERT INTO {tabela} AS e ({', '.join(coluna(c) for c in inseridas)}) "
+                    f"VALUES {valores} "
+                    f"ON CONFLICT ON CONSTRAINT {qn('envio_chave_natural')} {conflito} "
+                    f"RETURNING e.{qn('id')}, {', '.join(f'e.{coluna(c)}' for c in CHAVE)}, e.xmax = 0",
+                    params,
+                )
+                for envio_id, *chave, criado in cursor.fetchall():
+                    resultados[tuple(chave)] = (envio_id, CRIADO if criado else ATUALIZADO)
+
+            # As linhas que não voltaram no RETURNING existiam e estavam iguais
+            faltantes = [
+                tuple(linha[campo] for campo in CHAVE) for linha in linhas
+                if tuple(linha[campo] for campo in CHAVE) not in resultados
+            ]
+            if faltantes:
+                valores = ", ".join(["(" + ", ".join(["%s"] * len(CHAVE)) + ")"] * len(faltantes))
+                cursor.execute(
+                    f"SELECT {qn('id')}, {', '.join(coluna(c) for c in CHAVE)} FROM {tabela} "
+                    f"WHERE ({', '.join(coluna(c) for c in CHAVE)}) IN (VALUES {valores})",
+                    [valor for chave in faltantes for valor in chave],
+                )
+                for envio_id, *chave in cursor.fetchall():
+                    resultados[tuple(chave)] = (envio_id, INALTERADO)
+
+    periodos = {
+        (ano, mes) for (_, _, _, mes, ano), (_, resultado) in resultados.items() if resultado != INALTERADO
+    }
+    if periodos:
+        analytics.invalidate(sorted(periodos))
+    return [resultados[tuple(linha[campo] for campo in CHAVE)] for linha in linhas]
@@ -0,0 +1,216 @@
+# user_import.py
+"""
+Importação em massa de usuários a partir de CSV ou JSONL.
+
+Colunas: matricula, cpf, nome_usuario, perfil (nome ou id), telefone (opcional)
+e senha. O arquivo é processado em lotes de BATCH_SIZE linhas: cada lote é
+validado, tem matrícula e CPF conferidos contra o banco em uma única consulta,
+as senhas calculadas em paralelo no pool de hashing do login (api/hashing.py;
+lotes com menos de PARALLEL_MIN_ROWS linhas na própria thread) e os usuários
+válidos inseridos com `bulk_create`. Linhas inválidas são puladas e relatadas pelo
+número da linha; as válidas são gravadas em uma única transação.
+
+`bulk_create` não dispara sinais nem `save()`: não há nada a invalidar no cache
+de autenticação para usuários novos.
+"""
+import csv
+import itertools
+import json
+import os
+from contextlib import ExitStack
+from functools import partial
+
+from django.contrib.auth.hashers import get_hasher
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+
+from .hashing import PasswordHashPool, encode_password, get_hash_pool
+from .models import Perfil, Usuario
+
+
+FORMATS = ("csv", "jsonl")
+REQUIRED_COLUMNS = ("matricula", "cpf", "nome_usuario", "perfil", "senha")
+BATCH_SIZE = 1000
+# Abaixo disso o pool não compensa: o hash é calculado na própria thread
+PARALLEL_MIN_ROWS = 32
+
+
+class ImportResult:
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.importados = 0   # no dry run, os usuários válidos
+        self.erros = {}   # linha -> [mensagens]
+
+    def add_error(self, linha, mensagem):
+        self.erros.setdefault(linha, []).append(mensagem)
+
+    def __str__(self):
+        if self.dry_run:
+            return f"{self.importados} usuários válidos, {len(self.erros)} linhas com erro (nada gravado)"
+        return f"{self.importados} usuários importados, {len(self.erros)} linhas com erro"
+
+
+def detect_format(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if extension == ".csv":
+        return "csv"
+    return None
+
+
+def read_rows(stream, fmt):
+    """
+    Gera (linha, dados, erro) para cada registro de `stream` (texto).
+    """
+    if fmt == "csv":
+        header = stream.readline()
+        # Planilhas exportadas em português costumam usar ';'
+        delimiter = ";" if header.count(";") > header.count(",") else ","
+        reader = csv.DictReader(itertools.chain([header], stream), delimiter=delimiter)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+
+    for linha, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            yield linha, None, "JSON inválido"
+            continue
+        if not isinstance(data, dict):
+            yield linha, None, "Cada linha deve ser um objeto JSON"
+            continue
+        yield linha, data, None
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+class UserImporter:
+    def __init__(self, workers=None, dry_run=False, batch_size=BATCH_SIZE):
+        # Sem `workers`, o pool compartilhado com o login (LOGIN_HASH_WORKERS threads)
+        self.workers = workers
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+        self.hasher = get_hasher()
+        self.result = ImportResult(dry_run)
+        self._matriculas = {}   # matrícula -> linha, para repetições dentro do arquivo
+        self._cpfs = {}
+        self._perfis = {}
+        for perfil in Perfil.objects.all():
+            self._perfis[str(perfil.pk)] = perfil
+            self._perfis[perfil.nome_perfil.casefold()] = perfil
+
+    def run(self, stream, fmt):
+        with ExitStack() as stack:
+            pool = None
+            if not self.dry_run and self.workers is None:
+                pool = get_hash_pool()
+            elif not self.dry_run and self.workers > 1:
+                # --workers do comando: pool próprio, encerrado no fim da importação
+                pool = PasswordHashPool(self.workers, self.workers)
+                stack.callback(pool.executor.shutdown)
+            stack.enter_context(transaction.atomic())
+            for batch in _batches(read_rows(stream, fmt), self.batch_size):
+                valid = self._validate(batch)
+                if valid and not self.dry_run:
+                    self._insert(valid, pool)
+                self.result.importados += len(valid)
+        return self.result
+
+    def _validate(self, batch):
+        candidates = []
+        for linha, data, erro in batch:
+            if erro:
+                self.result.add_error(linha, erro)
+                continue
+            user, senha = self._build(linha, data)
+            if user is not None:
+                candidates.append((linha, user, senha))
+
+        existing = Usuario.objects.filter(
+            Q(matricula__in=[user.matricula for _, user, _ in candidates])
+            | Q(cpf__in=[user.cpf for _, user, _ in candidates])
+        ).values_list("matricula", "cpf")
+        matriculas, cpfs = set(), set()
+        for matricula, cpf in existing:
+            matriculas.add(matricula)
+            cpfs.add(cpf)
+
+        valid = []
+        for linha, user, senha in candidates:
+            ok = True
+            if user.matricula in matriculas:
+                self.result.add_error(linha, f"matricula: {user.matricula} já cadastrada")
+                ok = False
+            if user.cpf in cpfs:
+                self.result.add_error(linha, f"cpf: {user.cpf} já cadastrado")
+                ok = False
+            if ok:
+                valid.append((user, senha))
+        return valid
+
+    def _build(self, linha, data):
+        data = {
+            str(key).strip(): "" if value is None else str(value).strip()
+            for key, value in data.items() if key is not None
+        }
+        missing = [column for column in REQUIRED_COLUMNS if not data.get(column)]
+        if missing:
+            self.result.add_error(linha, f"campos obrigatórios ausentes: {', '.join(missing)}")
+            return None, None
+
+        perfil = self._perfis.get(data["perfil"].casefold())
+        if perfil is None:
+            self.result.add_error(linha, f"perfil: {data['perfil']} não existe")
+
+        user = Usuario(
+            matricula=data["matricula"],
+            cpf=data["cpf"],
+            nome_usuario=data["nome_usuario"],
+            telefone=data.get("telefone") or None,
+            id_perfil=perfil,
+        )
+        try:
+            user.full_clean(exclude=["password", "id_perfil"], validate_unique=False, validate_constraints=False)
+        except ValidationError as e:
+            for field, messages in e.message_dict.items():
+                for message in messages:
+                    self.result.add_error(linha, f"{field}: {message}")
+
+        for value, seen, field in ((user.matricula, self._matriculas, "matricula"), (user.cpf, self._cpfs, "cpf")):
+            if value in seen:
+                self.result.add_error(linha, f"{field}: {value} repetido no arquivo (linha {seen[value]})")
+            else:
+                seen[value] = linha
+
+        if linha in self.result.erros:
+            return None, None
+        return user, data["senha"]
+
+    def _insert(self, valid, pool):
+        passwords = [senha for _, senha in valid]
+        if pool is None or len(passwords) < PARALLEL_MIN_ROWS:
+            hashes = [encode_password(self.hasher, password) for password in passwords]
+        else:
+            hashes = pool.map(partial(encode_password, self.hasher), passwords)
+        users = []
+        for (user, _), encoded in zip(valid, hashes):
+            user.password = encoded
+            users.append(user)
+        Usuario.objects.bulk_create(users, batch_size=self.batch_size)
+
+
+def import_users(stream, fmt, workers=None, dry_run=False, batch_size=BATCH_SIZE):
+    """
+    Importa os usuários de `stream` (texto em CSV ou JSONL) e retorna um ImportResult.
+    Com `dry_run`, só valida.
+    """
+    return UserImporter(workers=workers, dry_run=dry_run, batch_size=batch_size).run(stream, fmt)
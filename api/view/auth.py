@@ -0,0 +1,99 @@
+# view/auth.py
+import json
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.contrib.auth.models import update_last_login
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api import metrics
+from api.db_routers import note_write
+from api.hashing import PoolOverloaded, get_hash_pool, verify_password
+from api.models import Usuario
+from api.throttling import LoginTokenBucketThrottle
+
+
+CREDENCIAIS_INVALIDAS = "Nenhuma conta ativa encontrada com as credenciais informadas"
+
+
+def _response(result, data, status):
+    metrics.inc("login_requests_total", {"result": result})
+    return JsonResponse(data, status=status)
+
+
+def _credentials(request):
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return None, {"detail": "JSON inválido"}
+        if not isinstance(data, dict):
+            return None, {"detail": "JSON inválido"}
+    else:
+        data = request.POST
+
+    errors = {
+        field: ["Este campo é obrigatório."]
+        for field in (Usuario.USERNAME_FIELD, "password")
+        if not isinstance(data.get(field), str) or not data.get(field)
+    }
+    if errors:
+        return None, errors
+    return (data[Usuario.USERNAME_FIELD], data["password"]), None
+
+
+def _tokens(user):
+    refresh = RefreshToken.for_user(user)
+    return {"refresh": str(refresh), "access": str(refresh.access_token)}
+
+
+@csrf_exempt
+@require_POST
+async def login_view(request):
+    """
+    Obtém o par de tokens JWT (`refresh` e `access`) a partir de matrícula e senha.
+
+    Equivale ao TokenObtainPairView, mas é assíncrona: sob ASGI (config/asgi.py) a
+    verificação do hash da senha roda no pool limitado de api/hashing.py e o
+    worker continua atendendo outras requisições enquanto isso. Com o pool cheio
+    responde 503 com Retry-After.
+    """
+    throttle = LoginTokenBucketThrottle()
+    if not await sync_to_async(throttle.allow_request)(request, None):
+        response = _response("throttled", {"detail": "Muitas tentativas de login. Tente novamente mais tarde."}, 429)
+        response["Retry-After"] = str(max(1, round(throttle.wait())))
+        return response
+
+    credentials, errors = _credentials(request)
+    if errors:
+        return _response("invalid_request", errors, 400)
+    matricula, password = credentials
+
+    user = await Usuario.objects.filter(**{Usuario.USERNAME_FIELD: matricula}).afirst()
+    try:
+        valid, upgraded = await get_hash_pool().run(verify_password, user, password)
+    except PoolOverloaded as e:
+        response = _response("overloaded", {"detail": "Servidor ocupado. Tente novamente em instantes."}, 503)
+        response["Retry-After"] = str(e.retry_after)
+        return response
+
+    if not valid or not api_settings.USER_AUTHENTICATION_RULE(user):
+        return _response("invalid_credentials", {"detail": CREDENCIAIS_INVALIDAS}, 401)
+
+    # O usuário só é conhecido aqui: o ReplicaStickyMiddleware fixa as leituras dele no primário
+    note_write(user.pk)
+    if upgraded:
+        await user.asave(update_fields=["password"])
+    if api_settings.UPDATE_LAST_LOGIN:
+        await sync_to_async(update_last_login)(None, user)
+
+    if apps.is_installed("rest_framework_simplejwt.token_blacklist"):
+        # A blacklist registra o refresh token no banco
+        data = await sync_to_async(_tokens)(user)
+    else:
+        data = _tokens(user)
+    return _response("success", data, 200)
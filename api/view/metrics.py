@@ -0,0 +1,28 @@
+# view/metrics.py
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+
+from api.db_pool import record_pool_metrics
+from api import metrics
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Exposição das métricas no formato texto do Prometheus.
+
+    Com METRICS_TOKEN definido, exige `Authorization: Bearer <token>`.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        expected = f"Bearer {token}"
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), expected):
+            return HttpResponse(status=401)
+    # O MetricsMiddleware só grava o que acumulou depois da resposta pronta: o
+    # pool tem de chegar ao store antes de renderizar, senão sai na leitura seguinte
+    with metrics.unbuffered():
+        record_pool_metrics(force=True)
+    return HttpResponse(metrics.render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
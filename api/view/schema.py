@@ -0,0 +1,52 @@
+# view/schema.py
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from drf_spectacular.plumbing import set_query_parameters
+from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
+
+from api.schema import get_schema_document
+
+
+class CachedSchemaView(SpectacularAPIView):
+    """
+    Schema OpenAPI pré-gerado (api/schema.py), com ETag. Pedido com `?v=<versão>`
+    (como fazem o Swagger e o ReDoc) é imutável e fica no cache do navegador;
+    sem ela, o cliente revalida e recebe 304 enquanto o schema não mudar.
+    """
+
+    def get(self, request, *args, **kwargs):
+        if settings.USE_I18N and request.GET.get('lang'):
+            # Tradução pedida: gera na hora
+            return super().get(request, *args, **kwargs)
+
+        document = get_schema_document()
+        renderer = request.accepted_renderer
+        etag = f'"{document.digest}-{renderer.format}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+        else:
+            content_type = request.accepted_media_type
+            if renderer.charset:
+                content_type = f"{content_type}; charset={renderer.charset}"
+            response = HttpResponse(document.render(renderer), content_type=content_type)
+            response['Content-Disposition'] = f'inline; filename="{self._get_filename(request, None)}"'
+        response['ETag'] = etag
+        if request.GET.get('v') == document.digest:
+            patch_cache_control(response, public=True, max_age=365 * 24 * 3600, immutable=True)
+        else:
+            patch_cache_control(response, no_cache=True)
+        return response
+
+
+class VersionedSchemaUrlMixin:
+    def _get_schema_url(self, request):
+        return set_query_parameters(super()._get_schema_url(request), v=get_schema_document().digest)
+
+
+class CachedSwaggerView(VersionedSchemaUrlMixin, SpectacularSwaggerView):
+    pass
+
+
+class CachedRedocView(VersionedSchemaUrlMixin, SpectacularRedocView):
+    pass
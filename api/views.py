@@ -1,23 +1,64 @@
 # views.py
-from rest_framework import viewsets, status
+from collections import Counter
+
+from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
 from django_filters import rest_framework as filters
-from django.db.models import Count, Q
+from django.conf import settings
+from django.db.models import Count, Prefetch, Q
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from django.utils.http import content_disposition_header
 from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter, OpenApiExample, OpenApiResponse
 from drf_spectacular.openapi import OpenApiTypes
-from django.core.mail import EmailMessage
 from .serializers import FileUploadSerializer
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from .db_routers import ReplicaRoutingMixin
+from .analytics import (
+    CAMPOS_SERIE, PERIODOS, PERCENTILES, TRECHOS, cached, contagens, parse_dimensoes, serie_temporal,
+    tempos_de_ciclo,
+)
+from .bundle import bundle_entries, stream_zip
+from .conformidade import FILTROS, faltantes, resumo_por_etapa
+from .dashboard import dashboard_data
+from .outbox import enqueue_email
+from .pendencias import GeracaoError, gerar_pendentes
+from .parsers import MessagePackParser
+from .renderers import MessagePackRenderer, msgpack
+from .upsert import ATUALIZADO, CRIADO, INALTERADO, MAX_LINHAS, UpsertError, upsert_envios
+from .storage import UploadError, append_chunk, cancel_upload, file_response, store_upload
 
 
 from .models import *
 from .serializers import *
 
 
+class MessagePackMixin:
+    """
+    Views que também aceitam e respondem `application/msgpack` (com o pacote
+    msgpack instalado). Nas respostas MessagePack o contexto dos serializers
+    leva `native_dates`, para as datas chegarem ao renderer como date/datetime.
+    """
+
+    if msgpack is not None:
+        renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, MessagePackRenderer]
+        parser_classes = [*api_settings.DEFAULT_PARSER_CLASSES, MessagePackParser]
+
+    def native_dates(self):
+        return isinstance(getattr(self.request, "accepted_renderer", None), MessagePackRenderer)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["native_dates"] = self.native_dates()
+        return context
+
+
 class HelloView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -58,7 +99,7 @@ class HelloView(APIView):
         tags=["Perfis"]
     ),
 )
-class PerfilViewSet(viewsets.ModelViewSet):
+class PerfilViewSet(ReplicaRoutingMixin, viewsets.ModelViewSet):
     """
     ViewSet for Perfil model with full CRUD operations
     """
@@ -129,7 +170,7 @@ class PerfilViewSet(viewsets.ModelViewSet):
         tags=["Usuários"]
     ),
 )
-class UsuarioViewSet(viewsets.ModelViewSet):
+class UsuarioViewSet(ReplicaRoutingMixin, viewsets.ModelViewSet):
     """
     ViewSet para o modelo de usuário
     """
@@ -137,8 +178,8 @@ class UsuarioViewSet(viewsets.ModelViewSet):
     serializer_class = UsuarioSerializer
     filter_backends = [SearchFilter, OrderingFilter, DjangoFilterBackend]
     search_fields = ['nome_usuario', 'matricula', 'cpf']
-    ordering_fields = ['id_usuario', 'nome_usuario', 'matricula']
-    ordering = ['id_usuario']
+    ordering_fields = ['id', 'nome_usuario', 'matricula']
+    ordering = ['id']
     filterset_fields = ['id_perfil']
 
     def get_serializer_class(self):
@@ -192,14 +233,18 @@ class UsuarioViewSet(viewsets.ModelViewSet):
             400: OpenApiTypes.OBJECT,
         },
         examples=[
-            {
-                "matricula": "3456789",
-                "cpf": "987.654.321-00",
-                "nome_usuario": "Professor João",
-                "senha": "1234",
-                "confirm_senha": "1234",
-                "telefone": "(11) 99999-8888"
-            }
+            OpenApiExample(
+                'Exemplo de criação de professor',
+                value={
+                    "matricula": "3456789",
+                    "cpf": "987.654.321-00",
+                    "nome_usuario": "Professor João",
+                    "senha": "1234",
+                    "confirm_senha": "1234",
+                    "telefone": "(11) 99999-8888"
+                },
+                request_only=True,
+            )
         ],
     )
     @action(detail=False, methods=['post'], url_path='create-professor')
@@ -257,7 +302,7 @@ class UsuarioViewSet(viewsets.ModelViewSet):
         tags=["Etapas Escolares"]
     ),
 )
-class EtapaEscolarViewSet(viewsets.ModelViewSet):
+class EtapaEscolarViewSet(ReplicaRoutingMixin, viewsets.ModelViewSet):
     """
     ViewSet for EtapaEscolar model with full CRUD operations
     """
@@ -302,7 +347,7 @@ class EtapaEscolarViewSet(viewsets.ModelViewSet):
         tags=["Disciplinas"]
     ),
 )
-class DisciplinaViewSet(viewsets.ModelViewSet):
+class DisciplinaViewSet(ReplicaRoutingMixin, viewsets.ModelViewSet):
     """
     ViewSet for Disciplina model with full CRUD operations
     """
@@ -347,7 +392,7 @@ class DisciplinaViewSet(viewsets.ModelViewSet):
         tags=["Status de Envio"]
     ),
 )
-class StatusEnvioViewSet(viewsets.ModelViewSet):
+class StatusEnvioViewSet(ReplicaRoutingMixin, viewsets.ModelViewSet):
     """
     ViewSet for StatusEnvio model with full CRUD operations
     """
@@ -424,7 +469,11 @@ class EnvioMaterialFilter(filters.FilterSet):
     ),
     create=extend_schema(
         summary="Criar envio de material",
-        description="Registra um novo envio de material didático.",
+        description=(
+            "Registra um novo envio de material didático.\n\n"
+            "- Se `mes_referencia` não for informado, o sistema usará o mês atual.\n"
+            "- `data_limite_envio` deve ser enviada no formato **DD-MM-YYYY**."
+        ),
         examples=[
             OpenApiExample(
                 'Exemplo de criação',
@@ -463,7 +512,7 @@ class EnvioMaterialFilter(filters.FilterSet):
         tags=["Envios de Material"]
     ),
 )
-class EnvioMaterialViewSet(viewsets.ModelViewSet):
+class EnvioMaterialViewSet(MessagePackMixin, ReplicaRoutingMixin, viewsets.ModelViewSet):
     """
     ViewSet for EnvioMaterial model with full CRUD operations
     """
@@ -483,19 +532,11 @@ class EnvioMaterialViewSet(viewsets.ModelViewSet):
         'data_envio_escola', 'data_limite_envio'
     ]
     ordering = ['-id']
+    replica_actions = ReplicaRoutingMixin.replica_actions | {
+        'stats', 'overdue', 'pending', 'by_period', 'by_user', 'arquivos', 'baixar_arquivo', 'pacote',
+        'analytics', 'serie_temporal', 'tempos_ciclo', 'conformidade',
+    }
     
-    @extend_schema(
-        summary="Criar envio de material",
-        description=(
-            "Cria um novo registro de envio de material didático.\n\n"
-            "- Se `mes_referencia` não for informado, o sistema usará o mês atual.\n"
-            "- `data_limite_envio` deve ser enviada no formato **DD-MM-YYYY**."
-        ),
-        request=EnvioMaterialSerializer,
-        responses={201: EnvioMaterialSerializer},
-        tags=["Envio de Materiais"]
-    )
-    @action(detail=False, methods=['post'])
     def perform_create(self, serializer):
         """
         Preenche automaticamente mês/ano se não forem enviados.
@@ -533,7 +574,6 @@ class EnvioMaterialViewSet(viewsets.ModelViewSet):
 )
     @action(detail=True, methods=['post'])
     def validar(self, request, pk=None):
-        print(type(pk))
         """
         Valida ou rejeita um envio de material.
 
@@ -544,7 +584,7 @@ class EnvioMaterialViewSet(viewsets.ModelViewSet):
         }
         """
         try:
-            envio = EnvioMaterial.objects.get(pk=pk)
+            envio = self.get_queryset().get(pk=pk)
         except EnvioMaterial.DoesNotExist:
             return Response({"error": "Envio não encontrado"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -557,15 +597,20 @@ class EnvioMaterialViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        status_dict = {s['descricao_status']: s['id'] for s in StatusEnvio.objects.filter(deleted_at__isnull=True).values('id', 'descricao_status')}
+        status_dict = {
+            s.descricao_status: s
+            for s in StatusEnvio.objects.filter(
+                deleted_at__isnull=True, descricao_status__in=['Validado', 'Rejeitado']
+            )
+        }
 
-        # Define status (1 = pendente, 2 = aprovado, 3 = rejeitado)
-        envio.id_status_id = status_dict['Validado'] if validado else status_dict['Rejeitado']
+        # Atribui o objeto (e não apenas o id) para o serializer não consultar o status de novo
+        envio.id_status = status_dict['Validado'] if validado else status_dict['Rejeitado']
         envio.observacoes_gerencia = observacoes
         envio.data_validacao_gerencia = datetime.now().date()
         envio.save()
 
-        serializer = EnvioMaterialSerializer(envio)
+        serializer = EnvioMaterialSerializer(envio, context=self.get_serializer_context())
         return Response(serializer.data, status=status.HTTP_200_OK)
     
     @extend_schema(
@@ -593,7 +638,7 @@ class EnvioMaterialViewSet(viewsets.ModelViewSet):
         Muda o status de um envio de material para o status_id fornecido.
         """
         try:
-            envio = EnvioMaterial.objects.get(pk=pk)
+            envio = self.get_queryset().get(pk=pk)
         except EnvioMaterial.DoesNotExist:
             return Response({"error": "Envio não encontrado"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -608,7 +653,8 @@ class EnvioMaterialViewSet(viewsets.ModelViewSet):
             envio.data_envio_see = datetime.now().date()
 
         if str(status_id) == "3": # Validado
-            self.validar(request=request, pk=pk)
+            # Registra a validação no mesmo save, sem repetir a busca e o save de `validar`
+            envio.data_validacao_gerencia = datetime.now().date()
 
 
         observacoes = request.data.get("observacoes_gerencia", "")
@@ -616,7 +662,7 @@ class EnvioMaterialViewSet(viewsets.ModelViewSet):
         envio.id_status = status_obj
         envio.save()
 
-        serializer = EnvioMaterialSerializer(envio)
+        serializer = EnvioMaterialSerializer(envio, context=self.get_serializer_context())
         return Response(serializer.data, status=status.HTTP_200_OK)
     
     def get_serializer_class(self):
@@ -636,7 +682,7 @@ class EnvioMaterialViewSet(viewsets.ModelViewSet):
         user_id = request.query_params.get('user_id')
         if user_id:
             envios = self.queryset.filter(id_usuario=user_id)
-            serializer = EnvioMaterialSerializer(envios, many=True)
+            serializer = EnvioMaterialSerializer(envios, many=True, context=self.get_serializer_context())
             return Response(serializer.data)
         return Response({'error': 'user_id parameter is required'}, 
                        status=status.HTTP_400_BAD_REQUEST)
@@ -654,7 +700,7 @@ class EnvioMaterialViewSet(viewsets.ModelViewSet):
                 mes_referencia=mes, 
                 ano_referencia=ano
             )
-            serializer = EnvioMaterialSerializer(envios, many=True)
+            serializer = EnvioMaterialSerializer(envios, many=True, context=self.get_serializer_context())
             return Response(serializer.data)
         return Response({'error': 'mes and ano parameters are required'}, 
                        status=status.HTTP_400_BAD_REQUEST)
@@ -666,7 +712,7 @@ class EnvioMaterialViewSet(viewsets.ModelViewSet):
         """
         pending_status = request.query_params.get('status_id', 1)
         envios = self.queryset.filter(id_status=pending_status)
-        serializer = EnvioMaterialSerializer(envios, many=True)
+        serializer = EnvioMaterialSerializer(envios, many=True, context=self.get_serializer_context())
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
@@ -711,35 +757,516 @@ class EnvioMaterialViewSet(viewsets.ModelViewSet):
             data_limite_envio__lt=today,
             id_status__in=[1, 2]  # Only pending or in-progress submissions
         )
-        serializer = EnvioMaterialSerializer(envios, many=True)
+        serializer = EnvioMaterialSerializer(envios, many=True, context=self.get_serializer_context())
         return Response(serializer.data)
-    
+
+    @extend_schema(
+        methods=['GET'],
+        summary="Listar arquivos do envio",
+        responses={200: ArquivoEnvioSerializer(many=True)},
+        tags=["Envios de Material"],
+    )
+    @extend_schema(
+        methods=['POST'],
+        summary="Anexar arquivo ao envio",
+        description=(
+            "Recebe o arquivo (multipart, campo `file`) e o grava em blocos no armazenamento. "
+            "Arquivos com o mesmo conteúdo são guardados uma única vez. Para arquivos grandes "
+            "ou conexões instáveis, use o upload retomável em `/api/uploads/`."
+        ),
+        request={"multipart/form-data": ArquivoUploadSerializer},
+        responses={201: ArquivoEnvioSerializer, 404: OpenApiResponse(description="Envio não encontrado")},
+        tags=["Envios de Material"],
+    )
+    @action(detail=True, methods=['get', 'post'])
+    def arquivos(self, request, pk=None):
+        """
+        Lista ou anexa arquivos de um envio de material.
+        """
+        try:
+            envio = EnvioMaterial.objects.only('id').get(pk=pk)
+        except EnvioMaterial.DoesNotExist:
+            return Response({"error": "Envio não encontrado"}, status=status.HTTP_404_NOT_FOUND)
+
+        if request.method == 'GET':
+            arquivos = ArquivoEnvio.objects.filter(id_envio=envio).select_related('id_arquivo').order_by('id')
+            return Response(ArquivoEnvioSerializer(arquivos, many=True, context=self.get_serializer_context()).data)
+
+        serializer = ArquivoUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            arquivo = store_upload(envio, serializer.validated_data['file'], request.user)
+        except UploadError as e:
+            return Response({"error": str(e)}, status=e.status)
+        return Response(
+            ArquivoEnvioSerializer(arquivo, context=self.get_serializer_context()).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+    @extend_schema(
+        summary="Baixar arquivo do envio",
+        description=(
+            "Devolve o conteúdo do arquivo. Aceita `Range: bytes=início-fim` (resposta 206) "
+            "e `If-Range` com o ETag, para retomar downloads interrompidos."
+        ),
+        responses={
+            (200, "application/octet-stream"): OpenApiTypes.BINARY,
+            (206, "application/octet-stream"): OpenApiTypes.BINARY,
+            404: OpenApiResponse(description="Arquivo não encontrado"),
+            416: OpenApiResponse(description="Intervalo fora do arquivo"),
+        },
+        tags=["Envios de Material"],
+    )
+    @action(detail=True, methods=['get'], url_path=r'arquivos/(?P<arquivo_id>[0-9]+)', url_name='baixar-arquivo')
+    def baixar_arquivo(self, request, pk=None, arquivo_id=None):
+        """
+        Download de um arquivo do envio, com suporte a Range.
+        """
+        try:
+            arquivo = ArquivoEnvio.objects.select_related('id_arquivo').get(pk=arquivo_id, id_envio=pk)
+        except ArquivoEnvio.DoesNotExist:
+            return Response({"error": "Arquivo não encontrado"}, status=status.HTTP_404_NOT_FOUND)
+        return file_response(request, arquivo)
+
+    @extend_schema(
+        summary="Baixar pacote ZIP do período",
+        description=(
+            "Gera, durante o download, um ZIP com todos os arquivos dos envios de `mes`/`ano`/`etapa` "
+            "e um `manifest.json` com os dados de cada envio. Formatos já comprimidos (PDF, imagens, "
+            "vídeos, documentos do Office) entram sem compressão."
+        ),
+        parameters=[
+            OpenApiParameter("mes", OpenApiTypes.INT, OpenApiParameter.QUERY, required=True),
+            OpenApiParameter("ano", OpenApiTypes.INT, OpenApiParameter.QUERY, required=True),
+            OpenApiParameter("etapa", OpenApiTypes.INT, OpenApiParameter.QUERY, required=True,
+                             description="Id da etapa escolar"),
+        ],
+        responses={
+            (200, "application/zip"): OpenApiTypes.BINARY,
+            400: OpenApiResponse(description="Parâmetro inválido"),
+            404: OpenApiResponse(description="Nenhum envio no período"),
+        },
+        tags=["Envios de Material"],
+    )
+    @action(detail=False, methods=['get'])
+    def pacote(self, request):
+        """
+        Pacote ZIP com os materiais de um período e etapa, enviado em streaming.
+        """
+        try:
+            mes, ano, etapa = (int(request.query_params[nome]) for nome in ('mes', 'ano', 'etapa'))
+        except (KeyError, ValueError):
+            return Response({'error': 'mes, ano and etapa parameters are required'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        envios = self.queryset.filter(
+            mes_referencia=mes, ano_referencia=ano, id_etapa=etapa
+        ).prefetch_related(
+            Prefetch('arquivos', queryset=ArquivoEnvio.objects.select_related('id_arquivo').order_by('id'))
+        ).order_by('id')
+        # As consultas terminam aqui; o gerador só lê os arquivos do disco
+        manifesto, arquivos = bundle_entries(envios)
+        if not manifesto:
+            return Response({"error": "Nenhum envio encontrado para o período"}, status=status.HTTP_404_NOT_FOUND)
+
+        response = StreamingHttpResponse(stream_zip(manifesto, arquivos), content_type='application/zip')
+        response['Content-Disposition'] = content_disposition_header(
+            True, f"materiais-{ano}-{mes:02d}-etapa-{etapa}.zip"
+        )
+        return response
+
+    @extend_schema(
+        summary="Contagens de envios por dimensões",
+        description=(
+            "Total de envios em todos os subtotais das `dimensoes` pedidas (ano, mes, etapa, "
+            "disciplina, status, usuario), calculados em uma única consulta com `CUBE`. Com "
+            "`conjunto` (repetível, ex.: `conjunto=etapa,status&conjunto=mes&conjunto=`), só os "
+            "subtotais informados (`GROUPING SETS`; vazio é o total geral). Aceita os mesmos "
+            "filtros da listagem. Cada linha traz as dimensões agrupadas em `agrupamento`."
+        ),
+        parameters=[
+            OpenApiParameter("dimensoes", OpenApiTypes.STR, OpenApiParameter.QUERY,
+                             description="Dimensões separadas por vírgula (ex.: ano,etapa,status)"),
+            OpenApiParameter("conjunto", OpenApiTypes.STR, OpenApiParameter.QUERY, many=True,
+                             description="Subtotal a calcular, com dimensões separadas por vírgula"),
+        ],
+        responses={
+            200: OpenApiResponse(description="Dimensões e contagens por subtotal"),
+            400: OpenApiResponse(description="Dimensão inválida"),
+        },
+        tags=["Envios de Material"],
+    )
+    @action(detail=False, methods=['get'])
+    def analytics(self, request):
+        """
+        Contagens por GROUPING SETS/CUBE, em cache por assinatura do filtro.
+        """
+        try:
+            dimensoes = parse_dimensoes(request.query_params.get('dimensoes', ''))
+            conjuntos = None
+            if 'conjunto' in request.query_params:
+                conjuntos = [parse_dimensoes(conjunto) for conjunto in request.query_params.getlist('conjunto')]
+                usadas = {d for conjunto in conjuntos for d in conjunto}
+                if set(dimensoes) - usadas:
+                    raise ValueError("Toda dimensão precisa aparecer em algum `conjunto`.")
+                for conjunto in conjuntos:
+                    dimensoes += [d for d in conjunto if d not in dimensoes]
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if not dimensoes:
+            return Response({"error": "Informe ao menos uma dimensão em `dimensoes`."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        assinatura = sorted(
+            (nome, request.query_params.getlist(nome)) for nome in request.query_params if nome != 'format'
+        )
+        resultados = cached("contagens", assinatura, lambda: contagens(queryset, dimensoes, conjuntos))
+        return Response({"dimensoes": dimensoes, "resultados": resultados})
+
+    @extend_schema(
+        summary="Série temporal de envios",
+        description=(
+            "Envios por dia, semana ou mês de uma das datas (`campo`) entre `inicio` e `fim`, "
+            "inclusive. Os períodos sem envio aparecem com zero. Com `por_status=true`, cada ponto "
+            "traz também a contagem de cada status. Aceita os mesmos filtros da listagem."
+        ),
+        parameters=[
+            OpenApiParameter("campo", OpenApiTypes.STR, OpenApiParameter.QUERY, enum=list(CAMPOS_SERIE),
+                             description="Data contada (padrão: data_envio_escola)"),
+            OpenApiParameter("periodo", OpenApiTypes.STR, OpenApiParameter.QUERY, enum=list(PERIODOS),
+                             description="Tamanho de cada ponto (padrão: mes)"),
+            OpenApiParameter("inicio", OpenApiTypes.DATE, OpenApiParameter.QUERY, required=True),
+            OpenApiParameter("fim", OpenApiTypes.DATE, OpenApiParameter.QUERY, required=True),
+            OpenApiParameter("por_status", OpenApiTypes.BOOL, OpenApiParameter.QUERY,
+                             description="Separa as contagens por status"),
+        ],
+        responses={
+            200: OpenApiResponse(description="Pontos da série, em ordem"),
+            400: OpenApiResponse(description="Parâmetro inválido"),
+        },
+        tags=["Envios de Material"],
+    )
+    @action(detail=False, methods=['get'], url_path='serie-temporal')
+    def serie_temporal(self, request):
+        """
+        Contagens por date_trunc com os períodos vazios preenchidos (generate_series), em cache.
+        """
+        params = request.query_params
+        try:
+            inicio = parse_date(params.get('inicio', ''))
+            fim = parse_date(params.get('fim', ''))
+        except ValueError:
+            inicio = fim = None
+        if not inicio or not fim:
+            return Response({"error": "Informe `inicio` e `fim` no formato AAAA-MM-DD."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        campo = params.get('campo', 'data_envio_escola')
+        periodo = params.get('periodo', 'mes')
+        por_status = params.get('por_status', '').lower() in ('1', 'true')
+
+        queryset = self.filter_queryset(self.get_queryset())
+        assinatura = sorted((nome, params.getlist(nome)) for nome in params if nome != 'format')
+        try:
+            pontos = cached("serie", assinatura, lambda: serie_temporal(
+                queryset, campo, periodo, inicio, fim, por_status,
+            ))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"campo": campo, "periodo": periodo, "pontos": pontos})
+
+    @extend_schema(
+        summary="Tempos de ciclo dos envios (p50/p90/p99)",
+        description=(
+            "Percentis, em dias, de cada trecho do ciclo do envio: `validacao` (envio da escola → "
+            "validação da gerência), `see` (validação → envio à SEE) e `formador` (validação → "
+            "envio ao formador), calculados no banco com `percentile_cont`. Traz o total do "
+            "período de referência (`ano` e, opcionalmente, `mes`) e os subtotais de cada uma das "
+            "`dimensoes` (padrão: etapa,disciplina,mes). Aceita os mesmos filtros da listagem. "
+            "Períodos encerrados ficam em cache até que um envio do período mude."
+        ),
+        parameters=[
+            OpenApiParameter("ano", OpenApiTypes.INT, OpenApiParameter.QUERY, required=True),
+            OpenApiParameter("mes", OpenApiTypes.INT, OpenApiParameter.QUERY),
+            OpenApiParameter("dimensoes", OpenApiTypes.STR, OpenApiParameter.QUERY,
+                             description="Dimensões separadas por vírgula (padrão: etapa,disciplina,mes)"),
+        ],
+        responses={
+            200: OpenApiResponse(description="Envios e percentis de cada trecho, por subtotal"),
+            400: OpenApiResponse(description="Parâmetro inválido"),
+        },
+        tags=["Envios de Material"],
+    )
+    @action(detail=False, methods=['get'], url_path='tempos-ciclo')
+    def tempos_ciclo(self, request):
+        """
+        Percentis dos tempos de ciclo do período, em cache por período.
+        """
+        params = request.query_params
+        try:
+            ano = int(params['ano'])
+            mes = int(params['mes']) if params.get('mes') else None
+        except (KeyError, ValueError):
+            return Response({"error": "Informe `ano` (e, opcionalmente, `mes`) como números."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if mes is not None and not 1 <= mes <= 12:
+            return Response({"error": "`mes` deve estar entre 1 e 12."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            dimensoes = parse_dimensoes(params.get('dimensoes', 'etapa,disciplina,mes'))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        meses = [mes] if mes else list(range(1, 13))
+
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            ano_referencia=ano, mes_referencia__in=meses,
+        )
+        hoje = timezone.localdate()
+        fechado = (ano, meses[-1]) < (hoje.year, hoje.month)
+        assinatura = sorted((nome, params.getlist(nome)) for nome in params if nome != 'format')
+        resultados = cached(
+            "tempos", assinatura, lambda: tempos_de_ciclo(queryset, dimensoes),
+            timeout=settings.ANALYTICS_CLOSED_CACHE_SECONDS if fechado else None,
+            periodos=[(ano, mes) for mes in meses],
+        )
+        return Response({
+            "ano": ano, "mes": mes, "fechado": fechado,
+            "trechos": {trecho: {"de": inicio, "ate": fim} for trecho, (inicio, fim) in TRECHOS.items()},
+            "percentis": list(PERCENTILES), "resultados": resultados,
+        })
+
+    @extend_schema(
+        summary="Matriz de conformidade: envios faltantes",
+        description=(
+            "Combinações professor × disciplina × etapa × mês do período ainda sem envio. As "
+            "atribuições de cada professor são as disciplinas e etapas em que ele tem envio no "
+            "`ano`; os meses vão de janeiro ao mês atual (ano corrente) ou dezembro, ou só `mes`. "
+            "Paginada como as listagens (`page`); `etapas` resume, por etapa, as combinações "
+            "esperadas e faltantes de todo o período."
+        ),
+        parameters=[
+            OpenApiParameter("ano", OpenApiTypes.INT, OpenApiParameter.QUERY, required=True),
+            OpenApiParameter("mes", OpenApiTypes.INT, OpenApiParameter.QUERY),
+            OpenApiParameter("usuario", OpenApiTypes.INT, OpenApiParameter.QUERY),
+            OpenApiParameter("disciplina", OpenApiTypes.INT, OpenApiParameter.QUERY),
+            OpenApiParameter("etapa", OpenApiTypes.INT, OpenApiParameter.QUERY),
+            OpenApiParameter("page", OpenApiTypes.INT, OpenApiParameter.QUERY),
+        ],
+        responses={
+            200: OpenApiResponse(description="Resumo por etapa e página de combinações faltantes"),
+            400: OpenApiResponse(description="Parâmetro inválido"),
+            404: OpenApiResponse(description="Página inválida"),
+        },
+        tags=["Envios de Material"],
+    )
+    @action(detail=False, methods=['get'])
+    def conformidade(self, request):
+        """
+        Combinações sem envio (anti-join no banco), paginadas, com o resumo por etapa.
+        """
+        params = request.query_params
+        try:
+            ano = int(params['ano'])
+            mes = int(params['mes']) if params.get('mes') else None
+            filtros = {nome: int(params[nome]) for nome in FILTROS if params.get(nome)}
+            pagina = int(params.get('page', 1))
+        except (KeyError, ValueError):
+            return Response({"error": "Informe `ano`; `mes`, `usuario`, `disciplina`, `etapa` e `page` são números."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if mes is not None and not 1 <= mes <= 12:
+            return Response({"error": "`mes` deve estar entre 1 e 12."}, status=status.HTTP_400_BAD_REQUEST)
+        hoje = timezone.localdate()
+        if mes:
+            meses = [mes]
+        elif ano == hoje.year:
+            # Os meses seguintes ainda não têm envio esperado
+            meses = list(range(1, hoje.month + 1))
+        else:
+            meses = list(range(1, 13)) if ano < hoje.year else []
+
+        using = self.get_queryset().db
+        etapas = resumo_por_etapa(ano, meses, filtros, using=using)
+        total = sum(etapa['faltantes'] for etapa in etapas)
+        tamanho = self.paginator.page_size
+        if pagina < 1 or (pagina - 1) * tamanho >= max(total, 1):
+            return Response({"error": "Página inválida."}, status=status.HTTP_404_NOT_FOUND)
+        resultados = faltantes(ano, meses, filtros, limite=tamanho, deslocamento=(pagina - 1) * tamanho, using=using)
+
+        url = request.build_absolute_uri()
+        anterior = None
+        if pagina > 1:
+            anterior = replace_query_param(url, 'page', pagina - 1) if pagina > 2 else remove_query_param(url, 'page')
+        return Response({
+            "ano": ano, "meses": meses, "etapas": etapas, "count": total,
+            "next": replace_query_param(url, 'page', pagina + 1) if pagina * tamanho < total else None,
+            "previous": anterior, "results": resultados,
+        })
+
+    @extend_schema(
+        summary="Gerar os envios pendentes do mês",
+        description=(
+            "Cria, com o status Pendente, o envio de `mes`/`ano` de cada professor ativo em cada "
+            "disciplina e etapa em que ele teve envio nos 12 meses anteriores. A data limite é o "
+            "dia `dia_limite` do mês (padrão: ENVIO_DIA_LIMITE). Envios que já existem não são "
+            "alterados: repetir a chamada não cria nada."
+        ),
+        request=GerarPendentesSerializer,
+        responses={
+            201: OpenApiResponse(description="Envios criados"),
+            200: OpenApiResponse(description="Nenhum envio novo: todos já existiam"),
+            400: OpenApiResponse(description="Parâmetro inválido ou status Pendente ausente"),
+        },
+        tags=["Envios de Material"],
+    )
+    @action(detail=False, methods=['post'], url_path='gerar-pendentes')
+    def gerar_pendentes(self, request):
+        """
+        Geração idempotente (INSERT ... ON CONFLICT DO NOTHING na chave natural).
+        """
+        serializer = GerarPendentesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        dados = serializer.validated_data
+        try:
+            resultado = gerar_pendentes(dados['ano'], dados['mes'], dados.get('dia_limite'),
+                                        criado_por=request.user.matricula)
+        except GeracaoError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "ano": resultado.ano, "mes": resultado.mes, "data_limite_envio": resultado.data_limite_envio,
+            "esperados": resultado.esperados, "criados": resultado.criados, "existentes": resultado.existentes,
+        }, status=status.HTTP_201_CREATED if resultado.criados else status.HTTP_200_OK)
+
+    @extend_schema(
+        summary="Gravar envios em lote pela chave natural",
+        description=(
+            "Recebe uma lista (até 1000 linhas) de envios identificados por `id_usuario`, `id_etapa`, "
+            "`id_disciplina`, `mes_referencia` e `ano_referencia`. O envio que não existe é criado; o "
+            "existente recebe apenas os campos informados, e só é regravado se algum deles mudou. "
+            "Cada linha volta com o id e o resultado: `criado`, `atualizado` ou `inalterado`. Se "
+            "alguma linha for inválida (chave repetida no lote, id inexistente), nada é gravado."
+        ),
+        request=EnvioUpsertSerializer(many=True),
+        responses={
+            200: OpenApiResponse(description="Resultado por linha, na ordem do lote, e os totais"),
+            400: OpenApiResponse(description="Linhas inválidas; `erros` traz as mensagens por índice"),
+        },
+        tags=["Envios de Material"],
+    )
+    @action(detail=False, methods=['post'], url_path='upsert')
+    def upsert(self, request):
+        """
+        Um INSERT ... ON CONFLICT DO UPDATE por lote (api/upsert.py).
+        """
+        serializer = EnvioUpsertSerializer(data=request.data, many=True, max_length=MAX_LINHAS)
+        serializer.is_valid(raise_exception=True)
+        try:
+            gravados = upsert_envios(serializer.validated_data, request.user)
+        except UpsertError as e:
+            return Response({"erros": e.erros}, status=status.HTTP_400_BAD_REQUEST)
+        resultados = [
+            {"indice": indice, "id": envio_id, "resultado": resultado}
+            for indice, (envio_id, resultado) in enumerate(gravados)
+        ]
+        totais = Counter(resultado for _, resultado in gravados)
+        return Response({
+            "resultados": resultados, "criados": totais[CRIADO],
+            "atualizados": totais[ATUALIZADO], "inalterados": totais[INALTERADO],
+        })
+
 # app/views.py
 
 class FileUploadView(APIView):
+    """
+    Recebe um arquivo e agenda o envio por e-mail. O anexo vai para o spool e a
+    mensagem para a fila (api/outbox.py); o envio é feito pelo comando send_outbox.
+    """
     permission_classes = [IsAuthenticated]
     def post(self, request, *args, **kwargs):
         serializer = FileUploadSerializer(data=request.data)
         if serializer.is_valid():
-            email = serializer.validated_data["email"]
-            file = serializer.validated_data["file"]
-
-            try:
-                mail = EmailMessage(
-                    subject="Arquivo enviado pelo sistema",
-                    body="Segue o arquivo em anexo.",
-                    from_email=None,  # usa DEFAULT_FROM_EMAIL
-                    to=[email],
-                )
-                mail.attach(file.name, file.read(), file.content_type)
-                mail.send()
-
-                return Response({"message": "Arquivo enviado com sucesso!"}, status=status.HTTP_200_OK)
-            except Exception as e:
-                return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            mensagem = enqueue_email(
+                destinatario=serializer.validated_data["email"],
+                assunto="Arquivo enviado pelo sistema",
+                corpo="Segue o arquivo em anexo.",
+                anexo=serializer.validated_data["file"],
+            )
+            return Response(
+                {"message": "Arquivo recebido! O e-mail será enviado em instantes.", "id": mensagem.id},
+                status=status.HTTP_202_ACCEPTED,
+            )
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+
+@extend_schema_view(
+    create=extend_schema(
+        summary="Iniciar upload retomável",
+        description=(
+            "Cria a sessão de upload de um arquivo de `tamanho` bytes para o envio `id_envio`. "
+            "Os blocos são enviados depois com PATCH."
+        ),
+        tags=["Uploads"],
+    ),
+    retrieve=extend_schema(
+        summary="Consultar upload",
+        description="Retorna quantos bytes já foram recebidos (`recebido`), o offset para retomar o envio.",
+        tags=["Uploads"],
+    ),
+    partial_update=extend_schema(
+        summary="Enviar bloco",
+        description=(
+            "Envia um bloco do arquivo no corpo (`Content-Type: application/octet-stream`) a partir "
+            "de `?offset=`, que deve ser igual a `recebido`; caso contrário a resposta é 409 com o "
+            "offset correto. O bloco que completa o arquivo retorna 201 com o arquivo anexado ao envio."
+        ),
+        parameters=[OpenApiParameter("offset", OpenApiTypes.INT, OpenApiParameter.QUERY, required=True)],
+        request={"application/octet-stream": OpenApiTypes.BINARY},
+        responses={
+            200: UploadSessaoSerializer,
+            201: ArquivoEnvioSerializer,
+            409: OpenApiResponse(description="Offset diferente do recebido"),
+        },
+        tags=["Uploads"],
+    ),
+    destroy=extend_schema(summary="Cancelar upload", tags=["Uploads"]),
+)
+class UploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                    mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Upload retomável de arquivos de material, em blocos (api/storage.py).
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = UploadSessaoSerializer
+    lookup_value_regex = '[0-9a-f-]{36}'
+
+    def get_queryset(self):
+        return UploadSessao.objects.filter(id_usuario=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(id_usuario=self.request.user)
+
+    def perform_destroy(self, instance):
+        cancel_upload(instance)
+
+    def partial_update(self, request, pk=None):
+        try:
+            offset = int(request.query_params['offset'])
+        except (KeyError, ValueError):
+            return Response({"error": "O parâmetro 'offset' é obrigatório."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            sessao, arquivo = append_chunk(pk, request.user, offset, request.stream)
+        except UploadSessao.DoesNotExist:
+            return Response({"error": "Upload não encontrado"}, status=status.HTTP_404_NOT_FOUND)
+        except UploadError as e:
+            recebido = UploadSessao.objects.filter(pk=pk).values_list('recebido', flat=True).first()
+            return Response({"error": str(e), "recebido": recebido}, status=e.status)
+
+        if arquivo is not None:
+            return Response(ArquivoEnvioSerializer(arquivo).data, status=status.HTTP_201_CREATED)
+        response = Response(UploadSessaoSerializer(sessao).data)
+        response["Upload-Offset"] = str(sessao.recebido)
+        return response
+
 RESUMIDO_PARAM = OpenApiParameter(
     name="resumido",
     type=OpenApiTypes.BOOL,
@@ -750,21 +1277,24 @@ RESUMIDO_PARAM = OpenApiParameter(
     ),
     required=False,
     examples=[
-        {"value": "true", "summary": "Resposta resumida"},
-        {"value": "false", "summary": "Resposta completa (padrão)"},
+        OpenApiExample("Resposta resumida", value="true"),
+        OpenApiExample("Resposta completa (padrão)", value="false"),
     ],
 )
 
-class DashboardEnvioViewSet(viewsets.ViewSet):
+class DashboardEnvioViewSet(MessagePackMixin, ReplicaRoutingMixin, viewsets.ViewSet):
     """
     Dashboard de estatísticas dos envios de material.
     """
 
     permission_classes = [IsAuthenticated]
+    replica_actions = frozenset({"dashboard_me", "dashboard_geral"})
+    # Tokens do throttle por chamada: o dashboard geral lê todos os envios
+    throttle_costs = {"dashboard_geral": 5}
 
     def get_queryset(self):
         return EnvioMaterial.objects.select_related(
-            "id_disciplina", "id_status", "id_usuario"
+            "id_etapa", "id_disciplina", "id_status", "id_usuario"
         )
 
     # ============================
@@ -820,56 +1350,8 @@ class DashboardEnvioViewSet(viewsets.ViewSet):
     def _get_dashboard_data(self, queryset, request=None):
         """
         Gera o resumo estatístico dos envios, incluindo listas detalhadas
-        (a menos que seja solicitado o modo 'resumido').
+        (a menos que seja solicitado o modo 'resumido'). As consultas
+        independentes rodam em paralelo (api/dashboard.py).
         """
-
-        # --- Totais e filtros por status ---
-        pendentes_qs = queryset.filter(id_status__descricao_status__iexact="Pendente")
-        validados_qs = queryset.filter(id_status__descricao_status__iexact="Validado")
-        rejeitados_qs = queryset.filter(id_status__descricao_status__iexact="Rejeitado")
-
-        response = {
-            "total_envios": queryset.count(),
-            "pendentes": pendentes_qs.count(),
-            "validados": validados_qs.count(),
-            "rejeitados": rejeitados_qs.count(),
-        }
-
-        # Se for modo resumido, retorna apenas os totais
-        if request and request.query_params.get("resumido", "").lower() == "true":
-            return response
-
-        # --- Agrupamento por mês ---
-        por_mes = (
-            queryset.values("mes_referencia")
-            .annotate(total=Count("id"))
-            .order_by("mes_referencia")
-        )
-        meses_dict = dict(EnvioMaterial.MONTH_CHOICES)
-        por_mes = [
-            {"mes": meses_dict.get(item["mes_referencia"], item["mes_referencia"]),
-             "total": item["total"]}
-            for item in por_mes
-        ]
-
-        # --- Agrupamento por disciplina ---
-        por_disciplina = (
-            queryset.values("id_disciplina__nome_disciplina")
-            .annotate(total=Count("id"))
-            .order_by("id_disciplina__nome_disciplina")
-        )
-        por_disciplina = [
-            {"disciplina": item["id_disciplina__nome_disciplina"], "total": item["total"]}
-            for item in por_disciplina
-        ]
-
-        # --- Retorna resumo completo ---
-        return {
-            **response,
-            "por_mes": por_mes,
-            "por_disciplina": por_disciplina,
-            "envios": EnvioMaterialSerializer(queryset, many=True).data,
-            "pendentes_list": EnvioMaterialSerializer(pendentes_qs, many=True).data,
-            "validados_list": EnvioMaterialSerializer(validados_qs, many=True).data,
-            "rejeitados_list": EnvioMaterialSerializer(rejeitados_qs, many=True).data,
-        }
+        resumido = bool(request and request.query_params.get("resumido", "").lower() == "true")
+        return dashboard_data(queryset, resumido=resumido, context={"native_dates": self.native_dates()})
@@ -0,0 +1,170 @@
+# warmup.py
+"""
+Aquecimento do processo antes de receber tráfego (comando `serve`).
+
+Boa parte do custo da primeira requisição é preparação que o Django, o DRF e o
+drf-spectacular fazem sob demanda e guardam para as seguintes: compilar as
+regex das rotas, montar os campos dos serializers, percorrer o _meta dos
+models, compilar templates, carregar o backend do JWT. `warmup()` faz tudo
+isso uma vez no processo mestre do gunicorn (com preload_app), antes do fork:
+os workers já nascem com esses caches prontos e compartilham as páginas de
+memória. Nada aqui abre conexão com o banco; `warmup_worker()` faz a parte que
+depende de conexão, já dentro de cada worker, antes do primeiro accept().
+"""
+import logging
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.urls import URLPattern, URLResolver, get_resolver
+from rest_framework import serializers
+
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES = (
+    "home.html",
+    "rest_framework/api.html",
+    "drf_spectacular/swagger_ui.html",
+    "drf_spectacular/redoc.html",
+)
+
+
+def warm_urls():
+    """
+    Popula o resolver e compila a regex de todas as rotas.
+    """
+    resolver = get_resolver()
+    resolver.reverse_dict  # noqa: B018 - popula reverse_dict, namespace_dict e app_dict
+
+    def walk(patterns):
+        total = 0
+        for pattern in patterns:
+            pattern.pattern.regex  # noqa: B018 - compilada e guardada no próprio pattern
+            if isinstance(pattern, URLResolver):
+                total += walk(pattern.url_patterns)
+            elif isinstance(pattern, URLPattern):
+                total += 1
+        return total
+
+    return walk(resolver.url_patterns)
+
+
+def warm_models():
+    """
+    Calcula os caches do _meta (árvore de relações, mapa de campos) de todos os models.
+    """
+    models = apps.get_models(include_auto_created=True)
+    for model in models:
+        opts = model._meta
+        opts._relation_tree  # noqa: B018
+        opts.fields_map  # noqa: B018
+        opts.get_fields()
+    return len(models)
+
+
+def warm_serializers():
+    """
+    Monta os campos de todos os serializers de api/serializers.py.
+    """
+    from . import serializers as api_serializers
+
+    total = 0
+    for value in vars(api_serializers).values():
+        if (isinstance(value, type) and issubclass(value, serializers.Serializer)
+                and value.__module__ == api_serializers.__name__):
+            value().fields  # noqa: B018
+            total += 1
+    return total
+
+
+def warm_schema():
+    """
+    Carrega o schema OpenAPI (do arquivo ou gerado, o que instancia todas as
+    views e serializers da API) e o renderiza nos formatos servidos.
+    """
+    from .schema import get_schema_document
+    from .view.schema import CachedSchemaView
+
+    document = get_schema_document()
+    for renderer_class in CachedSchemaView.renderer_classes:
+        document.render(renderer_class())
+    return len(document.data.get("paths", {}))
+
+
+def warm_templates():
+    total = 0
+    for name in TEMPLATES:
+        try:
+            get_template(name)
+        except TemplateDoesNotExist:
+            continue
+        total += 1
+    return total
+
+
+def warm_auth():
+    """
+    Carrega o backend do JWT e o hasher de senhas.
+    """
+    from django.contrib.auth.hashers import get_hasher
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    AccessToken(str(AccessToken()))
+    get_hasher()
+    return 1
+
+
+STEPS = (
+    ("urls", warm_urls),
+    ("models", warm_models),
+    ("serializers", warm_serializers),
+    ("schema", warm_schema),
+    ("templates", warm_templates),
+    ("auth", warm_auth),
+)
+
+
+def warmup():
+    """
+    Executa as etapas de aquecimento. Retorna [(etapa, itens, segundos)]; uma
+    etapa que falha é registrada no log e não impede as demais.
+    """
+    results = []
+    for name, step in STEPS:
+        start = time.perf_counter()
+        try:
+            total = step()
+        except Exception:
+            logger.exception("Falha no aquecimento: %s", name)
+            total = None
+        results.append((name, total, time.perf_counter() - start))
+    # Nenhuma conexão pode atravessar o fork dos workers
+    connections.close_all()
+    return results
+
+
+def warmup_worker():
+    """
+    Parte do aquecimento que depende do banco, em cada worker: verifica os bancos,
+    abre o pool (com DB_POOL=True ele já fica com DB_POOL_MIN_SIZE conexões) e
+    carrega o cache de ContentType usado pelo admin.
+    """
+    from django.contrib.contenttypes.models import ContentType
+
+    start = time.perf_counter()
+    try:
+        for alias in settings.DATABASES:
+            connections[alias].ensure_connection()
+        ContentType.objects.get_for_models(*apps.get_models())
+    except Exception:
+        # Banco indisponível: o worker sobe assim mesmo e a requisição reporta o erro
+        logger.exception("Falha no aquecimento do worker")
+    finally:
+        # As requisições rodam em outras threads, com as próprias conexões;
+        # com pool, fechar só devolve a conexão
+        connections.close_all()
+    return time.perf_counter() - start
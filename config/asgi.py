@@ -3,6 +3,12 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Sob ASGI o login (api/token/, view assíncrona) verifica a senha em um pool de
+threads e não ocupa o worker enquanto o hash é calculado. Para subir com
+gunicorn + uvicorn (workers pelos núcleos e aquecimento antes do tráfego):
+
+    python manage.py serve --interface asgi
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
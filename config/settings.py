@@ -9,7 +9,7 @@ https://docs.djangoproject.com/en/5.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
-from decouple import config # use get envs
+from decouple import config, Csv # use get envs
 from pathlib import Path
 import os
 from datetime import timedelta
@@ -65,17 +65,51 @@ SIMPLE_JWT = {
 
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',               # Primeiro: mede a requisição inteira
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.ServerTimingMiddleware',         # Desativado se não houver rotas/amostragem
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.ReplicaStickyMiddleware',         # Só com réplica: fixa o usuário no primário após escritas
+    'api.middleware.ProfilingMiddleware',             # cProfile sob demanda, só para staff
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',        # Must be at the top
 ]
 
 
+# Server-Timing: mede consultas SQL, view, serialização e render por requisição.
+# SERVER_TIMING_ROUTES aceita nomes de rota com curinga (ex: enviomaterial-*,dashboard-envios-*)
+# e SERVER_TIMING_SAMPLE_RATE é a fração de requisições amostradas (0 a 1).
+SERVER_TIMING_ROUTES = config('SERVER_TIMING_ROUTES', default='', cast=Csv())
+SERVER_TIMING_SAMPLE_RATE = config('SERVER_TIMING_SAMPLE_RATE', default=0.0, cast=float)
+
+# Métricas Prometheus em /metrics. Os valores ficam em um SQLite local compartilhado
+# pelos workers; em produção aponte METRICS_DB_PATH para um disco local (ou tmpfs).
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_DB_PATH = config('METRICS_DB_PATH', default=str(BASE_DIR / 'var' / 'metrics.sqlite3'))
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Profiling sob demanda: staff envia `X-Profile: 1` (ou `?_profile=1`) e o .prof
+# é gravado em PROFILE_DIR; `X-Profile: download` devolve o arquivo na resposta.
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=True, cast=bool)
+PROFILE_DIR = config('PROFILE_DIR', default=str(BASE_DIR / 'var' / 'profiles'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'api.cache.InstrumentedLocMemCache',  # Registra hit/miss nas métricas
+        'LOCATION': 'default',
+    },
+    # Visível para todos os workers da mesma máquina
+    'shared': {
+        'BACKEND': 'api.cache.InstrumentedFileBasedCache',
+        'LOCATION': config('SHARED_CACHE_DIR', default=str(BASE_DIR / 'var' / 'cache' / 'shared')),
+    },
+}
+
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -110,14 +144,106 @@ DATABASES = {
     }
 }
 
+# Réplica de leitura opcional: definida quando DB_REPLICA_HOST ou DB_REPLICA_NAME
+# estão no .env (os demais campos herdam do primário). Ver api/db_routers.py.
+if config('DB_REPLICA_HOST', default='') or config('DB_REPLICA_NAME', default=''):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': config('DB_REPLICA_NAME', default=DATABASES['default']['NAME']),
+        'USER': config('DB_REPLICA_USER', default=DATABASES['default']['USER']),
+        'PASSWORD': config('DB_REPLICA_PASSWORD', default=DATABASES['default']['PASSWORD']),
+        'HOST': config('DB_REPLICA_HOST', default=DATABASES['default']['HOST']),
+        'PORT': config('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
 
-EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
-EMAIL_HOST = "smtp.gmail.com"
-EMAIL_PORT = 587
-EMAIL_USE_TLS = True
+DATABASE_ROUTERS = ['api.db_routers.ReplicaRouter']
+
+# Conexões: por padrão ficam abertas entre requisições (DB_CONN_MAX_AGE segundos, com
+# health check). Com DB_POOL=True usa o pool nativo do psycopg 3; as estatísticas do
+# pool aparecem em /metrics (db_pool_*).
+DB_POOL = config('DB_POOL', default=False, cast=bool)
+for _database in DATABASES.values():
+    # Com pool, CONN_HEALTH_CHECKS verifica a conexão a cada empréstimo
+    _database['CONN_HEALTH_CHECKS'] = True
+    if DB_POOL:
+        _database['CONN_MAX_AGE'] = 0
+        _database['OPTIONS'] = {
+            'pool': {
+                'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+                'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+                'timeout': config('DB_POOL_TIMEOUT', default=10.0, cast=float),        # Espera máxima por conexão
+                'max_idle': config('DB_POOL_MAX_IDLE', default=600.0, cast=float),
+                'max_lifetime': config('DB_POOL_MAX_LIFETIME', default=3600.0, cast=float),
+            },
+        }
+    else:
+        _database['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=60, cast=int)
+
+# Threads (cada uma com a sua conexão) para as consultas paralelas dos dashboards
+# (api/dashboard.py); 0 roda as consultas em sequência na conexão da requisição.
+# Com DB_POOL=True, mantenha abaixo de DB_POOL_MAX_SIZE.
+DASHBOARD_QUERY_WORKERS = config('DASHBOARD_QUERY_WORKERS', default=4, cast=int)
+
+# Depois de uma escrita, as leituras do usuário ficam no primário por esta janela
+# (segundos). A marcação fica no cache REPLICA_STICKY_CACHE, que precisa ser
+# compartilhado entre os workers.
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=5, cast=int)
+REPLICA_STICKY_CACHE = 'shared'
+
+# Usuário autenticado (com o perfil) em cache por AUTH_USER_CACHE_SECONDS; também é
+# o prazo máximo para um usuário desativado fora do admin/ORM ser recusado.
+AUTH_USER_CACHE = 'shared'
+AUTH_USER_CACHE_SECONDS = config('AUTH_USER_CACHE_SECONDS', default=60, cast=int)
+
+# Consultas analíticas dos envios (api/analytics.py) em cache por ANALYTICS_CACHE_SECONDS;
+# salvar ou remover um envio muda a versão e descarta os resultados anteriores.
+ANALYTICS_CACHE = 'shared'
+ANALYTICS_CACHE_SECONDS = config('ANALYTICS_CACHE_SECONDS', default=300, cast=int)
+# Períodos já encerrados (meses anteriores ao atual) mudam pouco: ficam mais tempo,
+# descartados só quando muda um envio do próprio período
+ANALYTICS_CLOSED_CACHE_SECONDS = config('ANALYTICS_CLOSED_CACHE_SECONDS', default=86400, cast=int)
+
+# Dia do mês usado como data limite dos envios pendentes gerados (api/pendencias.py);
+# em meses mais curtos, o último dia
+ENVIO_DIA_LIMITE = config('ENVIO_DIA_LIMITE', default=15, cast=int)
+
+# Login (api/token/): a verificação do hash da senha roda em um pool de threads
+# limitado. Com mais de LOGIN_HASH_MAX_PENDING verificações na fila ou em execução
+# o login responde 503 com Retry-After, em vez de acumular espera.
+LOGIN_HASH_WORKERS = config('LOGIN_HASH_WORKERS', default=os.cpu_count() or 1, cast=int)
+LOGIN_HASH_MAX_PENDING = config('LOGIN_HASH_MAX_PENDING', default=LOGIN_HASH_WORKERS * 16, cast=int)
+
+
+# E-mail: para testar localmente, EMAIL_HOST=localhost EMAIL_PORT=1025 EMAIL_USE_TLS=False
+# apontando para um servidor SMTP de desenvolvimento (ex: python -m aiosmtpd -n -l localhost:1025)
+EMAIL_BACKEND = config('EMAIL_BACKEND', default="django.core.mail.backends.smtp.EmailBackend")
+EMAIL_HOST = config('EMAIL_HOST', default="smtp.gmail.com")
+EMAIL_PORT = config('EMAIL_PORT', default=587, cast=int)
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
-DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=30, cast=int)
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default=EMAIL_HOST_USER)
+
+# Fila de e-mails (api/outbox.py): os anexos ficam em EMAIL_SPOOL_DIR até o envio pelo
+# comando send_outbox. Uma mensagem que falha é tentada de novo após
+# EMAIL_OUTBOX_BACKOFF_SECONDS * 2^(tentativas - 1), até EMAIL_OUTBOX_MAX_ATTEMPTS vezes.
+# Um lote reservado por um worker volta para a fila após EMAIL_OUTBOX_LEASE_SECONDS
+# se o resultado não for gravado (worker interrompido).
+EMAIL_SPOOL_DIR = config('EMAIL_SPOOL_DIR', default=str(BASE_DIR / 'var' / 'outbox'))
+EMAIL_OUTBOX_MAX_ATTEMPTS = config('EMAIL_OUTBOX_MAX_ATTEMPTS', default=5, cast=int)
+EMAIL_OUTBOX_BACKOFF_SECONDS = config('EMAIL_OUTBOX_BACKOFF_SECONDS', default=60, cast=int)
+EMAIL_OUTBOX_LEASE_SECONDS = config('EMAIL_OUTBOX_LEASE_SECONDS', default=300, cast=int)
+
+# Arquivos dos envios de material (api/storage.py), endereçados pelo SHA-256 do conteúdo.
+# MATERIAL_MAX_FILE_SIZE limita cada arquivo, em bytes.
+MATERIAL_STORAGE_DIR = config('MATERIAL_STORAGE_DIR', default=str(BASE_DIR / 'var' / 'materiais'))
+MATERIAL_MAX_FILE_SIZE = config('MATERIAL_MAX_FILE_SIZE', default=1024 ** 3, cast=int)
+
+# Schema OpenAPI pré-gerado (api/schema.py), versionado com o código: atualize com
+# `python manage.py build_schema`. Vazio (ou arquivo ausente) gera na primeira requisição.
+OPENAPI_SCHEMA_FILE = config('OPENAPI_SCHEMA_FILE', default=str(BASE_DIR / 'openapi.json'))
 
 
 
@@ -153,6 +279,10 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# JSON das respostas e requisições com orjson (api/renderers.py), com o json da
+# biblioteca padrão quando o pacote não está instalado. False volta ao JSONRenderer do DRF.
+API_FAST_JSON = config('API_FAST_JSON', default=True, cast=bool)
+
 # Django REST Framework configuration
 REST_FRAMEWORK = {
     # Pagination
@@ -170,7 +300,7 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         # 'rest_framework.authentication.SessionAuthentication',
         # 'rest_framework.authentication.TokenAuthentication',  # Enable if using tokens
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',  # JWT com o usuário em cache
 
     ],
     
@@ -181,13 +311,13 @@ REST_FRAMEWORK = {
     
     # Renderers
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'api.renderers.FastJSONRenderer' if API_FAST_JSON else 'rest_framework.renderers.JSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
     
     # Parsers
     'DEFAULT_PARSER_CLASSES': [
-        'rest_framework.parsers.JSONParser',
+        'api.parsers.FastJSONParser' if API_FAST_JSON else 'rest_framework.parsers.JSONParser',
         'rest_framework.parsers.FormParser',
         'rest_framework.parsers.MultiPartParser',
     ],
@@ -200,8 +330,9 @@ REST_FRAMEWORK = {
     
     # Throttling (optional - for rate limiting)
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        # Balde de tokens no PostgreSQL: o mesmo limite para todos os workers
+        'api.throttling.AnonTokenBucketThrottle',
+        'api.throttling.UserTokenBucketThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/hour',
@@ -356,10 +487,67 @@ SPECTACULAR_SETTINGS = {
     },
     'POSTPROCESSING_HOOKS': [],
     'PREPROCESSING_HOOKS': [],
+
+    # api/token/ é uma view Django assíncrona (api/view/auth.py), fora da
+    # introspecção do DRF: o contrato é o mesmo do TokenObtainPairView.
+    'APPEND_PATHS': {
+        '/api/token/': {
+            'post': {
+                'operationId': 'api_token_create',
+                'description': 'Recebe matrícula e senha e devolve o par de tokens JWT (access e refresh).',
+                'tags': ['api'],
+                'requestBody': {
+                    'content': {
+                        media_type: {'schema': {'$ref': '#/components/schemas/TokenObtainPairRequest'}}
+                        for media_type in ('application/json', 'application/x-www-form-urlencoded', 'multipart/form-data')
+                    },
+                    'required': True,
+                },
+                'responses': {
+                    '200': {
+                        'content': {'application/json': {'schema': {'$ref': '#/components/schemas/TokenObtainPair'}}},
+                        'description': '',
+                    },
+                    '401': {'description': 'Credenciais inválidas ou usuário inativo.'},
+                    '429': {'description': 'Limite de tentativas do IP atingido (Retry-After).'},
+                    '503': {'description': 'Pool de verificação de senha cheio (Retry-After).'},
+                },
+                'security': [{}],
+            },
+        },
+    },
+    'APPEND_COMPONENTS': {
+        'schemas': {
+            'TokenObtainPair': {
+                'type': 'object',
+                'properties': {
+                    'access': {'type': 'string', 'readOnly': True},
+                    'refresh': {'type': 'string', 'readOnly': True},
+                },
+                'required': ['access', 'refresh'],
+            },
+            'TokenObtainPairRequest': {
+                'type': 'object',
+                'properties': {
+                    'matricula': {'type': 'string', 'writeOnly': True, 'minLength': 1},
+                    'password': {'type': 'string', 'writeOnly': True, 'minLength': 1},
+                },
+                'required': ['matricula', 'password'],
+            },
+        },
+    },
 }
 
 DEVELOPMENT = config('DEVELOPMENT', default=False, cast=bool)
 
+# Perfil de produção: sem a API navegável (HTML), só JSON. Ligada por padrão com DEVELOPMENT.
+API_BROWSABLE = config('API_BROWSABLE', default=DEVELOPMENT, cast=bool)
+if not API_BROWSABLE:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = [
+        renderer for renderer in REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES']
+        if renderer != 'rest_framework.renderers.BrowsableAPIRenderer'
+    ]
+
 if DEVELOPMENT:
     CORS_ALLOW_ALL_ORIGINS = True
 else:
@@ -415,3 +603,19 @@ TIME_ZONE = 'America/Fortaleza'  # Adjust to your timezone
 USE_I18N = True
 USE_TZ = True
 
+# Logging
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api': {
+            'handlers': ['console'],
+            'level': config('API_LOG_LEVEL', default='INFO'),
+        },
+    },
+}
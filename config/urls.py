@@ -16,17 +16,19 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
+from api.view.auth import login_view
 from api.view.home import home_view 
+from api.view.metrics import metrics_view
+from api.view.schema import CachedRedocView, CachedSchemaView, CachedSwaggerView
 
 # urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 from django.urls import path
-from rest_framework_simplejwt.views import TokenObtainPairView,TokenRefreshView
+from rest_framework_simplejwt.views import TokenRefreshView
 
 urlpatterns = [
-    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/token/', login_view, name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 ]
 
@@ -42,6 +44,7 @@ router.register(r'disciplinas', views.DisciplinaViewSet, basename='disciplina')
 router.register(r'status-envio', views.StatusEnvioViewSet, basename='statusenvio')
 router.register(r'envios-material', views.EnvioMaterialViewSet, basename='enviomaterial')
 router.register(r'dashboard-envios', views.DashboardEnvioViewSet, basename='dashboard-envios')
+router.register(r'uploads', views.UploadViewSet, basename='upload')
 
 # Define URL patterns
 urlpatterns = [
@@ -53,14 +56,15 @@ urlpatterns = [
     path('api/', include(router.urls)),
     
     # API Documentation endpoints
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
-    path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    path('api/schema/', CachedSchemaView.as_view(), name='schema'),
+    path('api/docs/', CachedSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
+    path('api/redoc/', CachedRedocView.as_view(url_name='schema'), name='redoc'),
     path("upload/", FileUploadView.as_view(), name="file-upload"),
 
-    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/token/', login_view, name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/hello/', HelloView.as_view(), name='hello'),
+    path('metrics', metrics_view, name='metrics'),
 
     
     # Browsable API authentication (optional)